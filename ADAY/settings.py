@@ -76,6 +76,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'ADAY.wsgi.application'
+# El chat en tiempo real (Server-Sent Events) necesita servirse con ASGI, p. ej. `uvicorn ADAY.asgi:application`
+ASGI_APPLICATION = 'ADAY.asgi.application'
 
 
 # Database
@@ -153,6 +155,83 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
 ####
+# --- MODELOS DE IA (carga perezosa, ver core/modelos_ia.py) ---
+MODELOS_IA = {
+    'mobilenet': 'turismo.services_ia.cargar_modelo',
+    'yolo': 'reconocimiento.services.cargar_modelo',
+    'riesgo': 'riesgo.services.cargar_modelo',
+}
+# Modelos que este proceso carga al arrancar, p. ej. MODELOS_IA_PRECARGA=mobilenet,yolo
+MODELOS_IA_PRECARGA = os.environ.get('MODELOS_IA_PRECARGA', '').split(',')
+
+# --- POOL DE INFERENCIA (ver core/inferencia.py) ---
+# Cada proceso web (gunicorn -w N, o WEB_CONCURRENCY) tiene su propio pool y su propio micro-lote:
+# con N workers hay N x INFERENCIA_WORKERS procesos con TensorFlow cargado. Bajo WSGI síncrono
+# cada worker atiende una petición a la vez, así que los micro-lotes casi nunca juntan más de una
+# foto; solo agrupan con hilos (gunicorn --threads) o ASGI.
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Procesos que ejecutan YOLO/MobileNet fuera del hilo de la petición (0 = en el propio hilo).
+# Por defecto se reparten los núcleos entre los workers web, con un máximo de 2 por worker.
+INFERENCIA_WORKERS = int(os.environ.get('INFERENCIA_WORKERS', max(1, min(2, (os.cpu_count() or 1) // WEB_WORKERS))))
+# Trabajos en espera antes de rechazar y degradar a la sugerencia por cercanía
+INFERENCIA_MAX_PENDIENTES = int(os.environ.get('INFERENCIA_MAX_PENDIENTES', 8))
+INFERENCIA_TIMEOUT = float(os.environ.get('INFERENCIA_TIMEOUT', 15))
+INFERENCIA_MODELOS = ['mobilenet', 'yolo']
+# Micro-lotes: peticiones concurrentes que se juntan en un solo forward pass
+MICROLOTE_MAX = int(os.environ.get('MICROLOTE_MAX', 8))
+MICROLOTE_ESPERA_MS = float(os.environ.get('MICROLOTE_ESPERA_MS', 10))
+# Peticiones esperando lote antes de rechazar al instante con PoolSaturado
+MICROLOTE_MAX_COLA = int(os.environ.get('MICROLOTE_MAX_COLA', 64))
+# Listas del índice IVF de embeddings que recorre cada búsqueda (más = más recall, más lento)
+EMBEDDINGS_NPROBE = int(os.environ.get('EMBEDDINGS_NPROBE', 8))
+# Cómo se combinan las imágenes de un mismo sitio: max, media o centroide
+EMBEDDINGS_AGREGACION = os.environ.get('EMBEDDINGS_AGREGACION', 'max')
+# Formato de los vectores en el índice: float32, float16 o int8 (ver turismo/cuantizacion.py)
+EMBEDDINGS_FORMATO = os.environ.get('EMBEDDINGS_FORMATO', 'int8')
+# Índice exportado con `manage.py exportar_embeddings`; los workers lo abren con mmap y comparten la memoria
+EMBEDDINGS_DIR = os.environ.get('EMBEDDINGS_DIR', str(BASE_DIR / 'datos' / 'embeddings'))
+# Caché de resultados por hash perceptual de la foto (ver core/cache_resultados.py)
+CACHE_IA_MAX_ENTRADAS = int(os.environ.get('CACHE_IA_MAX_ENTRADAS', 1024))
+CACHE_IA_MAX_KB = int(os.environ.get('CACHE_IA_MAX_KB', 8192))
+CACHE_IA_TTL = int(os.environ.get('CACHE_IA_TTL', 600))
+CACHE_IA_CELDA_GRADOS = 0.01
+# Fotos cuyo dHash difiere en como mucho estos bits reutilizan el resultado (0 = solo idénticas)
+CACHE_IA_RADIO_HAMMING = int(os.environ.get('CACHE_IA_RADIO_HAMMING', 4))
+# Cada cuántos segundos se revisa riesgo/modelos/manifest.json para cambiar de modelo en caliente (0 = nunca)
+RIESGO_RECARGA_SEGUNDOS = float(os.environ.get('RIESGO_RECARGA_SEGUNDOS', 30))
+# --- CHAT EN TIEMPO REAL (ver accounts/realtime.py) ---
+# Bus de eventos; el local solo reparte entre las conexiones del propio proceso
+CHAT_BUS = os.environ.get('CHAT_BUS', 'accounts.realtime.BusLocal')
+# Eventos pendientes por conexión antes de descartar (cliente lento)
+CHAT_COLA_MAX = 100
+# Segundos entre comentarios de latido para que los proxies no cierren la conexión
+CHAT_SSE_LATIDO = 15
+# "Escribiendo..." vive en la caché (ver accounts/presencia.py): caduca a los CHAT_ESCRIBIENDO_TTL
+# segundos y los avisos que llegan antes de CHAT_ESCRIBIENDO_AGRUPAR segundos no se vuelven a escribir
+CHAT_CACHE = 'default'
+CHAT_ESCRIBIENDO_TTL = 4
+CHAT_ESCRIBIENDO_AGRUPAR = 2
+
+# Caché en memoria del proceso; con REDIS_URL se comparte entre workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'aday',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Índices y cachés en memoria de cada worker: la versión compartida vive en INDICES_CACHE
+# (ver core/versiones.py) y cada copia se reconstruye como mucho a los INDICES_TTL segundos.
+# Sin REDIS_URL esa caché es LocMemCache, propia de cada proceso: con varios workers
+# (gunicorn -w N) un cambio solo llega a los demás al caducar su copia, tras INDICES_TTL segundos.
+INDICES_CACHE = 'default'
+INDICES_TTL = int(os.environ.get('INDICES_TTL', 300))
+####
 LOGIN_URL = "core:login"
 LOGIN_REDIRECT_URL = "core:home"
 LOGOUT_REDIRECT_URL = "core:login"
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ADAY.settings')
 
 application = get_wsgi_application()
+
+# Precarga opcional de modelos de IA (MODELOS_IA_PRECARGA); el resto se carga en su primer uso
+from core.modelos_ia import precargar_desde_settings
+
+precargar_desde_settings()
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_message_image_alter_message_text_typingstatus'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='accounts_msg_conv_id_idx'),
+        ),
+    ]
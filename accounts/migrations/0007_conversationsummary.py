@@ -0,0 +1,74 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rellenar_resumenes(apps, schema_editor):
+    """Crea el resumen de cada participante de las conversaciones existentes."""
+    Conversation = apps.get_model('accounts', 'Conversation')
+    Message = apps.get_model('accounts', 'Message')
+    ConversationSummary = apps.get_model('accounts', 'ConversationSummary')
+
+    creadas = dict(Conversation.objects.values_list('id', 'created_at'))
+    participantes = {}
+    for conversation_id, user_id in Conversation.participants.through.objects.values_list('conversation_id', 'user_id'):
+        participantes.setdefault(conversation_id, []).append(user_id)
+
+    # Último mensaje de cada conversación (el de mayor id)
+    ultimos = {}
+    for conversation_id, text, image, timestamp in Message.objects.order_by('conversation_id', '-id')\
+            .values_list('conversation_id', 'text', 'image', 'timestamp'):
+        ultimos.setdefault(conversation_id, (text, image, timestamp))
+
+    # No leídos por (conversación, remitente)
+    no_leidos = {}
+    for conversation_id, sender_id, total in Message.objects.filter(is_read=False).order_by()\
+            .values('conversation_id', 'sender_id').annotate(total=models.Count('id'))\
+            .values_list('conversation_id', 'sender_id', 'total'):
+        no_leidos[(conversation_id, sender_id)] = total
+
+    resumenes = []
+    for conversation_id, usuarios in participantes.items():
+        text, image, timestamp = ultimos.get(conversation_id, ("", None, None))
+        for user_id in usuarios:
+            otros = [u for u in usuarios if u != user_id]
+            resumenes.append(ConversationSummary(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                other_user_id=otros[0] if len(otros) == 1 else None,
+                last_message_preview=text[:100] if text else ('[Imagen]' if image else ""),
+                last_message_at=timestamp or creadas[conversation_id],
+                unread_count=sum(no_leidos.get((conversation_id, otro), 0) for otro in otros),
+            ))
+    ConversationSummary.objects.bulk_create(resumenes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_message_conv_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=100)),
+                ('last_message_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='accounts.conversation')),
+                ('other_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at'], name='accounts_summary_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'user'), name='accounts_summary_conv_user_uniq')],
+            },
+        ),
+        migrations.RunPython(rellenar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rellenar_clave_par(apps, schema_editor):
+    """
+    Rellena user_low/user_high de los chats de dos participantes. Si la búsqueda anterior
+    (sin restricción única) dejó varios chats para el mismo par, sus mensajes se pasan al
+    más antiguo y los duplicados se eliminan.
+    """
+    Conversation = apps.get_model('accounts', 'Conversation')
+    Message = apps.get_model('accounts', 'Message')
+    ConversationSummary = apps.get_model('accounts', 'ConversationSummary')
+
+    participantes = {}
+    for conversation_id, user_id in Conversation.participants.through.objects.values_list('conversation_id', 'user_id'):
+        participantes.setdefault(conversation_id, set()).add(user_id)
+
+    por_par = {}
+    for conversation_id in sorted(participantes):
+        usuarios = participantes[conversation_id]
+        if len(usuarios) == 2:
+            por_par.setdefault(tuple(sorted(usuarios)), []).append(conversation_id)
+
+    for (low, high), ids in por_par.items():
+        conservada, duplicadas = ids[0], ids[1:]
+        if duplicadas:
+            Message.objects.filter(conversation_id__in=duplicadas).update(conversation_id=conservada)
+            Conversation.objects.filter(id__in=duplicadas).delete()
+            actualizar_resumenes(Message, ConversationSummary, conservada)
+        Conversation.objects.filter(id=conservada).update(user_low_id=low, user_high_id=high)
+
+
+def actualizar_resumenes(Message, ConversationSummary, conversation_id):
+    """Recalcula los resúmenes de la conversación que recibió los mensajes de sus duplicadas."""
+    ultimo = Message.objects.filter(conversation_id=conversation_id).order_by('-id').first()
+    for resumen in ConversationSummary.objects.filter(conversation_id=conversation_id):
+        if ultimo:
+            resumen.last_message_preview = ultimo.text[:100] if ultimo.text else ('[Imagen]' if ultimo.image else "")
+            resumen.last_message_at = ultimo.timestamp
+        resumen.unread_count = Message.objects.filter(conversation_id=conversation_id, is_read=False)\
+            .exclude(sender_id=resumen.user_id).count()
+        resumen.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_conversationsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(rellenar_clave_par, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separada de 0008: en PostgreSQL no se puede alterar la tabla en la misma transacción
+    # que actualizó sus claves foráneas ("pending trigger events")
+
+    dependencies = [
+        ('accounts', '0008_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='accounts_conversation_pair_uniq'),
+        ),
+    ]
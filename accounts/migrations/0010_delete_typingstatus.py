@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # El indicador de "escribiendo..." pasa a la caché (accounts/presencia.py)
+
+    dependencies = [
+        ('accounts', '0009_conversation_pair_uniq'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='TypingStatus',
+        ),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
-from django.db.models import Q
-from django.db.models.signals import post_save
+from django.db.models import Case, F, Q, When
+from django.db.models.signals import post_save, m2m_changed
 from django.dispatch import receiver
+from django.utils import timezone
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -48,6 +49,43 @@ class Conversation(models.Model):
     """Representa un chat entre dos o más usuarios."""
     participants = models.ManyToManyField(User, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Clave canónica de los chats 1 a 1: el id menor y el mayor de los dos usuarios.
+    # En conversaciones de grupo quedan vacías (los NULL no chocan con la restricción única).
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='accounts_conversation_pair_uniq'),
+        ]
+
+    @staticmethod
+    def pair_key(user1, user2):
+        ids = sorted([getattr(user1, 'pk', user1), getattr(user2, 'pk', user2)])
+        return {'user_low_id': ids[0], 'user_high_id': ids[1]}
+
+    @classmethod
+    def get_direct(cls, user1, user2):
+        """Chat 1 a 1 entre los dos usuarios (o None) con una sola consulta por la clave única."""
+        return cls.objects.filter(**cls.pair_key(user1, user2)).first()
+
+    @classmethod
+    def get_or_create_direct(cls, user1, user2):
+        """
+        Como get_or_create, pero sin carreras: si dos peticiones crean el mismo chat a la vez,
+        la restricción única hace fallar a una y esa recupera el que creó la otra.
+        """
+        clave = cls.pair_key(user1, user2)
+        conversation = cls.objects.filter(**clave).first()
+        if conversation:
+            return conversation, False
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(**clave)
+                conversation.participants.add(clave['user_low_id'], clave['user_high_id'])
+            return conversation, True
+        except IntegrityError:
+            return cls.objects.get(**clave), False
 
     def __str__(self):
         return f"Conversación entre {', '.join([user.username for user in self.participants.all()])}"
@@ -63,9 +101,92 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Sincronización por cursor e historial: WHERE conversation_id = X AND id > / < Y ORDER BY id
+            models.Index(fields=['conversation', 'id'], name='accounts_msg_conv_id_idx'),
+        ]
+
+class ConversationSummary(models.Model):
+    """
+    Resumen de una conversación para cada participante: lo que muestra la bandeja de
+    entrada sin recorrer los mensajes. Se mantiene al crear mensajes y al marcarlos leídos.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='summaries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_summaries')
+    # El otro participante en los chats 1 a 1 (None en conversaciones de grupo)
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    last_message_preview = models.CharField(max_length=100, blank=True, default="")
+    # Fecha del último mensaje; mientras no haya ninguno, la de creación de la conversación
+    last_message_at = models.DateTimeField(default=timezone.now)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='accounts_summary_conv_user_uniq'),
+        ]
+        indexes = [
+            # Bandeja de entrada: WHERE user_id = X ORDER BY last_message_at DESC
+            models.Index(fields=['user', '-last_message_at'], name='accounts_summary_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"Resumen de {self.conversation_id} para {self.user_id}"
+
+
+def vista_previa(text, image):
+    if text:
+        return text[:100]
+    return '[Imagen]' if image else ""
+
+
+# Cada participante nuevo recibe su fila de resumen
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def crear_resumenes(sender, instance, action, reverse, **kwargs):
+    if action != 'post_add' or reverse:
+        return
+    participantes = list(instance.participants.values_list('id', flat=True))
+    resumenes = []
+    for user_id in participantes:
+        otros = [p for p in participantes if p != user_id]
+        resumenes.append(ConversationSummary(
+            conversation=instance,
+            user_id=user_id,
+            other_user_id=otros[0] if len(otros) == 1 else None,
+            last_message_at=instance.created_at,
+        ))
+    ConversationSummary.objects.bulk_create(
+        resumenes,
+        update_conflicts=True,
+        unique_fields=['conversation', 'user'],
+        update_fields=['other_user'],
+    )
+
+
+@receiver(post_save, sender=Message)
+def mensaje_creado(sender, instance, created, **kwargs):
+    if not created:
+        return
+    from .presencia import dejar_de_escribir
+    from .realtime import publicar_mensaje
+
+    # Un solo UPDATE para todos los resúmenes: último mensaje y +1 no leído para los demás
+    ConversationSummary.objects.filter(conversation_id=instance.conversation_id).update(
+        last_message_preview=vista_previa(instance.text, instance.image),
+        last_message_at=instance.timestamp,
+        unread_count=Case(
+            When(user_id=instance.sender_id, then=F('unread_count')),
+            default=F('unread_count') + 1,
+        ),
+    )
+
+    # Quien envía ya no está escribiendo
+    dejar_de_escribir(instance.conversation_id, instance.sender_id)
 
-class TypingStatus(models.Model):
-    """Rastrea cuándo fue la última vez que un usuario escribió en un chat."""
-    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    # Avisamos por el canal en tiempo real cuando el mensaje ya está confirmado en la BD
+    conversation = instance.conversation
+    if conversation.user_low_id:
+        # Chat 1 a 1: los participantes ya están en la clave canónica
+        participantes = list({conversation.user_low_id, conversation.user_high_id})
+    else:
+        participantes = list(conversation.participants.values_list('id', flat=True))
+    transaction.on_commit(lambda: publicar_mensaje(instance, participantes))
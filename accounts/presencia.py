@@ -0,0 +1,88 @@
+"""
+Indicador de "escribiendo..." guardado en la caché de Django con caducidad, sin tocar la BD.
+
+Es un estado efímero de unos segundos: cada aviso deja una clave con TTL que desaparece
+sola. La caché por defecto (LocMemCache) vive en el proceso; con varios workers se
+configura una compartida (p. ej. Redis) en CACHES y se indica su alias en CHAT_CACHE.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _ttl():
+    return getattr(settings, "CHAT_ESCRIBIENDO_TTL", 4)
+
+
+def _cache():
+    return caches[getattr(settings, "CHAT_CACHE", "default")]
+
+
+def _clave(conversation_id, user_id):
+    return f"chat:escribiendo:{conversation_id}:{user_id}"
+
+
+class Coalescedor:
+    """
+    Recuerda cuándo se escribió por última vez cada clave en este proceso para no repetir
+    escrituras (ni eventos) mientras la anterior sigue vigente de sobra.
+    """
+
+    # Por encima de este tamaño se limpian las entradas viejas
+    MAX_ENTRADAS = 10000
+
+    def __init__(self):
+        self._ultimas = {}
+        self._lock = threading.Lock()
+
+    def debe_escribir(self, clave, intervalo):
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultimas.get(clave, float("-inf")) < intervalo:
+                return False
+            self._ultimas[clave] = ahora
+            if len(self._ultimas) > self.MAX_ENTRADAS:
+                limite = ahora - _ttl()
+                self._ultimas = {k: t for k, t in self._ultimas.items() if t >= limite}
+            return True
+
+    def olvidar(self, clave):
+        with self._lock:
+            self._ultimas.pop(clave, None)
+
+
+_coalescedor = Coalescedor()
+
+
+def marcar_escribiendo(conversation_id, user_id):
+    """
+    Registra que el usuario está escribiendo. Devuelve False si el aviso se agrupó con uno
+    reciente (la clave sigue viva y el otro usuario ya recibió el evento).
+    """
+    clave = _clave(conversation_id, user_id)
+    if not _coalescedor.debe_escribir(clave, getattr(settings, "CHAT_ESCRIBIENDO_AGRUPAR", 2)):
+        return False
+    _cache().set(clave, True, timeout=_ttl())
+    return True
+
+
+def dejar_de_escribir(conversation_id, user_id):
+    """Al enviar el mensaje el indicador se apaga sin esperar a que caduque."""
+    clave = _clave(conversation_id, user_id)
+    _coalescedor.olvidar(clave)
+    _cache().delete(clave)
+
+
+def esta_escribiendo(conversation_id, user_id):
+    return bool(_cache().get(_clave(conversation_id, user_id)))
+
+
+def escribiendo_en(pares):
+    """Recibe pares (conversation_id, user_id) y devuelve el conjunto de los que están escribiendo."""
+    pares = list(pares)
+    if not pares:
+        return set()
+    vigentes = _cache().get_many([_clave(c, u) for c, u in pares])
+    return {(c, u) for c, u in pares if vigentes.get(_clave(c, u))}
@@ -0,0 +1,156 @@
+"""
+Canal en tiempo real del chat: mensajes nuevos, confirmaciones de lectura y "escribiendo...".
+
+Las vistas (síncronas) publican eventos para uno o varios usuarios y la vista SSE
+`eventos_chat` (asíncrona, servida por ADAY/asgi.py) los reenvía a cada pestaña abierta.
+Así el servidor solo trabaja cuando pasa algo, en vez de reconstruir el historial en
+cada sondeo.
+
+El bus por defecto vive en el proceso: con varios workers ASGI cada uno solo ve lo que se
+publica en él. Para repartir eventos entre procesos basta con otra clase con la misma
+interfaz (publicar/suscribir) en CHAT_BUS.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento
+MENSAJE = "mensaje"
+LEIDO = "leido"
+ESCRIBIENDO = "escribiendo"
+
+
+class Suscripcion:
+    """Cola de eventos de una conexión abierta; se alimenta desde cualquier hilo."""
+
+    def __init__(self, usuario_id, max_eventos):
+        self.usuario_id = usuario_id
+        self._loop = asyncio.get_running_loop()
+        self._cola = asyncio.Queue(maxsize=max_eventos)
+        self.perdidos = 0
+
+    def _encolar(self, evento):
+        try:
+            self._cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente lento: descartamos en vez de acumular memoria; al reconectar se resincroniza
+            self.perdidos += 1
+
+    def entregar(self, evento):
+        self._loop.call_soon_threadsafe(self._encolar, evento)
+
+    async def siguiente(self, timeout):
+        """Siguiente evento o None si pasan `timeout` segundos sin ninguno."""
+        try:
+            return await asyncio.wait_for(self._cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BusLocal:
+    """Pub/sub en memoria del proceso, indexado por usuario destinatario."""
+
+    def __init__(self):
+        self._suscripciones = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def suscribir(self, usuario_id):
+        """Se llama desde el event loop de la conexión SSE."""
+        suscripcion = Suscripcion(usuario_id, getattr(settings, "CHAT_COLA_MAX", 100))
+        with self._lock:
+            self._suscripciones.setdefault(usuario_id, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            abiertas = self._suscripciones.get(suscripcion.usuario_id, set())
+            abiertas.discard(suscripcion)
+            if not abiertas:
+                self._suscripciones.pop(suscripcion.usuario_id, None)
+
+    def publicar(self, usuario_id, tipo, datos):
+        """Entrega el evento a todas las conexiones del usuario. No bloquea ni toca la BD."""
+        with self._lock:
+            destinos = list(self._suscripciones.get(usuario_id, ()))
+        if not destinos:
+            return
+        evento = {"id": next(self._ids), "tipo": tipo, "datos": datos}
+        for suscripcion in destinos:
+            suscripcion.entregar(evento)
+
+    def conexiones(self):
+        with self._lock:
+            return sum(len(s) for s in self._suscripciones.values())
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def obtener_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = import_string(getattr(settings, "CHAT_BUS", "accounts.realtime.BusLocal"))()
+    return _bus
+
+
+def publicar(usuario_id, tipo, datos):
+    try:
+        obtener_bus().publicar(usuario_id, tipo, datos)
+    except Exception as e:
+        # El tiempo real es un extra: un fallo aquí no debe tumbar el envío del mensaje
+        logger.error(f"No se pudo publicar el evento '{tipo}' para el usuario {usuario_id}: {e}")
+
+
+def datos_mensaje(mensaje, usuario_id, otro_id):
+    """Mensaje tal como lo ve `usuario_id`; `otro_id` es el usuario con el que conversa."""
+    return {
+        "conversacion": mensaje.conversation_id,
+        "con": otro_id,
+        "id": mensaje.id,
+        "from": "me" if mensaje.sender_id == usuario_id else "other",
+        "text": mensaje.text,
+        "image": mensaje.image.url if mensaje.image else None,
+        "time": mensaje.timestamp.strftime("%H:%M"),
+    }
+
+
+def publicar_mensaje(mensaje, participantes):
+    """Avisa del mensaje nuevo a cada participante, incluido el remitente (sus otras pestañas)."""
+    for usuario_id in participantes:
+        if usuario_id == mensaje.sender_id:
+            otro_id = next((p for p in participantes if p != usuario_id), usuario_id)
+        else:
+            otro_id = mensaje.sender_id
+        publicar(usuario_id, MENSAJE, datos_mensaje(mensaje, usuario_id, otro_id))
+
+
+def formato_sse(evento):
+    datos = json.dumps(evento["datos"], ensure_ascii=False)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+async def flujo_eventos(usuario_id):
+    """Generador asíncrono con el cuerpo de la respuesta text/event-stream."""
+    bus = obtener_bus()
+    suscripcion = bus.suscribir(usuario_id)
+    latido = getattr(settings, "CHAT_SSE_LATIDO", 15)
+    try:
+        # Reintento del navegador si se corta la conexión (milisegundos)
+        yield "retry: 3000\n\n"
+        while True:
+            evento = await suscripcion.siguiente(latido)
+            # Comentario SSE: mantiene viva la conexión a través de proxies
+            yield formato_sse(evento) if evento else ": latido\n\n"
+    finally:
+        bus.cancelar(suscripcion)
@@ -1,3 +1,405 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import presencia, realtime, views
+from .models import Conversation, ConversationSummary, Message
+
+
+class MigracionTestCase(TransactionTestCase):
+    """Lleva accounts a `migrar_desde`, deja que el test cree datos y migra hasta `migrar_a`."""
+
+    migrar_desde = None
+    migrar_a = None
+
+    def setUp(self):
+        self.apps = self.migrar_hasta(self.migrar_desde)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrar_hasta(self, migracion):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("accounts", migracion)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([("accounts", migracion)]).apps
+
+    def crear_usuarios(self, *nombres):
+        User = self.apps.get_model("auth", "User")
+        return [User.objects.create(username=nombre) for nombre in nombres]
+
+    def crear_conversacion(self, *usuarios):
+        Conversation = self.apps.get_model("accounts", "Conversation")
+        conversation = Conversation.objects.create()
+        conversation.participants.add(*[u.pk for u in usuarios])
+        return conversation
+
+
+class RellenarResumenesTests(MigracionTestCase):
+    migrar_desde = "0006_message_conv_id_index"
+    migrar_a = "0007_conversationsummary"
+
+    def test_crea_un_resumen_por_participante(self):
+        Message = self.apps.get_model("accounts", "Message")
+        ana, beto, carla = self.crear_usuarios("ana", "beto", "carla")
+        chat = self.crear_conversacion(ana, beto)
+        Message.objects.create(conversation=chat, sender=ana, text="hola", is_read=True)
+        Message.objects.create(conversation=chat, sender=beto, text="¿qué tal?")
+        ultimo = Message.objects.create(conversation=chat, sender=beto, text="x" * 150)
+        vacio = self.crear_conversacion(ana, carla)
+
+        apps = self.migrar_hasta(self.migrar_a)
+
+        resumenes = {
+            (r.conversation_id, r.user_id): r
+            for r in apps.get_model("accounts", "ConversationSummary").objects.all()
+        }
+        self.assertEqual(set(resumenes), {(chat.pk, ana.pk), (chat.pk, beto.pk), (vacio.pk, ana.pk), (vacio.pk, carla.pk)})
+
+        de_ana = resumenes[(chat.pk, ana.pk)]
+        self.assertEqual(de_ana.other_user_id, beto.pk)
+        self.assertEqual(de_ana.unread_count, 2)
+        self.assertEqual(de_ana.last_message_preview, "x" * 100)
+        self.assertEqual(de_ana.last_message_at, ultimo.timestamp)
+        self.assertEqual(resumenes[(chat.pk, beto.pk)].unread_count, 0)
+        # Sin mensajes: se ordena por la fecha de creación del chat
+        self.assertEqual(resumenes[(vacio.pk, carla.pk)].last_message_at, vacio.created_at)
+
+
+class RellenarClaveParTests(MigracionTestCase):
+    migrar_desde = "0007_conversationsummary"
+    migrar_a = "0009_conversation_pair_uniq"
+
+    def test_fusiona_chats_duplicados_del_mismo_par(self):
+        Message = self.apps.get_model("accounts", "Message")
+        ConversationSummary = self.apps.get_model("accounts", "ConversationSummary")
+        ana, beto, carla = self.crear_usuarios("ana", "beto", "carla")
+        # La búsqueda anterior podía crear dos chats para el mismo par
+        original = self.crear_conversacion(beto, ana)
+        duplicado = self.crear_conversacion(ana, beto)
+        grupo = self.crear_conversacion(ana, beto, carla)
+        Message.objects.create(conversation=original, sender=ana, text="primero", is_read=True)
+        Message.objects.create(conversation=duplicado, sender=ana, text="segundo")
+        Message.objects.create(conversation=duplicado, sender=ana, text="tercero")
+        for chat in (original, duplicado):
+            for usuario, otro in ((ana, beto), (beto, ana)):
+                ConversationSummary.objects.create(conversation=chat, user=usuario, other_user=otro)
+
+        apps = self.migrar_hasta(self.migrar_a)
+
+        Conversation = apps.get_model("accounts", "Conversation")
+        Message = apps.get_model("accounts", "Message")
+        self.assertFalse(Conversation.objects.filter(pk=duplicado.pk).exists())
+        conservada = Conversation.objects.get(pk=original.pk)
+        self.assertEqual((conservada.user_low_id, conservada.user_high_id), (ana.pk, beto.pk))
+        self.assertEqual(
+            list(Message.objects.filter(conversation_id=conservada.pk).order_by("id").values_list("text", flat=True)),
+            ["primero", "segundo", "tercero"],
+        )
+
+        resumen = apps.get_model("accounts", "ConversationSummary").objects.get(conversation_id=conservada.pk, user_id=beto.pk)
+        self.assertEqual(resumen.unread_count, 2)
+        self.assertEqual(resumen.last_message_preview, "tercero")
+
+        # Los grupos no tienen clave de par
+        grupo = Conversation.objects.get(pk=grupo.pk)
+        self.assertIsNone(grupo.user_low_id)
+        self.assertIsNone(grupo.user_high_id)
+
+
+class ConversacionDirectaTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user("ana")
+        self.beto = User.objects.create_user("beto")
+
+    def test_un_solo_chat_por_par_sin_importar_el_orden(self):
+        chat, creada = Conversation.get_or_create_direct(self.ana, self.beto)
+        self.assertTrue(creada)
+        self.assertEqual(set(chat.participants.values_list("pk", flat=True)), {self.ana.pk, self.beto.pk})
+
+        otra, creada = Conversation.get_or_create_direct(self.beto, self.ana)
+        self.assertFalse(creada)
+        self.assertEqual(otra.pk, chat.pk)
+        self.assertEqual(Conversation.get_direct(self.beto.pk, self.ana.pk).pk, chat.pk)
+
+    def test_get_direct_sin_chat(self):
+        self.assertIsNone(Conversation.get_direct(self.ana, self.beto))
+
+
+class EventosChatTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user("ana")
+        self.beto = User.objects.create_user("beto")
+        # Bus nuevo por test: el global guarda las suscripciones del proceso
+        self.bus = realtime.BusLocal()
+        parche = mock.patch.object(realtime, "_bus", self.bus)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_sin_sesion_devuelve_401(self):
+        self.assertEqual(self.client.get(reverse("accounts:chat_events")).status_code, 401)
+
+    def test_con_wsgi_devuelve_204_para_que_el_navegador_no_reintente(self):
+        self.client.force_login(self.ana)
+        self.assertEqual(self.client.get(reverse("accounts:chat_events")).status_code, 204)
+
+    async def test_el_flujo_reenvia_los_eventos_publicados(self):
+        flujo = realtime.flujo_eventos(self.beto.id)
+        self.assertEqual(await anext(flujo), "retry: 3000\n\n")
+        self.assertEqual(self.bus.conexiones(), 1)
+
+        realtime.publicar(self.beto.id, realtime.LEIDO, {"conversacion": 1, "con": self.ana.id, "hasta": 7})
+        # Los eventos de otros usuarios no llegan a esta conexión
+        realtime.publicar(self.ana.id, realtime.LEIDO, {"conversacion": 1, "con": self.beto.id, "hasta": 8})
+        evento = await anext(flujo)
+        self.assertIn("event: leido\n", evento)
+        self.assertIn('"hasta": 7', evento)
+
+        await flujo.aclose()
+        self.assertEqual(self.bus.conexiones(), 0)
+
+    async def test_latido_sin_eventos(self):
+        flujo = realtime.flujo_eventos(self.beto.id)
+        with self.settings(CHAT_SSE_LATIDO=0.01):
+            await anext(flujo)
+            self.assertEqual(await anext(flujo), ": latido\n\n")
+        await flujo.aclose()
+
+    def test_mensaje_nuevo_se_publica_a_ambos_tras_el_commit(self):
+        chat, _ = Conversation.get_or_create_direct(self.ana, self.beto)
+        with mock.patch.object(realtime, "publicar") as publicar, \
+                self.captureOnCommitCallbacks(execute=True):
+            mensaje = Message.objects.create(conversation=chat, sender=self.ana, text="hola")
+            publicar.assert_not_called()
+
+        vistos = {usuario: datos for usuario, tipo, datos in (c.args for c in publicar.call_args_list)}
+        self.assertEqual(set(vistos), {self.ana.id, self.beto.id})
+        self.assertEqual((vistos[self.ana.id]["from"], vistos[self.ana.id]["con"]), ("me", self.beto.id))
+        self.assertEqual((vistos[self.beto.id]["from"], vistos[self.beto.id]["con"]), ("other", self.ana.id))
+        self.assertEqual(vistos[self.beto.id]["id"], mensaje.id)
+
+
+class SincronizacionChatTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user("ana")
+        self.beto = User.objects.create_user("beto")
+        self.chat, _ = Conversation.get_or_create_direct(self.ana, self.beto)
+        self.ids = [
+            Message.objects.create(conversation=self.chat, sender=remitente, text=str(i)).id
+            for i, remitente in enumerate([self.ana, self.beto, self.ana, self.beto, self.ana])
+        ]
+        self.client.force_login(self.ana)
+
+    def sync(self, **parametros):
+        url = reverse("accounts:conversation_sync", args=[self.beto.id])
+        return self.client.get(url, parametros).json()
+
+    def historial(self, **parametros):
+        url = reverse("accounts:conversation_history", args=[self.beto.id])
+        return self.client.get(url, parametros).json()
+
+    def test_sync_devuelve_solo_lo_posterior_al_cursor(self):
+        datos = self.sync(desde=self.ids[1])
+        self.assertEqual([m["id"] for m in datos["mensajes"]], self.ids[2:])
+        self.assertEqual([m["from"] for m in datos["mensajes"]], ["me", "other", "me"])
+        self.assertEqual(datos["cursor"], self.ids[-1])
+        self.assertFalse(datos["hay_mas"])
+
+        # Al día: sin mensajes y el cursor no se mueve
+        datos = self.sync(desde=datos["cursor"])
+        self.assertEqual((datos["mensajes"], datos["cursor"]), ([], self.ids[-1]))
+
+    def test_sync_por_tramos_y_confirmacion_de_lectura(self):
+        Message.objects.filter(id__in=self.ids[:3], sender=self.ana).update(is_read=True)
+        with mock.patch.object(views, "LIMITE_SYNC", 2):
+            datos = self.sync(desde=0)
+            self.assertEqual([m["id"] for m in datos["mensajes"]], self.ids[:2])
+            self.assertTrue(datos["hay_mas"])
+            datos = self.sync(desde=datos["cursor"])
+        self.assertEqual([m["id"] for m in datos["mensajes"]], self.ids[2:4])
+        self.assertEqual(datos["leido_hasta"], self.ids[2])
+
+    def test_sync_sin_conversacion_conserva_el_cursor(self):
+        carla = User.objects.create_user("carla")
+        datos = self.client.get(reverse("accounts:conversation_sync", args=[carla.id]), {"desde": 9}).json()
+        self.assertEqual((datos["mensajes"], datos["cursor"], datos["leido_hasta"]), ([], 9, None))
+
+    def test_historial_pagina_hacia_atras_en_orden_cronologico(self):
+        datos = self.historial(antes=self.ids[4], limite=2)
+        self.assertEqual([m["id"] for m in datos["mensajes"]], self.ids[2:4])
+        self.assertTrue(datos["hay_mas"])
+
+        datos = self.historial(antes=self.ids[2], limite=2)
+        self.assertEqual([m["id"] for m in datos["mensajes"]], self.ids[:2])
+        self.assertFalse(datos["hay_mas"])
+
+    def test_historial_sin_cursor_devuelve_los_ultimos(self):
+        datos = self.historial(limite=3)
+        self.assertEqual([m["id"] for m in datos["mensajes"]], self.ids[2:])
+        # Un límite fuera de rango se acota
+        self.assertEqual(len(self.historial(limite=0)["mensajes"]), 1)
+
+
+class BandejaEntradaTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user("ana")
+        self.beto = User.objects.create_user("beto")
+        self.chat, _ = Conversation.get_or_create_direct(self.ana, self.beto)
+        self.client.force_login(self.ana)
+
+    def bandeja(self, **parametros):
+        return self.client.get(reverse("accounts:messages_list"), parametros,
+                               headers={"x-requested-with": "XMLHttpRequest"}).json()
+
+    def resumen(self, usuario):
+        return ConversationSummary.objects.get(conversation=self.chat, user=usuario)
+
+    def test_mensajes_recibidos_suman_no_leidos(self):
+        Message.objects.create(conversation=self.chat, sender=self.beto, text="hola")
+        Message.objects.create(conversation=self.chat, sender=self.beto, text="¿vienes?")
+        self.assertEqual(self.resumen(self.ana).unread_count, 2)
+        self.assertEqual(self.resumen(self.beto).unread_count, 0)
+
+        chat, = self.bandeja()
+        self.assertEqual((chat["id"], chat["unread"], chat["last_msg"]), (self.beto.id, 2, "¿vienes?"))
+
+    def test_abrir_el_chat_marca_leidos_y_avisa_al_remitente(self):
+        Message.objects.create(conversation=self.chat, sender=self.ana, text="propio")
+        ultimo = Message.objects.create(conversation=self.chat, sender=self.beto, text="hola")
+
+        with mock.patch.object(realtime, "publicar") as publicar:
+            respuesta = self.client.get(reverse("accounts:conversation_detail", args=[self.beto.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        publicar.assert_called_once_with(self.beto.id, realtime.LEIDO, {
+            "conversacion": self.chat.id, "con": self.ana.id, "hasta": ultimo.id,
+        })
+        self.assertEqual(self.resumen(self.ana).unread_count, 0)
+        self.assertTrue(Message.objects.get(pk=ultimo.pk).is_read)
+        # Los mensajes propios los marca el otro al leerlos
+        self.assertFalse(Message.objects.get(text="propio").is_read)
+
+        # Sin pendientes no se vuelve a avisar
+        with mock.patch.object(realtime, "publicar") as publicar:
+            self.client.post(reverse("accounts:conversation_detail", args=[self.beto.id]),
+                             {"action": "read"}, content_type="application/json",
+                             headers={"x-requested-with": "XMLHttpRequest"})
+        publicar.assert_not_called()
+
+    def test_paginacion_de_la_mas_reciente_a_la_mas_antigua(self):
+        otros = [User.objects.create_user(nombre) for nombre in ("carla", "dario")]
+        for usuario in otros:
+            Conversation.get_or_create_direct(self.ana, usuario)
+        # El chat con beto pasa a ser el más reciente
+        Message.objects.create(conversation=self.chat, sender=self.beto, text="hola")
+
+        with mock.patch.object(views, "CONVERSACIONES_POR_PAGINA", 2):
+            paginas = [[c["name"] for c in self.bandeja(pagina=n)] for n in (1, 2, 3)]
+            self.assertEqual(self.bandeja(pagina="x"), self.bandeja(pagina=1))
+        self.assertEqual(paginas, [["beto", "dario"], ["carla"], []])
+
+    def test_consultas_no_dependen_del_numero_de_chats(self):
+        self.bandeja()
+        with CaptureQueriesContext(connection) as con_uno:
+            self.bandeja()
+        for nombre in ("carla", "dario", "elena"):
+            chat, _ = Conversation.get_or_create_direct(self.ana, User.objects.create_user(nombre))
+            Message.objects.create(conversation=chat, sender=self.ana, text="hola")
+        with CaptureQueriesContext(connection) as con_cuatro:
+            self.assertEqual(len(self.bandeja()), 4)
+        self.assertEqual(len(con_uno), len(con_cuatro))
+
+
+class CoalescedorTests(SimpleTestCase):
+    def setUp(self):
+        self.reloj = 100.0
+        parche = mock.patch("accounts.presencia.time.monotonic", side_effect=lambda: self.reloj)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.coalescedor = presencia.Coalescedor()
+
+    def test_agrupa_dentro_del_intervalo(self):
+        self.assertTrue(self.coalescedor.debe_escribir("a", 2))
+        self.reloj += 1.5
+        self.assertFalse(self.coalescedor.debe_escribir("a", 2))
+        self.assertTrue(self.coalescedor.debe_escribir("b", 2))
+        self.reloj += 0.5
+        self.assertTrue(self.coalescedor.debe_escribir("a", 2))
+
+    def test_olvidar_permite_escribir_de_nuevo(self):
+        self.coalescedor.debe_escribir("a", 2)
+        self.coalescedor.olvidar("a")
+        self.assertTrue(self.coalescedor.debe_escribir("a", 2))
+
+    def test_limpia_entradas_caducadas_al_crecer(self):
+        self.coalescedor.MAX_ENTRADAS = 2
+        self.coalescedor.debe_escribir("vieja", 2)
+        self.reloj += 60
+        self.coalescedor.debe_escribir("a", 2)
+        self.coalescedor.debe_escribir("b", 2)
+        self.assertEqual(set(self.coalescedor._ultimas), {"a", "b"})
+
+
+class EscribiendoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        parche = mock.patch.object(presencia, "_coalescedor", presencia.Coalescedor())
+        parche.start()
+        self.addCleanup(parche.stop)
+
+        self.ana = User.objects.create_user("ana")
+        self.beto = User.objects.create_user("beto")
+        self.chat, _ = Conversation.get_or_create_direct(self.ana, self.beto)
+
+    def escribir(self):
+        return self.client.post(reverse("accounts:conversation_detail", args=[self.beto.id]),
+                                {"action": "typing"}, content_type="application/json",
+                                headers={"x-requested-with": "XMLHttpRequest"})
+
+    def test_avisos_seguidos_publican_un_solo_evento(self):
+        self.client.force_login(self.ana)
+        with mock.patch.object(realtime, "publicar") as publicar:
+            with self.assertNumQueries(4):
+                # Sesión, usuario, otro usuario y conversación: el aviso no escribe en la BD
+                self.assertEqual(self.escribir().status_code, 200)
+            self.escribir()
+        publicar.assert_called_once_with(self.beto.id, realtime.ESCRIBIENDO, {
+            "conversacion": self.chat.id, "con": self.ana.id,
+        })
+        self.assertTrue(presencia.esta_escribiendo(self.chat.id, self.ana.id))
+        self.assertFalse(presencia.esta_escribiendo(self.chat.id, self.beto.id))
+
+    def test_caduca_y_se_apaga_al_enviar(self):
+        with self.settings(CHAT_ESCRIBIENDO_TTL=0.05):
+            presencia.marcar_escribiendo(self.chat.id, self.ana.id)
+        self.assertTrue(presencia.esta_escribiendo(self.chat.id, self.ana.id))
+        time.sleep(0.1)
+        self.assertFalse(presencia.esta_escribiendo(self.chat.id, self.ana.id))
+
+        # Dentro del intervalo de agrupación el aviso no se repite...
+        self.assertFalse(presencia.marcar_escribiendo(self.chat.id, self.ana.id))
+        Message.objects.create(conversation=self.chat, sender=self.ana, text="hola")
+        # ...salvo que un mensaje haya apagado el indicador
+        self.assertTrue(presencia.marcar_escribiendo(self.chat.id, self.ana.id))
+
+    def test_bandeja_lee_todos_los_indicadores_de_una_vez(self):
+        carla = User.objects.create_user("carla")
+        otro, _ = Conversation.get_or_create_direct(self.ana, carla)
+        presencia.marcar_escribiendo(self.chat.id, self.beto.id)
+
+        self.assertEqual(
+            presencia.escribiendo_en([(self.chat.id, self.beto.id), (otro.id, carla.id)]),
+            {(self.chat.id, self.beto.id)},
+        )
+        self.client.force_login(self.ana)
+        chats = self.client.get(reverse("accounts:messages_list"),
+                                headers={"x-requested-with": "XMLHttpRequest"}).json()
+        self.assertEqual({c["name"]: c["is_typing"] for c in chats}, {"beto": True, "carla": False})
@@ -23,4 +23,7 @@ urlpatterns = [
     # URLs para mensajería
     path('messages/', views.ConversationsListView.as_view(), name='messages_list'),
     path('messages/chat/<int:other_user_id>/', views.ConversationDetailView.as_view(), name='conversation_detail'),
+    path('messages/chat/<int:other_user_id>/sync/', views.ConversationSyncView.as_view(), name='conversation_sync'),
+    path('messages/chat/<int:other_user_id>/historial/', views.ConversationHistoryView.as_view(), name='conversation_history'),
+    path('messages/eventos/', views.eventos_chat, name='chat_events'),
 ]
\ No newline at end of file
@@ -1,16 +1,17 @@
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.views import View
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Friendship, Conversation, Message
 from django.db.models import Q, F
-from .models import Profile, Friendship, Conversation, Message, TypingStatus
+from .models import Profile, Friendship, Conversation, Message, ConversationSummary
 from django.contrib.auth.models import User
 from django.core.serializers.json import DjangoJSONEncoder
 import json
-from django.utils import timezone
-from django.db.models import Count
+from django.db.models import Max
+from . import presencia, realtime
 
 
 # Asegúrate de que el usuario esté logueado para acceder a esta vista
@@ -195,48 +196,48 @@ class IncrementPhotoCountView(LoginRequiredMixin, View):
             'unlocked_achievement': newly_unlocked_achievement
         })
 
+def _entero(valor, por_defecto):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return por_defecto
+
+
+# Conversaciones por página de la bandeja de entrada
+CONVERSACIONES_POR_PAGINA = 30
+
+
 class ConversationsListView(LoginRequiredMixin, View):
+    """
+    Bandeja de entrada: una consulta indexada sobre los resúmenes del usuario, de la
+    conversación más reciente a la más antigua. Con AJAX, ?pagina=N devuelve las siguientes
+    (una lista vacía indica que no hay más).
+    """
     def get(self, request):
-        # Obtenemos las conversaciones donde participa el usuario actual
-        conversations = request.user.conversations.all().prefetch_related('messages', 'participants')
-        
-        chats_data = []
-        for conv in conversations:
-            # Identificar al otro usuario
-            other_user = conv.participants.exclude(id=request.user.id).first()
-            if not other_user:
-                continue
-            
-            # Obtener mensajes ordenados
-            msgs = conv.messages.all().order_by('id') # Asumiendo orden por ID cronológico
-            messages_list = []
-            unread = 0
-            
-            for m in msgs:
-                if not m.is_read and m.sender != request.user:
-                    unread += 1
-                messages_list.append({
-                    'from': 'me' if m.sender == request.user else 'other',
-                    'text': m.text,
-                    'image': m.image.url if m.image else None,
-                    'time': m.timestamp.strftime("%H:%M")
-                })
-            
-            # Verificar si el otro usuario está escribiendo (activo en los últimos 4 segundos)
-            is_typing = False
-            typing_status = TypingStatus.objects.filter(conversation=conv, user=other_user).first()
-            if typing_status and (timezone.now() - typing_status.timestamp).total_seconds() < 4:
-                is_typing = True
+        pagina = max(_entero(request.GET.get('pagina'), 1), 1)
+        inicio = (pagina - 1) * CONVERSACIONES_POR_PAGINA
+        resumenes = list(
+            ConversationSummary.objects.filter(user=request.user, other_user__isnull=False)
+            .select_related('other_user')
+            .order_by('-last_message_at', '-id')
+            [inicio:inicio + CONVERSACIONES_POR_PAGINA]
+        )
+
+        # Verificar si el otro usuario está escribiendo: una sola lectura de la caché para toda la página
+        escribiendo = presencia.escribiendo_en((r.conversation_id, r.other_user_id) for r in resumenes)
 
-            last_text = messages_list[-1]['text'] if messages_list and messages_list[-1]['text'] else ('[Imagen]' if messages_list and messages_list[-1]['image'] else "Sin mensajes")
+        chats_data = []
+        for resumen in resumenes:
+            other_user = resumen.other_user
             chats_data.append({
                 'id': other_user.id, # ID del usuario para la URL
+                'conversacion': resumen.conversation_id,
                 'name': other_user.username,
                 'avatar': other_user.username[0].upper(),
-                'unread': unread,
-                'messages': messages_list,
-                'last_msg': last_text,
-                'is_typing': is_typing
+                'unread': resumen.unread_count,
+                'last_msg': resumen.last_message_preview or "Sin mensajes",
+                'time': resumen.last_message_at.strftime("%H:%M") if resumen.last_message_preview else None,
+                'is_typing': (resumen.conversation_id, resumen.other_user_id) in escribiendo
             })
 
         # Si la petición es AJAX (desde el JS), devolvemos solo los datos JSON
@@ -248,31 +249,131 @@ class ConversationsListView(LoginRequiredMixin, View):
         }
         return render(request, 'accounts/mensajes.html', context)
 
+def marcar_leidos(conversation, user, other_user):
+    """Marca como leídos los mensajes recibidos y avisa al remitente (confirmación de lectura)."""
+    pendientes = conversation.messages.filter(is_read=False).exclude(sender=user)
+    ultimo = pendientes.order_by('-id').values_list('id', flat=True).first()
+    if ultimo is None:
+        return
+    pendientes.filter(id__lte=ultimo).update(is_read=True)
+    ConversationSummary.objects.filter(conversation=conversation, user=user).update(unread_count=0)
+    realtime.publicar(other_user.id, realtime.LEIDO, {
+        'conversacion': conversation.id,
+        'con': user.id,
+        'hasta': ultimo,
+    })
+
+
+async def eventos_chat(request):
+    """
+    Canal Server-Sent Events del chat: una conexión por pestaña que recibe los mensajes,
+    lecturas y avisos de "escribiendo" del usuario a medida que ocurren.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI la conexión abierta ocuparía un hilo para siempre. 204 le dice al
+        # navegador que no reintente; la página sigue funcionando sin tiempo real.
+        return HttpResponse(status=204)
+
+    respuesta = StreamingHttpResponse(realtime.flujo_eventos(user.id), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    # Evita que nginx acumule el flujo en su búfer
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+
+def get_conversation(user1, user2):
+    """Función auxiliar para encontrar la conversación exacta entre dos personas"""
+    return Conversation.get_direct(user1, user2)
+
+
+# Mensajes que se pintan al abrir un chat; los anteriores se piden al hacer scroll hacia arriba
+MENSAJES_INICIALES = 50
+# Máximo de mensajes por respuesta de sincronización / página de historial
+LIMITE_SYNC = 100
+LIMITE_HISTORIAL = 30
+
+
+class ConversationSyncView(LoginRequiredMixin, View):
+    """
+    Sincronización incremental de un chat: ?desde=<id del último mensaje que tiene el cliente>.
+    Devuelve solo los mensajes posteriores, hasta qué mensaje propio leyó el otro usuario
+    y si está escribiendo. El cliente guarda `cursor` y lo manda en la siguiente llamada.
+    """
+    def get(self, request, other_user_id):
+        other_user = get_object_or_404(User, id=other_user_id)
+        desde = _entero(request.GET.get('desde'), 0)
+        conversation = get_conversation(request.user, other_user)
+        if not conversation:
+            return JsonResponse({'mensajes': [], 'cursor': desde, 'hay_mas': False,
+                                 'leido_hasta': None, 'escribiendo': False})
+
+        nuevos = list(conversation.messages.filter(id__gt=desde).order_by('id')[:LIMITE_SYNC + 1])
+        hay_mas = len(nuevos) > LIMITE_SYNC
+        nuevos = nuevos[:LIMITE_SYNC]
+
+        # Los mensajes se marcan leídos en orden: basta con el último leído para saber el estado de todos
+        leido_hasta = conversation.messages.filter(sender=request.user, is_read=True)\
+            .aggregate(hasta=Max('id'))['hasta']
+
+        escribiendo = presencia.esta_escribiendo(conversation.id, other_user.id)
+
+        return JsonResponse({
+            'mensajes': [realtime.datos_mensaje(m, request.user.id, other_user.id) for m in nuevos],
+            'cursor': nuevos[-1].id if nuevos else desde,
+            'hay_mas': hay_mas,
+            'leido_hasta': leido_hasta,
+            'escribiendo': escribiendo,
+        })
+
+
+class ConversationHistoryView(LoginRequiredMixin, View):
+    """Página de mensajes anteriores a ?antes=<id> (scroll hacia arriba), en orden cronológico."""
+    def get(self, request, other_user_id):
+        other_user = get_object_or_404(User, id=other_user_id)
+        antes = _entero(request.GET.get('antes'), None)
+        limite = min(max(_entero(request.GET.get('limite'), LIMITE_HISTORIAL), 1), LIMITE_SYNC)
+        conversation = get_conversation(request.user, other_user)
+        if not conversation:
+            return JsonResponse({'mensajes': [], 'hay_mas': False})
+
+        consulta = conversation.messages.order_by('-id')
+        if antes is not None:
+            consulta = consulta.filter(id__lt=antes)
+        pagina = list(consulta[:limite + 1])
+        hay_mas = len(pagina) > limite
+        pagina = pagina[:limite][::-1]
+
+        return JsonResponse({
+            'mensajes': [realtime.datos_mensaje(m, request.user.id, other_user.id) for m in pagina],
+            'hay_mas': hay_mas,
+        })
+
+
 class ConversationDetailView(LoginRequiredMixin, View):
     def get_conversation(self, user1, user2):
-        """Función auxiliar para encontrar la conversación exacta entre dos personas"""
-        return Conversation.objects.annotate(num_participants=Count('participants'))\
-            .filter(num_participants=2)\
-            .filter(participants=user1)\
-            .filter(participants=user2).first()
+        """La conversación entre los dos usuarios, creándola si todavía no existe."""
+        conversation, _ = Conversation.get_or_create_direct(user1, user2)
+        return conversation
 
     def get(self, request, other_user_id):
         other_user = get_object_or_404(User, id=other_user_id)
         
-        # Usamos la función auxiliar para buscar la conversación
+        # Usamos la función auxiliar para buscar (o crear) la conversación
         conversation = self.get_conversation(request.user, other_user)
-        
-        if not conversation:
-            conversation = Conversation.objects.create()
-            conversation.participants.add(request.user, other_user)
 
         # Marcar mensajes como leídos
-        conversation.messages.filter(is_read=False).exclude(sender=request.user).update(is_read=True)
+        marcar_leidos(conversation, request.user, other_user)
 
+        # Solo los últimos mensajes; el resto llega con el historial paginado
+        ultimos = list(conversation.messages.order_by('-id')[:MENSAJES_INICIALES + 1])
         context = {
             'conversation': conversation,
             'other_user': other_user,
-            'messages_list': conversation.messages.all()
+            'messages_list': ultimos[:MENSAJES_INICIALES][::-1],
+            'hay_anteriores': len(ultimos) > MENSAJES_INICIALES,
         }
         return render(request, 'accounts/conversation_detail.html', context)
     
@@ -281,12 +382,7 @@ class ConversationDetailView(LoginRequiredMixin, View):
         
         # IMPORTANTE: Usamos la misma lógica de búsqueda que en el GET
         conversation = self.get_conversation(request.user, other_user)
-        
-        # Si por alguna razón no existe al intentar enviar (caso raro), la creamos
-        if not conversation:
-            conversation = Conversation.objects.create()
-            conversation.participants.add(request.user, other_user)
-        
+
         # Manejo de AJAX (JSON) para la interfaz de mensajes
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             text = ""
@@ -296,11 +392,17 @@ class ConversationDetailView(LoginRequiredMixin, View):
                 data = json.loads(request.body)
                 
                 if data.get('action') == 'typing':
-                    TypingStatus.objects.update_or_create(
-                        conversation=conversation, 
-                        user=request.user,
-                        defaults={'timestamp': timezone.now()}
-                    )
+                    # Estado efímero con TTL en la caché; los avisos seguidos se agrupan
+                    if presencia.marcar_escribiendo(conversation.id, request.user.id):
+                        realtime.publicar(other_user.id, realtime.ESCRIBIENDO, {
+                            'conversacion': conversation.id,
+                            'con': request.user.id,
+                        })
+                    return JsonResponse({'status': 'ok'})
+
+                # El chat abierto recibió mensajes por el canal en tiempo real
+                if data.get('action') == 'read':
+                    marcar_leidos(conversation, request.user, other_user)
                     return JsonResponse({'status': 'ok'})
 
                 text = data.get('text', "")
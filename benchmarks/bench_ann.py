@@ -0,0 +1,96 @@
+"""
+Recall@k y latencia de la búsqueda IVF de turismo.embeddings frente a la búsqueda
+exacta (producto contra toda la matriz) para 1k, 10k y 50k sitios sintéticos.
+También mide insertar/eliminar incrementales.
+
+Los vectores imitan los de MobileNetV2 (no negativos, agrupados por "tipo" de paisaje)
+y las consultas son vectores del catálogo con ruido, como una foto nueva del mismo sitio.
+
+Uso: python benchmarks/bench_ann.py [--k 10] [--nprobe 4 8 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turismo.embeddings import DIMENSION_EMBEDDING, IndiceEmbeddings, normalizar  # noqa: E402
+
+CONSULTAS = 200
+
+
+def catalogo_sintetico(n, rng, grupos=50):
+    centros = np.abs(rng.normal(size=(grupos, DIMENSION_EMBEDDING))).astype(np.float32)
+    asignacion = rng.integers(0, grupos, size=n)
+    ruido = np.abs(rng.normal(scale=0.8, size=(n, DIMENSION_EMBEDDING))).astype(np.float32)
+    return centros[asignacion] + ruido
+
+
+def exacta(matriz, consulta, k):
+    similitudes = matriz @ consulta
+    mejores = np.argpartition(-similitudes, k - 1)[:k]
+    return mejores[np.argsort(-similitudes[mejores])]
+
+
+def medir(n, k, nprobes, rng):
+    vectores = catalogo_sintetico(n, rng)
+    ids = np.arange(1, n + 1)
+    indice = IndiceEmbeddings(ids, vectores)
+
+    inicio = time.perf_counter()
+    indice.entrenar()
+    t_entrenar = time.perf_counter() - inicio
+
+    elegidos = rng.integers(0, n, size=CONSULTAS)
+    consultas = vectores[elegidos] + np.abs(rng.normal(scale=0.5, size=(CONSULTAS, DIMENSION_EMBEDDING)))
+    consultas = normalizar(consultas)
+
+    # Verdad: búsqueda exacta sobre la matriz completa
+    matriz = indice.matriz
+    inicio = time.perf_counter()
+    verdad = [set(indice.ids[exacta(matriz, q, k)].tolist()) for q in consultas]
+    t_exacta = (time.perf_counter() - inicio) / CONSULTAS
+
+    print(f"\n{n} sitios ({len(indice._listas) or 'sin'} listas IVF, entrenamiento {t_entrenar:.2f}s)")
+    print(f"  exacta           : {t_exacta * 1000:7.3f} ms/consulta")
+    for nprobe in nprobes:
+        aciertos = 0
+        inicio = time.perf_counter()
+        resultados = [indice.buscar(q, k=k, nprobe=nprobe)[0] for q in consultas]
+        t_ann = (time.perf_counter() - inicio) / CONSULTAS
+        for encontrados, esperados in zip(resultados, verdad):
+            aciertos += len(esperados.intersection(encontrados.tolist()))
+        recall = aciertos / (k * CONSULTAS)
+        print(f"  ivf nprobe={nprobe:<4} : {t_ann * 1000:7.3f} ms/consulta  recall@{k}={recall:.3f}  "
+              f"({t_exacta / t_ann:.1f}x)")
+
+    # Altas y bajas sin reconstruir
+    nuevos = catalogo_sintetico(100, rng)
+    inicio = time.perf_counter()
+    for i, vector in enumerate(nuevos):
+        indice.insertar(n + 1 + i, vector)
+    t_insertar = (time.perf_counter() - inicio) / len(nuevos)
+    inicio = time.perf_counter()
+    for pk in range(n + 1, n + 101):
+        indice.eliminar(pk)
+    t_eliminar = (time.perf_counter() - inicio) / 100
+    print(f"  insertar         : {t_insertar * 1000:7.3f} ms   eliminar: {t_eliminar * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.tamanos:
+        medir(n, args.k, args.nprobe, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Informe de tamaño y precisión de los formatos comprimidos de embeddings
+(float16, int8) frente a float32.
+
+Por defecto usa las imágenes de referencia de sitios/ con MobileNetV2 (requiere
+TensorFlow): cada foto se compara contra variaciones de sí misma (recorte, espejo,
+brillo), como haría un turista con su propia foto. Con --sintetico se genera un
+catálogo simulado de vectores para medir a mayor escala sin TensorFlow.
+
+Uso: python benchmarks/bench_cuantizacion.py [--sintetico 10000]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ADAY.settings")
+
+from turismo.cuantizacion import CODIFICADORES, productos  # noqa: E402
+from turismo.embeddings import DIMENSION_EMBEDDING, normalizar  # noqa: E402
+
+EXTENSIONES = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def variaciones(img):
+    """Fotos "de usuario" a partir de la de referencia."""
+    from PIL import ImageEnhance, ImageOps
+
+    ancho, alto = img.size
+    yield img.crop((ancho // 10, alto // 10, ancho * 9 // 10, alto * 9 // 10))
+    yield ImageOps.mirror(img)
+    yield ImageEnhance.Brightness(img).enhance(1.3)
+    yield img.rotate(5, expand=False)
+
+
+def datos_sitios():
+    import django
+
+    django.setup()
+    from core.imagenes import abrir_imagen, array_mobilenet
+    from turismo.services_ia import obtener_vectores_lote
+
+    referencias, consultas, etiquetas = [], [], []
+    for carpeta, _, archivos in sorted(os.walk(os.path.join(RAIZ, "sitios"))):
+        imagenes = sorted(a for a in archivos if a.lower().endswith(EXTENSIONES))
+        if not imagenes:
+            continue
+        img = abrir_imagen(os.path.join(carpeta, imagenes[0]))
+        referencias.append(array_mobilenet(img))
+        for variacion in variaciones(img):
+            consultas.append(array_mobilenet(variacion))
+            etiquetas.append(len(referencias) - 1)
+
+    vectores = obtener_vectores_lote(referencias + consultas)
+    if any(v is None for v in vectores):
+        sys.exit("MobileNetV2 no disponible; instala TensorFlow o usa --sintetico N")
+    vectores = np.vstack(vectores)
+    return vectores[:len(referencias)], vectores[len(referencias):], np.array(etiquetas)
+
+
+def datos_sinteticos(n, rng, consultas=500):
+    centros = np.abs(rng.normal(size=(50, DIMENSION_EMBEDDING)))
+    referencias = centros[rng.integers(0, 50, size=n)] + np.abs(rng.normal(scale=0.8, size=(n, DIMENSION_EMBEDDING)))
+    etiquetas = rng.integers(0, n, size=consultas)
+    ruido = np.abs(rng.normal(scale=0.5, size=(consultas, DIMENSION_EMBEDDING)))
+    return referencias.astype(np.float32), (referencias[etiquetas] + ruido).astype(np.float32), etiquetas
+
+
+def informe(referencias, consultas, etiquetas):
+    referencias = normalizar(referencias)
+    consultas = normalizar(consultas)
+    n = len(referencias)
+    print(f"{n} referencias, {len(consultas)} consultas\n")
+    print(f"{'formato':<8} {'KB/vector':>9} {'total KB':>9} {'ms/consulta':>11} {'top1':>6} "
+          f"{'=float32':>8} {'err medio':>9} {'err máx':>8}")
+
+    base = None
+    for formato, clase in CODIFICADORES.items():
+        codificador = clase.ajustar(referencias)
+        codigos = codificador.codificar(referencias)
+
+        inicio = time.perf_counter()
+        puntuaciones = np.stack([productos(codigos, codificador.preparar_consulta(q)) for q in consultas])
+        ms = (time.perf_counter() - inicio) * 1000 / len(consultas)
+
+        top1 = puntuaciones.argmax(axis=1)
+        if base is None:
+            base = puntuaciones
+            base_top1 = top1
+        error = np.abs(puntuaciones - base)
+        print(f"{formato:<8} {codigos.nbytes / n / 1024:>9.2f} {codigos.nbytes / 1024:>9.1f} {ms:>11.3f} "
+              f"{np.mean(top1 == etiquetas):>6.3f} {np.mean(top1 == base_top1):>8.3f} "
+              f"{error.mean():>9.5f} {error.max():>8.5f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sintetico", type=int, metavar="N", help="Catálogo simulado de N sitios (sin TensorFlow)")
+    args = parser.parse_args()
+
+    if args.sintetico:
+        datos = datos_sinteticos(args.sintetico, np.random.default_rng(0))
+    else:
+        datos = datos_sitios()
+    informe(*datos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compara el haversine escalar (bucle Python + math) con el kernel vectorizado
+de turismo.utils para 1k, 10k y 100k sitios.
+
+Uso: python benchmarks/bench_haversine.py
+"""
+import math
+import os
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turismo.utils import distancias_km, matriz_distancias_km  # noqa: E402
+
+
+def haversine_escalar(lat1, lon1, lat2, lon2):
+    """Implementación anterior: convierte a float y usa math en cada llamada."""
+    R = 6371
+    phi1 = math.radians(float(lat1))
+    phi2 = math.radians(float(lat2))
+    dphi = math.radians(float(lat2) - float(lat1))
+    dlambda = math.radians(float(lon2) - float(lon1))
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def medir(funcion, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main():
+    rng = np.random.default_rng(42)
+    lat, lon = -2.19, -79.89
+
+    print(f"{'sitios':>8} | {'escalar (ms)':>13} | {'vectorizado (ms)':>16} | {'speedup':>8}")
+    print("-" * 56)
+    for n in (1_000, 10_000, 100_000):
+        lats = rng.uniform(-5.0, 1.5, n)
+        lons = rng.uniform(-81.0, -75.5, n)
+        # El bucle original recibe Decimal desde el ORM
+        lats_dec = [Decimal(f"{x:.6f}") for x in lats]
+        lons_dec = [Decimal(f"{x:.6f}") for x in lons]
+
+        repeticiones = 3 if n >= 100_000 else 5
+        t_escalar = medir(
+            lambda: [haversine_escalar(lat, lon, a, b) for a, b in zip(lats_dec, lons_dec)],
+            repeticiones,
+        )
+        t_vector = medir(lambda: distancias_km(lat, lon, lats, lons), repeticiones * 4)
+
+        esperado = np.array([haversine_escalar(lat, lon, a, b) for a, b in zip(lats[:100], lons[:100])])
+        assert np.allclose(distancias_km(lat, lon, lats[:100], lons[:100]), esperado)
+
+        print(f"{n:>8} | {t_escalar * 1e3:>13.2f} | {t_vector * 1e3:>16.3f} | {t_escalar / t_vector:>7.0f}x")
+
+    # Matriz muchos-a-muchos (p. ej. 500 consultas contra 10k sitios)
+    consultas = 500
+    lats = rng.uniform(-5.0, 1.5, 10_000)
+    lons = rng.uniform(-81.0, -75.5, 10_000)
+    q_lats = rng.uniform(-5.0, 1.5, consultas)
+    q_lons = rng.uniform(-81.0, -75.5, consultas)
+    t_matriz = medir(lambda: matriz_distancias_km(q_lats, q_lons, lats, lons), 3)
+    print(f"\nmatriz {consultas}x10000: {t_matriz * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Throughput y latencia (p50/p99) de la inferencia con y sin micro-lotes.
+
+Lanza `--clientes` hilos que envían `--peticiones` imágenes en total y compara
+lote=1 (sin agrupar) con el lote configurado.
+
+Modos:
+  --modelo simulado   coste sintético: --coste-fijo-ms por pasada + --coste-item-ms por imagen
+  --modelo mobilenet  MobileNetV2 real sobre una imagen de sitios/ (requiere TensorFlow)
+
+Uso: python benchmarks/bench_microlotes.py --clientes 16 --max-lote 8 --espera-ms 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ADAY.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from core.microlotes import Microlote  # noqa: E402
+
+
+def funcion_simulada(coste_fijo, coste_item):
+    def lote(elementos):
+        time.sleep(coste_fijo + coste_item * len(elementos))
+        return list(elementos)
+    return lote
+
+
+def funcion_mobilenet():
+    from turismo.services_ia import obtener_vectores_lote
+
+    return obtener_vectores_lote
+
+
+def ejecutar(funcion_lote, imagen, clientes, peticiones, max_lote, espera):
+    microlote = Microlote(funcion_lote, max_lote=max_lote, espera_max=espera, nombre=f"bench-{max_lote}")
+    latencias = []
+    lock = threading.Lock()
+    por_cliente = peticiones // clientes
+
+    def cliente():
+        for _ in range(por_cliente):
+            inicio = time.perf_counter()
+            microlote.enviar(imagen)
+            with lock:
+                latencias.append(time.perf_counter() - inicio)
+
+    hilos = [threading.Thread(target=cliente) for _ in range(clientes)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total = time.perf_counter() - inicio
+
+    lat = np.array(latencias) * 1000
+    return {
+        "throughput": len(latencias) / total,
+        "p50": np.percentile(lat, 50),
+        "p99": np.percentile(lat, 99),
+        "tamano_medio": microlote.estadisticas()["tamano_medio"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modelo", choices=["simulado", "mobilenet"], default="simulado")
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=320)
+    parser.add_argument("--max-lote", type=int, default=8)
+    parser.add_argument("--espera-ms", type=float, default=10)
+    parser.add_argument("--coste-fijo-ms", type=float, default=30)
+    parser.add_argument("--coste-item-ms", type=float, default=4)
+    args = parser.parse_args()
+
+    if args.modelo == "mobilenet":
+        funcion_lote = funcion_mobilenet()
+        imagen = str(next((RAIZ / "sitios").rglob("*.jpg")))
+        funcion_lote([imagen])  # calentamiento: carga del modelo
+    else:
+        funcion_lote = funcion_simulada(args.coste_fijo_ms / 1000, args.coste_item_ms / 1000)
+        imagen = "imagen"
+
+    print(f"modelo={args.modelo} clientes={args.clientes} peticiones={args.peticiones}")
+    print(f"{'config':>22} | {'img/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | {'lote medio':>10}")
+    print("-" * 70)
+    for max_lote, espera in ((1, 0.0), (args.max_lote, args.espera_ms / 1000)):
+        r = ejecutar(funcion_lote, imagen, args.clientes, args.peticiones, max_lote, espera)
+        etiqueta = f"lote={max_lote} espera={espera * 1000:.0f}ms"
+        print(f"{etiqueta:>22} | {r['throughput']:>8.1f} | {r['p50']:>8.1f} | {r['p99']:>8.1f} | {r['tamano_medio']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Latencia por llamada de la consulta de riesgo: KMeans.predict de sklearn (1x2)
+contra el argmin de NumPy sobre los centroides exportados.
+También comprueba que ambos devuelven los mismos cluster_id.
+
+Uso: python benchmarks/bench_riesgo_lookup.py
+"""
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ADAY.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from riesgo.services import predecir_cluster  # noqa: E402
+
+warnings.filterwarnings("ignore")
+
+
+def por_llamada(funcion, puntos):
+    inicio = time.perf_counter()
+    for p in puntos:
+        funcion(p)
+    return (time.perf_counter() - inicio) / len(puntos)
+
+
+def main():
+    modelo = joblib.load(os.path.join(RAIZ, "riesgo", "modelo_zonas.pkl"))
+    rng = np.random.default_rng(0)
+
+    # Equivalencia sobre 100k puntos de Ecuador
+    muestra = np.column_stack([rng.uniform(-5.2, 2.5, 100_000), rng.uniform(-92.5, -75.0, 100_000)])
+    iguales = np.array_equal(modelo.predict(muestra), predecir_cluster(muestra))
+    print(f"cluster_id idénticos en 100k puntos: {iguales}")
+
+    # Latencia por llamada con un solo punto (caso del API)
+    puntos = [muestra[i:i + 1] for i in range(2_000)]
+    t_sklearn = por_llamada(modelo.predict, puntos)
+    t_numpy = por_llamada(predecir_cluster, puntos)
+    print(f"KMeans.predict (1x2): {t_sklearn * 1e6:8.1f} µs/llamada")
+    print(f"argmin NumPy   (1x2): {t_numpy * 1e6:8.1f} µs/llamada")
+    print(f"speedup: {t_sklearn / t_numpy:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .versiones import VersionCompartida
+
+
+class CacheResultados:
+    """
+    Caché LRU con caducidad (TTL) para resultados de inferencia.
+
+    Las claves suelen ser (hash perceptual, celda de ubicación): fotos casi idénticas
+    del mismo lugar, o el mismo archivo reenviado con "Reintentar", reutilizan el
+    resultado sin pasar por el modelo. obtener_parecido() acepta además hashes que
+    difieran en unos pocos bits. Vive en memoria del proceso, como los índices, y
+    se vacía cuando otro proceso la invalida (ver core/versiones.py).
+    Se acota por número de entradas y por bytes (tamaño aproximado del valor serializado).
+    """
+
+    def __init__(self, nombre, max_entradas=1024, ttl=600, max_bytes=None):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # clave -> (valor, caduca_en, bytes)
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.aciertos = 0
+        self.aciertos_parecidos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.caducados = 0
+        self.invalidaciones = 0
+        self.version = VersionCompartida(f"cache_{nombre}", caduca=False)
+        self.version.marcar(self.version.leer())
+
+    def __len__(self):
+        return len(self._datos)
+
+    def _quitar(self, clave):
+        _, _, tamano = self._datos.pop(clave)
+        self.bytes -= tamano
+
+    def _vigente(self, clave):
+        """Valor de la clave, o None si no está o ya caducó. Se llama con el lock tomado."""
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        valor, caduca_en, _ = entrada
+        if caduca_en <= time.monotonic():
+            self._quitar(clave)
+            self.caducados += 1
+            return None
+        self._datos.move_to_end(clave)
+        return valor
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado o None si no está o ya caducó."""
+        with self._lock:
+            valor = self._vigente(clave)
+            if valor is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+            return valor
+
+    def obtener_parecido(self, dhash, resto=None, radio=0):
+        """
+        Busca la clave (dhash, resto); si no está, devuelve la entrada con el mismo `resto`
+        cuyo hash (hexadecimal) difiera en como mucho `radio` bits, la más cercana.
+        Recorre las entradas en memoria, que están acotadas por max_entradas.
+        """
+        with self._lock:
+            valor = self._vigente((dhash, resto))
+            if valor is None and radio:
+                objetivo = int(dhash, 16)
+                ahora = time.monotonic()
+                mejor, mejor_distancia = None, radio + 1
+                for clave, (_, caduca_en, _) in self._datos.items():
+                    if not (isinstance(clave, tuple) and len(clave) == 2 and clave[1] == resto) or caduca_en <= ahora:
+                        continue
+                    distancia = (int(clave[0], 16) ^ objetivo).bit_count()
+                    if distancia < mejor_distancia:
+                        mejor, mejor_distancia = clave, distancia
+                if mejor is not None:
+                    valor = self._vigente(mejor)
+                    self.aciertos_parecidos += 1
+            if valor is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor):
+        tamano = len(pickle.dumps((clave, valor), protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (valor, time.monotonic() + self.ttl, tamano)
+            self.bytes += tamano
+            # Desalojamos los menos usados hasta volver a los límites
+            while self._datos and (
+                len(self._datos) > self.max_entradas
+                or (self.max_bytes and self.bytes > self.max_bytes)
+            ):
+                self._quitar(next(iter(self._datos)))
+                self.desalojos += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._datos.clear()
+            self.bytes = 0
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._datos),
+            "max_entradas": self.max_entradas,
+            "ttl_s": self.ttl,
+            "aciertos": self.aciertos,
+            "aciertos_parecidos": self.aciertos_parecidos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0,
+            "desalojos": self.desalojos,
+            "caducados": self.caducados,
+            "invalidaciones": self.invalidaciones,
+            "memoria_kb": round(self.bytes / 1024, 1),
+        }
+
+
+def radio_hamming():
+    """Bits de dHash en que pueden diferir dos fotos para compartir resultado (0 = solo iguales)."""
+    return getattr(settings, "CACHE_IA_RADIO_HAMMING", 4)
+
+
+def celda_ubicacion(lat, lon, grados=None):
+    """Celda de cuadrícula gruesa (por defecto 0.01° ≈ 1.1 km) para agrupar fotos del mismo lugar."""
+    if grados is None:
+        grados = getattr(settings, "CACHE_IA_CELDA_GRADOS", 0.01)
+    return (int(lat // grados), int(lon // grados))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def obtener_cache(nombre):
+    """
+    Caché compartida por nombre dentro del proceso, creada con los límites de settings.
+    Si otro proceso la invalidó desde la última consulta, se vacía antes de devolverla.
+    """
+    cache = _caches.get(nombre)
+    if cache is not None and not cache.version.vigente():
+        version = cache.version.leer()
+        cache.invalidar()
+        cache.version.marcar(version)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(nombre)
+            if cache is None:
+                cache = _caches[nombre] = CacheResultados(
+                    nombre,
+                    max_entradas=getattr(settings, "CACHE_IA_MAX_ENTRADAS", 1024),
+                    ttl=getattr(settings, "CACHE_IA_TTL", 600),
+                    max_bytes=getattr(settings, "CACHE_IA_MAX_KB", 8192) * 1024,
+                )
+    return cache
+
+
+def invalidar_cache(nombre):
+    """Vacía la caché de este proceso y avisa a los demás."""
+    cache = _caches.get(nombre)
+    if cache is not None:
+        cache.invalidar()
+        cache.version.incrementar(aplicado=True)
+    else:
+        VersionCompartida(f"cache_{nombre}").incrementar()
+
+
+def estado_caches():
+    return {nombre: cache.estadisticas() for nombre, cache in _caches.items()}
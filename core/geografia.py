@@ -0,0 +1,11 @@
+"""
+Límites geográficos compartidos por turismo y riesgo.
+"""
+
+# Ecuador incluyendo Galápagos (lat sur, lon oeste, lat norte, lon este)
+ECUADOR_BBOX = (-5.2, -92.5, 2.5, -75.0)
+
+
+def dentro_de_ecuador(lat, lon):
+    sur, oeste, norte, este = ECUADOR_BBOX
+    return sur <= lat <= norte and oeste <= lon <= este
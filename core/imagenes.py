@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Tamaños de entrada de los modelos
+TAMANO_MOBILENET = (224, 224)
+LADO_YOLO = 640
+
+
+class ImagenInvalida(Exception):
+    """El archivo subido no se pudo decodificar como imagen."""
+
+
+def abrir_imagen(origen):
+    """
+    Decodifica una imagen desde bytes, un archivo en memoria o una ruta, en RGB
+    y con la orientación EXIF aplicada (las fotos de móvil suelen venir rotadas).
+    """
+    if isinstance(origen, (bytes, bytearray)):
+        origen = io.BytesIO(origen)
+    try:
+        img = Image.open(origen)
+        img = ImageOps.exif_transpose(img)
+        return img.convert("RGB")
+    except Exception as e:
+        raise ImagenInvalida(str(e)) from e
+
+
+def array_mobilenet(img):
+    """uint8 (224, 224, 3) RGB. Mismo redimensionado (nearest) que keras load_img."""
+    return np.asarray(img.resize(TAMANO_MOBILENET, Image.NEAREST), dtype=np.uint8)
+
+
+class ImagenDecodificada:
+    """
+    Imagen subida decodificada una sola vez en memoria, sin pasar por disco.
+    Cada modelo pide su versión redimensionada, que se calcula una vez y se reutiliza,
+    así YOLO y MobileNet pueden compartir la misma decodificación en una petición.
+    """
+
+    def __init__(self, img):
+        self.img = img
+        self._mobilenet = None
+        self._yolo = None
+        self._dhash = None
+
+    @classmethod
+    def desde_archivo(cls, archivo):
+        """Acepta un UploadedFile de Django (o cualquier objeto con read())."""
+        if hasattr(archivo, "seek"):
+            archivo.seek(0)
+        return cls(abrir_imagen(archivo.read()))
+
+    @property
+    def tamano(self):
+        return self.img.size
+
+    def dhash(self):
+        """
+        Hash perceptual (dHash de 64 bits) en hexadecimal. Compara cada píxel con su vecino
+        en una miniatura 9x8 en grises, así que recompresiones o pequeños cambios de tamaño
+        dan el mismo hash.
+        """
+        if self._dhash is None:
+            gris = np.asarray(self.img.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+            bits = (gris[:, 1:] > gris[:, :-1]).flatten()
+            self._dhash = f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+        return self._dhash
+
+    def para_mobilenet(self):
+        if self._mobilenet is None:
+            self._mobilenet = array_mobilenet(self.img)
+        return self._mobilenet
+
+    def para_yolo(self):
+        """uint8 BGR (formato que espera Ultralytics) con el lado mayor reducido a 640."""
+        if self._yolo is None:
+            img = self.img
+            if max(img.size) > LADO_YOLO:
+                img = img.copy()
+                img.thumbnail((LADO_YOLO, LADO_YOLO), Image.BILINEAR)
+            self._yolo = np.ascontiguousarray(np.asarray(img, dtype=np.uint8)[:, :, ::-1])
+        return self._yolo
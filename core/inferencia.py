@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturado(Exception):
+    """La cola de inferencia está llena; el llamador debe degradar (p. ej. sugerencia por cercanía)."""
+
+
+class TiempoAgotado(Exception):
+    """El trabajo no terminó dentro del timeout indicado."""
+
+
+def _inicializar_worker(modelos):
+    """Arranca Django dentro del proceso worker y precarga sus modelos una sola vez."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ADAY.settings")
+    import django
+
+    django.setup()
+
+    from core.modelos_ia import registro
+
+    registro.precargar(modelos)
+
+
+class PoolInferencia:
+    """
+    Pool de procesos que mantienen los modelos cargados.
+    Las vistas envían trabajos (funciones importables + argumentos picklables) y esperan
+    el resultado con timeout. La cola está acotada: si hay demasiados trabajos
+    pendientes se rechaza al instante con PoolSaturado en vez de bloquear el worker web.
+    Un trabajo que sigue ejecutándose un timeout después de que su llamador dejara de
+    esperar se da por colgado: se recicla el pool para recuperar el proceso y su cupo.
+    Con workers=0 los trabajos se ejecutan en el propio hilo (útil en desarrollo).
+    """
+
+    def __init__(self, workers=2, max_pendientes=8, timeout=15.0, modelos=None):
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self.timeout = timeout
+        self.modelos = list(modelos or [])
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.rechazados = 0
+        self.agotados = 0
+        self.reciclados = 0
+
+    def _obtener_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # spawn: TensorFlow no es seguro tras un fork
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_inicializar_worker,
+                    initargs=(self.modelos,),
+                )
+                logger.info(f"Pool de inferencia iniciado con {self.workers} procesos.")
+            return self._executor
+
+    def _reiniciar(self, executor, terminar=False):
+        """
+        Descarta `executor` si sigue siendo el actual; el siguiente trabajo crea otro.
+        Con `terminar` se matan sus procesos: shutdown() no detiene un trabajo en curso.
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        # ProcessPoolExecutor no expone sus procesos hasta Python 3.14 (terminate_workers)
+        procesos = list((getattr(executor, "_processes", None) or {}).values()) if terminar else []
+        executor.shutdown(wait=False, cancel_futures=True)
+        for proceso in procesos:
+            proceso.terminate()
+
+    def _vigilar_colgado(self, executor, futuro):
+        """
+        Se llama un timeout después de que el llamador se rindiera. Si el trabajo sigue en
+        marcha el proceso está colgado: al terminarlo, los futuros pendientes fallan con
+        BrokenProcessPool y liberan sus cupos.
+        """
+        if futuro.done():
+            return
+        logger.error(f"Trabajo de inferencia en marcha {self.timeout}s después de agotar su plazo; se recicla el pool.")
+        self.reciclados += 1
+        self._reiniciar(executor, terminar=True)
+
+    def enviar(self, funcion, *args, timeout=None):
+        """Ejecuta funcion(*args) en el pool y devuelve su resultado."""
+        if not self._cupos.acquire(blocking=False):
+            self.rechazados += 1
+            raise PoolSaturado(f"Más de {self.max_pendientes} trabajos de inferencia pendientes")
+
+        if self.workers <= 0:
+            try:
+                return funcion(*args)
+            finally:
+                self._cupos.release()
+
+        executor = self._obtener_executor()
+        try:
+            futuro = executor.submit(funcion, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._reiniciar(executor)
+            self._cupos.release()
+            raise PoolSaturado("Pool de inferencia no disponible, se reiniciará")
+
+        # El cupo se libera cuando el worker termina de verdad, no cuando el llamador deja de esperar
+        futuro.add_done_callback(lambda _: self._cupos.release())
+
+        try:
+            return futuro.result(timeout=timeout or self.timeout)
+        except FuturesTimeoutError:
+            self.agotados += 1
+            if not futuro.cancel():
+                # Ya estaba ejecutándose: se le da otro timeout antes de darlo por colgado
+                vigilante = threading.Timer(self.timeout, self._vigilar_colgado, (executor, futuro))
+                vigilante.daemon = True
+                vigilante.start()
+            raise TiempoAgotado(f"La inferencia superó {timeout or self.timeout}s")
+        except BrokenProcessPool:
+            self._reiniciar(executor)
+            raise PoolSaturado("Un proceso de inferencia terminó inesperadamente")
+
+    def estado(self):
+        return {
+            "workers": self.workers,
+            "max_pendientes": self.max_pendientes,
+            "rechazados": self.rechazados,
+            "agotados": self.agotados,
+            "reciclados": self.reciclados,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool():
+    """El pool se crea en el primer trabajo, así los procesos que no reciben imágenes no lo arrancan."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolInferencia(
+                    workers=getattr(settings, "INFERENCIA_WORKERS", 2),
+                    max_pendientes=getattr(settings, "INFERENCIA_MAX_PENDIENTES", 8),
+                    timeout=getattr(settings, "INFERENCIA_TIMEOUT", 15.0),
+                    modelos=getattr(settings, "INFERENCIA_MODELOS", []),
+                )
+    return _pool
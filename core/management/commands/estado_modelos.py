@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from core.modelos_ia import registro
+
+
+class Command(BaseCommand):
+    help = "Carga los modelos de IA indicados y muestra tiempo de carga y memoria de cada uno"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "modelos",
+            nargs="*",
+            help=f"Modelos a cargar ({', '.join(registro.nombres())}). Sin argumentos carga todos.",
+        )
+
+    def handle(self, *args, **options):
+        registro.precargar(options["modelos"] or None)
+
+        for nombre, info in registro.estado().items():
+            if info["cargado"]:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ {nombre}: {info['segundos_carga']}s, +{info['memoria_mb']} MB"
+                ))
+            elif info["error"]:
+                self.stdout.write(self.style.ERROR(f"❌ {nombre}: {info['error']}"))
+            else:
+                self.stdout.write(f"⏸️  {nombre}: no cargado")
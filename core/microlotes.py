@@ -0,0 +1,123 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+
+import numpy as np
+
+from .inferencia import PoolSaturado, TiempoAgotado
+
+logger = logging.getLogger(__name__)
+
+
+class Microlote:
+    """
+    Agrupa peticiones concurrentes en lotes para aprovechar la inferencia por lotes.
+
+    Cada llamador entrega un elemento con enviar() y se queda esperando. Un hilo de fondo
+    junta elementos hasta `max_lote` o hasta que pasan `espera_max` segundos desde el
+    primero, ejecuta funcion_lote(elementos) una sola vez y reparte cada resultado
+    a su llamador. funcion_lote debe devolver una lista del mismo tamaño y orden.
+    Con `hilos` > 1 se despachan varios lotes a la vez (uno por proceso del pool).
+    La cola admite como mucho `max_pendientes` elementos (0 = sin límite): por encima se
+    rechaza al instante con PoolSaturado, igual que el pool de inferencia.
+    """
+
+    def __init__(self, funcion_lote, max_lote=8, espera_max=0.01, hilos=1, max_pendientes=0, nombre="microlote"):
+        self.funcion_lote = funcion_lote
+        self.max_lote = max_lote
+        self.espera_max = espera_max
+        self.hilos = max(1, hilos)
+        self.nombre = nombre
+        self.max_pendientes = max_pendientes
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._hilos = []
+        self._lock = threading.Lock()
+        # Métricas: últimos tamaños de lote y latencias (segundos) por petición
+        self.lotes = 0
+        self.rechazados = 0
+        self.descartados = 0
+        self.tamanos = deque(maxlen=1000)
+        self.latencias = deque(maxlen=5000)
+
+    def _arrancar(self):
+        if len(self._hilos) == self.hilos:
+            return
+        with self._lock:
+            while len(self._hilos) < self.hilos:
+                hilo = threading.Thread(target=self._bucle, name=f"{self.nombre}-{len(self._hilos)}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def enviar(self, elemento, timeout=None):
+        """Encola el elemento y devuelve su resultado cuando termine el lote."""
+        self._arrancar()
+        futuro = Future()
+        inicio = time.perf_counter()
+        try:
+            self._cola.put_nowait((elemento, futuro))
+        except queue.Full:
+            self.rechazados += 1
+            raise PoolSaturado(f"{self.nombre}: más de {self.max_pendientes} peticiones en cola")
+        try:
+            return futuro.result(timeout=timeout)
+        except FuturesTimeoutError:
+            # Si aún no entró en un lote, el hilo de despacho lo salta y no gasta inferencia
+            futuro.cancel()
+            raise TiempoAgotado(f"{self.nombre}: el lote no terminó en {timeout}s")
+        finally:
+            self.latencias.append(time.perf_counter() - inicio)
+
+    def _tomar(self, timeout=None):
+        """Siguiente elemento cuyo llamador sigue esperando; los cancelados se descartan."""
+        while True:
+            elemento, futuro = self._cola.get(timeout=timeout)
+            # Pasa el futuro a "en curso": a partir de aquí el llamador ya no puede cancelarlo
+            if futuro.set_running_or_notify_cancel():
+                return elemento, futuro
+            self.descartados += 1
+
+    def _recolectar(self):
+        lote = [self._tomar()]
+        limite = time.perf_counter() + self.espera_max
+        while len(lote) < self.max_lote:
+            restante = limite - time.perf_counter()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._tomar(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _bucle(self):
+        while True:
+            lote = self._recolectar()
+            elementos = [elemento for elemento, _ in lote]
+            try:
+                resultados = self.funcion_lote(elementos)
+                if len(resultados) != len(lote):
+                    raise ValueError(f"{self.nombre}: se esperaban {len(lote)} resultados y llegaron {len(resultados)}")
+            except Exception as e:
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+            else:
+                for (_, futuro), resultado in zip(lote, resultados):
+                    futuro.set_result(resultado)
+
+            self.lotes += 1
+            self.tamanos.append(len(lote))
+
+    def estadisticas(self):
+        latencias = np.array(self.latencias) * 1000 if self.latencias else np.zeros(1)
+        return {
+            "lotes": self.lotes,
+            "rechazados": self.rechazados,
+            "descartados": self.descartados,
+            "tamano_medio": round(float(np.mean(self.tamanos)), 2) if self.tamanos else 0.0,
+            "p50_ms": round(float(np.percentile(latencias, 50)), 2),
+            "p99_ms": round(float(np.percentile(latencias, 99)), 2),
+        }
+
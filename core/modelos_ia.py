@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class ModeloNoDisponible(Exception):
+    """El modelo no está registrado o falló su carga."""
+
+
+def _memoria_rss():
+    """Memoria residente del proceso en bytes (Linux); 0 si no se puede leer."""
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class RegistroModelos:
+    """
+    Registro central de modelos de IA.
+    Cada modelo se carga la primera vez que se pide (o en una precarga explícita),
+    así los procesos que nunca atienden endpoints de imágenes no pagan TensorFlow ni YOLO.
+    """
+
+    def __init__(self, cargadores=None):
+        # nombre -> ruta importable de una función sin argumentos que devuelve el modelo
+        self._cargadores = dict(cargadores or {})
+        self._modelos = {}
+        self._info = {}
+        self._errores = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def registrar(self, nombre, cargador):
+        """`cargador` puede ser una función o su ruta importable ('app.modulo.funcion')."""
+        self._cargadores[nombre] = cargador
+
+    def nombres(self):
+        return list(self._cargadores)
+
+    def cargado(self, nombre):
+        return nombre in self._modelos
+
+    def _lock_de(self, nombre):
+        with self._lock:
+            return self._locks.setdefault(nombre, threading.Lock())
+
+    def obtener(self, nombre):
+        """Devuelve el modelo, cargándolo si es la primera vez."""
+        modelo = self._modelos.get(nombre)
+        if modelo is not None:
+            return modelo
+
+        if nombre not in self._cargadores:
+            raise ModeloNoDisponible(f"Modelo '{nombre}' no registrado")
+
+        with self._lock_de(nombre):
+            if nombre in self._modelos:
+                return self._modelos[nombre]
+            # No reintentamos en cada petición un modelo que ya falló
+            if nombre in self._errores:
+                raise ModeloNoDisponible(self._errores[nombre])
+
+            cargador = self._cargadores[nombre]
+            memoria_antes = _memoria_rss()
+            inicio = time.perf_counter()
+            try:
+                # Una ruta mal escrita en MODELOS_IA es un fallo de carga más
+                if isinstance(cargador, str):
+                    cargador = import_string(cargador)
+                modelo = cargador()
+            except Exception as e:
+                self._errores[nombre] = f"Error cargando modelo '{nombre}': {e}"
+                logger.error(self._errores[nombre])
+                raise ModeloNoDisponible(self._errores[nombre]) from e
+
+            self._info[nombre] = {
+                "segundos_carga": round(time.perf_counter() - inicio, 3),
+                "memoria_mb": round(max(0, _memoria_rss() - memoria_antes) / 1024 / 1024, 1),
+            }
+            self._modelos[nombre] = modelo
+            logger.info(
+                f"Modelo '{nombre}' cargado en {self._info[nombre]['segundos_carga']}s "
+                f"(+{self._info[nombre]['memoria_mb']} MB)"
+            )
+            return modelo
+
+    def reemplazar(self, nombre, modelo):
+        """Sustituye el modelo cargado por otro ya construido (la asignación es atómica)."""
+        self._modelos[nombre] = modelo
+        self._errores.pop(nombre, None)
+
+    def descargar(self, nombre):
+        """Olvida el modelo; se volverá a cargar en el siguiente uso."""
+        with self._lock_de(nombre):
+            self._modelos.pop(nombre, None)
+            self._errores.pop(nombre, None)
+            self._info.pop(nombre, None)
+
+    def precargar(self, nombres=None):
+        """Hook de arranque: carga ahora los modelos indicados (o todos)."""
+        for nombre in nombres if nombres is not None else self.nombres():
+            try:
+                self.obtener(nombre)
+            except ModeloNoDisponible:
+                pass
+
+    def estado(self):
+        """Tiempo de carga y memoria de cada modelo registrado."""
+        return {
+            nombre: {
+                "cargado": nombre in self._modelos,
+                "error": self._errores.get(nombre),
+                **self._info.get(nombre, {}),
+            }
+            for nombre in self._cargadores
+        }
+
+
+registro = RegistroModelos(getattr(settings, "MODELOS_IA", {}))
+
+
+def precargar_desde_settings():
+    """
+    Se llama desde wsgi.py/asgi.py. Solo precarga lo que pida MODELOS_IA_PRECARGA,
+    p. ej. MODELOS_IA_PRECARGA=mobilenet,yolo en los workers de imágenes.
+    """
+    nombres = [n for n in getattr(settings, "MODELOS_IA_PRECARGA", []) if n]
+    if nombres:
+        registro.precargar(nombres)
@@ -1,3 +1,257 @@
-from django.test import TestCase
+import io
+import threading
+import time
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from .cache_resultados import CacheResultados, invalidar_cache, obtener_cache
+from .imagenes import ImagenDecodificada, ImagenInvalida
+from .inferencia import PoolInferencia, PoolSaturado, TiempoAgotado
+from .microlotes import Microlote
+from .modelos_ia import ModeloNoDisponible, RegistroModelos
+from .versiones import VersionCompartida
+
+
+def esperar(condicion, segundos=10):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        if time.monotonic() > limite:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class MicroloteTests(SimpleTestCase):
+    def test_agrupa_peticiones_concurrentes(self):
+        lotes = []
+
+        def duplicar(elementos):
+            lotes.append(list(elementos))
+            return [2 * e for e in elementos]
+
+        microlote = Microlote(duplicar, max_lote=4, espera_max=0.2)
+        resultados = {}
+        hilos = [threading.Thread(target=lambda i=i: resultados.update({i: microlote.enviar(i, timeout=5)})) for i in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(resultados, {i: 2 * i for i in range(4)})
+        self.assertLess(len(lotes), 4)
+
+    def test_cola_llena_rechaza_al_instante(self):
+        empezado, liberar = threading.Event(), threading.Event()
+
+        def bloquear(elementos):
+            empezado.set()
+            liberar.wait(5)
+            return elementos
+
+        microlote = Microlote(bloquear, max_lote=1, espera_max=0, max_pendientes=1)
+        self.addCleanup(liberar.set)
+
+        # Uno ocupa el hilo de despacho y otro la única plaza de la cola
+        threading.Thread(target=microlote.enviar, args=(0,), kwargs={"timeout": 5}, daemon=True).start()
+        self.assertTrue(empezado.wait(5))
+        threading.Thread(target=microlote.enviar, args=(1,), kwargs={"timeout": 5}, daemon=True).start()
+        self.assertTrue(esperar(microlote._cola.full))
+
+        inicio = time.monotonic()
+        with self.assertRaises(PoolSaturado):
+            microlote.enviar(2, timeout=5)
+        self.assertLess(time.monotonic() - inicio, 0.5)
+        self.assertEqual(microlote.rechazados, 1)
+
+    def test_peticion_abandonada_no_llega_al_modelo(self):
+        procesados = []
+        empezado, liberar = threading.Event(), threading.Event()
+
+        def lento(elementos):
+            empezado.set()
+            liberar.wait(5)
+            procesados.extend(elementos)
+            return elementos
+
+        microlote = Microlote(lento, max_lote=1, espera_max=0)
+        self.addCleanup(liberar.set)
+        threading.Thread(target=microlote.enviar, args=("primero",), kwargs={"timeout": 5}, daemon=True).start()
+        self.assertTrue(empezado.wait(5))
+
+        with self.assertRaises(TiempoAgotado):
+            microlote.enviar("abandonado", timeout=0.1)
+        liberar.set()
+
+        self.assertTrue(esperar(lambda: microlote.descartados == 1))
+        self.assertEqual(procesados, ["primero"])
+
+
+class PoolInferenciaTests(SimpleTestCase):
+    def test_sin_workers_respeta_el_limite_de_pendientes(self):
+        pool = PoolInferencia(workers=0, max_pendientes=1)
+        self.assertEqual(pool.enviar(sum, [1, 2, 3]), 6)
+        self.assertEqual(pool._cupos._value, 1)
+
+    def test_trabajo_colgado_recicla_el_pool(self):
+        pool = PoolInferencia(workers=1, max_pendientes=2, timeout=1)
+        self.addCleanup(lambda: pool._executor and pool._executor.shutdown(wait=False, cancel_futures=True))
+        # El primer trabajo arranca el proceso (Django incluido) sin prisa
+        pool.enviar(time.sleep, 0, timeout=60)
+
+        with self.assertRaises(TiempoAgotado):
+            pool.enviar(time.sleep, 60)
+
+        self.assertTrue(esperar(lambda: pool.reciclados == 1))
+        self.assertTrue(esperar(lambda: pool._cupos._value == 2))
+        self.assertIsNone(pool.enviar(time.sleep, 0, timeout=60))
+
+
+class CacheResultadosTests(SimpleTestCase):
+    def test_hash_parecido_en_la_misma_celda_reutiliza_el_resultado(self):
+        cache = CacheResultados("prueba")
+        cache.guardar(("ff00ff00ff00ff00", (1, 2)), "lejano")
+        cache.guardar(("ff00ff00ff00ff0f", (1, 2)), "cercano")
+
+        # A 1 bit de "cercano" y a 3 de "lejano": gana el más cercano
+        self.assertEqual(cache.obtener_parecido("ff00ff00ff00ff0e", (1, 2), radio=4), "cercano")
+        self.assertEqual(cache.aciertos_parecidos, 1)
+        # Exacto sin radio, y nada fuera del radio o de la celda
+        self.assertEqual(cache.obtener_parecido("ff00ff00ff00ff00", (1, 2)), "lejano")
+        self.assertIsNone(cache.obtener_parecido("ff00ff00ff00ff0e", (1, 2)))
+        self.assertIsNone(cache.obtener_parecido("ff00ff00ff0000ff", (1, 2), radio=4))
+        self.assertIsNone(cache.obtener_parecido("ff00ff00ff00ff0e", (9, 9), radio=4))
+
+    def test_entradas_caducadas_no_cuentan_como_parecidas(self):
+        cache = CacheResultados("prueba", ttl=0)
+        cache.guardar(("ff00ff00ff00ff00", None), "viejo")
+        self.assertIsNone(cache.obtener_parecido("ff00ff00ff00ff01", None, radio=4))
+
+
+class VersionCompartidaTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cambio_en_otro_proceso_deja_la_copia_obsoleta(self):
+        local = VersionCompartida("prueba")
+        self.assertFalse(local.vigente())
+        local.marcar(local.leer())
+        self.assertTrue(local.vigente())
+
+        # Otro worker (otra instancia con el mismo nombre) publica un cambio
+        VersionCompartida("prueba").incrementar()
+        self.assertFalse(local.vigente())
+
+    def test_cambio_aplicado_en_la_propia_copia_la_mantiene_vigente(self):
+        local = VersionCompartida("prueba")
+        local.marcar(local.leer())
+        local.incrementar(aplicado=True)
+        self.assertTrue(local.vigente())
+
+    @override_settings(INDICES_TTL=0)
+    def test_copias_caducan_aunque_nadie_avise(self):
+        local = VersionCompartida("prueba")
+        sin_ttl = VersionCompartida("prueba", caduca=False)
+        local.marcar(local.leer())
+        sin_ttl.marcar(sin_ttl.leer())
+        time.sleep(0.01)
+        self.assertFalse(local.vigente())
+        self.assertTrue(sin_ttl.vigente())
+
+    def test_invalidar_cache_desde_otro_proceso_la_vacia(self):
+        resultados = obtener_cache("prueba_versiones")
+        resultados.guardar("clave", "valor")
+        # Lo que haría invalidar_cache en otro worker: solo incrementa la versión compartida
+        VersionCompartida("cache_prueba_versiones").incrementar()
+        self.assertIsNone(obtener_cache("prueba_versiones").obtener("clave"))
+
+        obtener_cache("prueba_versiones").guardar("clave", "valor")
+        invalidar_cache("prueba_versiones")
+        self.assertIsNone(obtener_cache("prueba_versiones").obtener("clave"))
+
+
+def bytes_imagen(img, formato="JPEG", **opciones):
+    buffer = io.BytesIO()
+    img.save(buffer, format=formato, **opciones)
+    return buffer.getvalue()
+
+
+class ImagenDecodificadaTests(SimpleTestCase):
+    def test_aplica_la_orientacion_exif(self):
+        # Foto de móvil 40x20 guardada con "rotar 90°" (Orientation=6) en el EXIF
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        foto = ImagenDecodificada.desde_archivo(io.BytesIO(bytes_imagen(Image.new("RGB", (40, 20)), exif=exif)))
+        self.assertEqual(foto.tamano, (20, 40))
+
+    def test_versiones_para_cada_modelo(self):
+        foto = ImagenDecodificada(Image.new("RGB", (1280, 960), (255, 0, 0)))
+        self.assertEqual(foto.para_mobilenet().shape, (224, 224, 3))
+        yolo = foto.para_yolo()
+        self.assertEqual(yolo.shape, (480, 640, 3))
+        # BGR para Ultralytics
+        self.assertEqual(yolo[0, 0].tolist(), [0, 0, 255])
+        self.assertIs(foto.para_yolo(), yolo)
+        # La imagen original no se toca
+        self.assertEqual(foto.tamano, (1280, 960))
+
+    def test_recompresion_mantiene_el_hash(self):
+        img = Image.linear_gradient("L").convert("RGB").resize((300, 200))
+        original = ImagenDecodificada.desde_archivo(io.BytesIO(bytes_imagen(img, quality=95)))
+        recomprimida = ImagenDecodificada.desde_archivo(io.BytesIO(bytes_imagen(img.resize((240, 160)), quality=60)))
+        self.assertEqual(original.dhash(), recomprimida.dhash())
+
+    def test_bytes_que_no_son_imagen(self):
+        with self.assertRaises(ImagenInvalida):
+            ImagenDecodificada.desde_archivo(io.BytesIO(b"no soy una foto"))
+
+
+class RegistroModelosTests(SimpleTestCase):
+    def test_carga_en_el_primer_uso_y_una_sola_vez(self):
+        cargas = []
+        registro = RegistroModelos({"eco": lambda: cargas.append(1) or object()})
+        self.assertFalse(registro.cargado("eco"))
+        self.assertEqual(cargas, [])
+
+        modelo = registro.obtener("eco")
+        self.assertIs(registro.obtener("eco"), modelo)
+        self.assertEqual(cargas, [1])
+        self.assertTrue(registro.estado()["eco"]["cargado"])
+
+    def test_acepta_rutas_importables(self):
+        registro = RegistroModelos({"suma": "builtins.dict"})
+        self.assertEqual(registro.obtener("suma"), {})
+
+    def test_un_fallo_no_se_reintenta_hasta_descargar(self):
+        intentos = []
+
+        def romper():
+            intentos.append(1)
+            raise OSError("pesos no encontrados")
+
+        registro = RegistroModelos({"roto": romper})
+        for _ in range(2):
+            with self.assertRaises(ModeloNoDisponible):
+                registro.obtener("roto")
+        self.assertEqual(len(intentos), 1)
+        self.assertIn("pesos no encontrados", registro.estado()["roto"]["error"])
+
+        registro.descargar("roto")
+        with self.assertRaises(ModeloNoDisponible):
+            registro.obtener("roto")
+        self.assertEqual(len(intentos), 2)
+
+        registro.reemplazar("roto", "modelo nuevo")
+        self.assertEqual(registro.obtener("roto"), "modelo nuevo")
+
+    def test_modelo_no_registrado(self):
+        with self.assertRaises(ModeloNoDisponible):
+            RegistroModelos().obtener("fantasma")
+
+    def test_precarga_solo_lo_pedido_y_tolera_fallos(self):
+        registro = RegistroModelos({"a": object, "b": object, "roto": "no.existe"})
+        registro.precargar(["a", "roto"])
+        self.assertTrue(registro.cargado("a"))
+        self.assertFalse(registro.cargado("b"))
+        self.assertFalse(registro.cargado("roto"))
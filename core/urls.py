@@ -14,5 +14,6 @@ urlpatterns = [
     path("mapa/", views.MapView.as_view(), name="map"),
     path("favoritos/", views.favoritos, name="favoritos"),
     path("toggle-favorito/", views.toggle_favorito, name="toggle_favorito"),
+    path("estado/cache-ia/", views.estado_cache_ia, name="estado_cache_ia"),
 
 ]
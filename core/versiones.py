@@ -0,0 +1,82 @@
+"""
+Versiones compartidas entre procesos para las copias en memoria (índices y cachés).
+
+Cada worker construye su propia copia (BallTree, índice de embeddings, caché de
+resultados) y anota con qué versión lo hizo. Quien cambia los datos incrementa la
+versión en la caché de Django (INDICES_CACHE) y el resto de procesos, al ver que ya no
+coincide, descarta su copia en la siguiente petición. Así también se enteran de las
+cargas hechas con comandos de gestión.
+
+Con la caché en memoria del proceso (LocMemCache) la versión no sale de él: por eso
+cada copia caduca además a los INDICES_TTL segundos. Con REDIS_URL el aviso es inmediato.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[getattr(settings, "INDICES_CACHE", "default")]
+
+
+def _clave(nombre):
+    return f"indices:version:{nombre}"
+
+
+class VersionCompartida:
+    """Versión de una copia local frente a la publicada en la caché compartida."""
+
+    def __init__(self, nombre, caduca=True):
+        # caduca=False para copias que ya tienen su propio TTL (p. ej. CacheResultados)
+        self.nombre = nombre
+        self.caduca = caduca
+        self._local = None
+        self._desde = 0.0
+        self._lock = threading.Lock()
+
+    def leer(self):
+        """Versión publicada (0 si nadie la ha incrementado aún). Léela antes de construir la copia."""
+        try:
+            return _cache().get(_clave(self.nombre), 0)
+        except Exception as e:
+            logger.warning(f"No se pudo leer la versión de '{self.nombre}': {e}")
+            return self._local
+
+    def marcar(self, version):
+        """La copia local se construyó con `version`."""
+        with self._lock:
+            self._local = version
+            self._desde = time.monotonic()
+
+    def vigente(self):
+        """False si la copia es de otra versión o tiene más de INDICES_TTL segundos."""
+        if self._local is None:
+            return False
+        if self.caduca and time.monotonic() - self._desde > getattr(settings, "INDICES_TTL", 300):
+            return False
+        return self.leer() == self._local
+
+    def incrementar(self, aplicado=False):
+        """
+        Avisa a los demás procesos de que sus copias quedaron obsoletas.
+        Con `aplicado` la copia de este proceso ya incluye el cambio y sigue vigente
+        (salvo que otro proceso haya incrementado a la vez).
+        """
+        clave = _clave(self.nombre)
+        try:
+            cache = _cache()
+            if cache.add(clave, 1, timeout=None):
+                nueva = 1
+            else:
+                nueva = cache.incr(clave)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar la versión de '{self.nombre}': {e}")
+            return
+        with self._lock:
+            if aplicado and self._local is not None and nueva == self._local + 1:
+                self._local = nueva
@@ -16,6 +16,8 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Case, When, IntegerField, Value, Q
 from turismo.models import SitioTuristico
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from .cache_resultados import estado_caches
 
 #################################################################################
 @login_required(login_url='login')
@@ -175,3 +177,10 @@ def toggle_favorito(request):
             "favorito": True,
             "mensaje": "Guardado en sitios favoritos"
         })
+
+
+######## estado ##########
+@staff_member_required
+def estado_cache_ia(request):
+    """Aciertos, desalojos y memoria de las cachés de IA de este proceso."""
+    return JsonResponse(estado_caches())
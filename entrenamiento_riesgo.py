@@ -1,32 +1,237 @@
+"""
+Entrena el modelo de zonas de riesgo a partir de datos_delitos_ecuador_listo.csv.
+
+Cada entrenamiento se guarda como una versión en riesgo/modelos/<version>/ con su
+metadata, y riesgo/modelos/manifest.json apunta a la versión activa. El API lee el
+manifest, así que se puede cambiar de modelo sin tocar los workers.
+
+Uso:
+    python entrenamiento_riesgo.py                         # entrenamiento completo (50 zonas)
+    python entrenamiento_riesgo.py --barrido 20 30 40 50 80  # compara n_clusters en paralelo
+    python entrenamiento_riesgo.py --incremental           # solo suma los años nuevos del CSV
+"""
+import argparse
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 import joblib
-import json
 
+RUTA_CSV = 'datos_delitos_ecuador_listo.csv'
+DIR_MODELOS = 'riesgo/modelos'
+RUTA_MANIFEST = os.path.join(DIR_MODELOS, 'manifest.json')
+N_CLUSTERS = 50
+# Muestra para silhouette (es O(n²) en memoria)
+MUESTRA_SILHOUETTE = 5000
+
+# Columnas por tipo de delito: su suma pondera cada fila y el API desglosa el riesgo de cada zona entre ellas
+CATEGORIAS = ['ASESINATO', 'FEMICIDIO', 'HOMICIDIO', 'SICARIATO']
+
+
+def cargar_datos(ruta):
+    df = pd.read_csv(ruta)
+    df = df.dropna(subset=['latitud', 'longitud'])
+    df[CATEGORIAS] = df[CATEGORIAS].fillna(0)
+    # Suma de las columnas por delito en vez de TOTAL: en algunas filas TOTAL se leyó con el
+    # separador de miles como decimal (Guayas 2023: 1.016 frente a 1016 delitos desglosados)
+    df['peso_riesgo'] = df[CATEGORIAS].sum(axis=1)
+    return df
+
+
+def coordenadas(df):
+    return df[['latitud', 'longitud']].to_numpy(dtype=np.float64)
+
+
+def pesos(df):
+    """Peso de cada fila en el clustering: los delitos atraen los centroides y ninguna fila pesa 0."""
+    return 1.0 + df['peso_riesgo'].to_numpy(dtype=np.float64)
+
+
+def entrenar(X, n_clusters, peso):
+    """MiniBatchKMeans en vez de KMeans para poder sumar datos nuevos con partial_fit."""
+    modelo = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=10, batch_size=1024)
+    etiquetas = modelo.fit_predict(X, sample_weight=peso)
+    return modelo, etiquetas
+
+
+def evaluar(X, peso, n_clusters):
+    """Entrena con n_clusters y devuelve sus métricas (se ejecuta en paralelo en el barrido)."""
+    modelo, etiquetas = entrenar(X, n_clusters, peso)
+    silhouette = silhouette_score(
+        X, etiquetas, sample_size=min(MUESTRA_SILHOUETTE, len(X)), random_state=42
+    )
+    return {
+        'n_clusters': n_clusters,
+        'inercia': float(modelo.inertia_),
+        'silhouette': float(silhouette),
+        'modelo': modelo,
+    }
+
+
+def barrido(X, peso, valores, jobs):
+    resultados = joblib.Parallel(n_jobs=jobs)(
+        joblib.delayed(evaluar)(X, peso, k) for k in valores
+    )
+    print(f"{'n_clusters':>10} {'inercia':>12} {'silhouette':>10}")
+    for r in resultados:
+        print(f"{r['n_clusters']:>10} {r['inercia']:>12.4f} {r['silhouette']:>10.4f}")
+    mejor = max(resultados, key=lambda r: r['silhouette'])
+    print(f"Mejor silhouette: n_clusters={mejor['n_clusters']}")
+    return mejor
+
+
+def riesgo_por_zona(df, modelo):
+    """Riesgo 0-10 por cluster: total de delitos normalizado entre el cluster mínimo y el máximo."""
+    df = df.copy()
+    df['cluster_id'] = modelo.predict(coordenadas(df))
+    riesgo_por_cluster = df.groupby('cluster_id')['peso_riesgo'].sum()
+
+    max_delitos = riesgo_por_cluster.max()
+    min_delitos = riesgo_por_cluster.min()
+
+    riesgo_normalizado = (riesgo_por_cluster - min_delitos) / (max_delitos - min_delitos) * 10
+    return riesgo_normalizado.round(1)  # Redondear a 1 decimal
+
+
+def reparto_delitos(df, modelo):
+    """Proporción de cada tipo de delito en cada zona: (cluster, delito), cada fila suma 1."""
+    k = modelo.n_clusters
+    cluster_ids = modelo.predict(coordenadas(df))
+    aportes = np.zeros((k, len(CATEGORIAS)))
+    for j, c in enumerate(CATEGORIAS):
+        aportes[:, j] = np.bincount(cluster_ids, weights=df[c].to_numpy(), minlength=k)
+
+    totales = aportes.sum(axis=1, keepdims=True)
+    # Zonas sin delitos desglosados: reparto uniforme
+    return np.divide(aportes, totales, out=np.full_like(aportes, 1 / len(CATEGORIAS)), where=totales > 0)
+
+
+def leer_manifest():
+    if not os.path.exists(RUTA_MANIFEST):
+        return {'activa': None, 'versiones': []}
+    with open(RUTA_MANIFEST) as f:
+        return json.load(f)
+
+
+def escribir_json_atomico(ruta, datos):
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def sha256_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def guardar_version(modelo, riesgo_normalizado, df, metadata, activar=True):
+    """
+    Escribe los artefactos en un directorio temporal, lo renombra a riesgo/modelos/<version>/
+    y después actualiza el manifest. Un lector nunca ve una versión a medio escribir.
+    """
+    # Fecha para ordenar + sufijo aleatorio: dos entrenamientos en el mismo segundo no chocan
+    version = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    destino = os.path.join(DIR_MODELOS, version)
+    temporal = os.path.join(DIR_MODELOS, f'.{version}.tmp')
+    os.makedirs(temporal)
+
+    joblib.dump(modelo, os.path.join(temporal, 'modelo_zonas.pkl'))
+    with open(os.path.join(temporal, 'datos_riesgo.json'), 'w') as f:
+        json.dump(riesgo_normalizado.to_dict(), f)
+
+    # Centroides + riesgo por cluster en un array compacto para la consulta rápida (argmin en NumPy)
+    riesgo_array = np.array([riesgo_normalizado.get(i, 0) for i in range(modelo.n_clusters)], dtype=np.float64)
+    np.savez(
+        os.path.join(temporal, 'centroides_riesgo.npz'),
+        centroides=modelo.cluster_centers_.astype(np.float64),
+        riesgo=riesgo_array,
+        reparto=reparto_delitos(df, modelo).astype(np.float32),
+        categorias=np.array(CATEGORIAS),
+    )
+
+    metadata = {
+        'version': version,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'n_clusters': int(modelo.n_clusters),
+        'filas': int(len(df)),
+        'anios': sorted(int(a) for a in df['AÑO'].dropna().unique()),
+        'csv_sha256': sha256_archivo(RUTA_CSV),
+        'inercia': float(modelo.inertia_) if hasattr(modelo, 'inertia_') else None,
+        'peso': '+'.join(CATEGORIAS),
+        **metadata,
+    }
+    escribir_json_atomico(os.path.join(temporal, 'metadata.json'), metadata)
+    os.replace(temporal, destino)
+
+    manifest = leer_manifest()
+    manifest['versiones'].append({
+        k: metadata.get(k) for k in ('version', 'fecha', 'tipo', 'n_clusters', 'silhouette', 'inercia', 'filas')
+    })
+    if activar:
+        manifest['activa'] = version
+    escribir_json_atomico(RUTA_MANIFEST, manifest)
+    return version
 
-df = pd.read_csv('datos_delitos_ecuador_listo.csv')
-df = df.dropna(subset=['latitud', 'longitud', 'TOTAL'])
-df['peso_riesgo'] = df['TOTAL'] 
 
-X = df[['latitud', 'longitud']]
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el modelo de zonas de riesgo")
+    parser.add_argument('--n-clusters', type=int, help=f"Número de zonas (por defecto {N_CLUSTERS} o el mejor del barrido)")
+    parser.add_argument('--barrido', type=int, nargs='+', metavar='K', help="Valores de n_clusters a comparar")
+    parser.add_argument('--jobs', type=int, default=-1, help="Procesos para el barrido (-1 = todos los núcleos)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Actualiza la versión activa con partial_fit usando solo los años nuevos del CSV")
+    parser.add_argument('--sin-activar', action='store_true', help="Guarda la versión sin activarla en el manifest")
+    args = parser.parse_args()
 
-kmeans = KMeans(n_clusters=50, random_state=42, n_init=10)
-df['cluster_id'] = kmeans.fit_predict(X)
+    os.makedirs(DIR_MODELOS, exist_ok=True)
+    df = cargar_datos(RUTA_CSV)
+    X = coordenadas(df)
+    peso = pesos(df)
 
-riesgo_por_cluster = df.groupby('cluster_id')['TOTAL'].sum()
+    if args.incremental:
+        manifest = leer_manifest()
+        if not manifest['activa']:
+            raise SystemExit("No hay una versión activa; ejecuta primero un entrenamiento completo.")
+        dir_activa = os.path.join(DIR_MODELOS, manifest['activa'])
+        modelo = joblib.load(os.path.join(dir_activa, 'modelo_zonas.pkl'))
+        with open(os.path.join(dir_activa, 'metadata.json')) as f:
+            anterior = json.load(f)
 
-max_delitos = riesgo_por_cluster.max()
-min_delitos = riesgo_por_cluster.min()
+        nuevos = df[~df['AÑO'].isin(anterior['anios'])]
+        if nuevos.empty:
+            print("No hay años nuevos en el CSV; nada que actualizar.")
+            return
+        # Los centroides se ajustan con los datos nuevos; el riesgo se recalcula con todo el histórico
+        modelo.partial_fit(coordenadas(nuevos), sample_weight=pesos(nuevos))
+        metadata = {'tipo': 'incremental', 'padre': manifest['activa'], 'filas_nuevas': int(len(nuevos))}
+        print(f"partial_fit con {len(nuevos)} filas nuevas (años {sorted(int(a) for a in nuevos['AÑO'].unique())}).")
+    elif args.barrido:
+        mejor = barrido(X, peso, sorted(set(args.barrido)), args.jobs)
+        if args.n_clusters and args.n_clusters != mejor['n_clusters']:
+            mejor = evaluar(X, peso, args.n_clusters)
+        modelo = mejor['modelo']
+        metadata = {'tipo': 'completo', 'silhouette': mejor['silhouette'], 'barrido': sorted(set(args.barrido))}
+    else:
+        n_clusters = args.n_clusters or N_CLUSTERS
+        resultado = evaluar(X, peso, n_clusters)
+        modelo = resultado['modelo']
+        metadata = {'tipo': 'completo', 'silhouette': resultado['silhouette']}
 
-riesgo_normalizado = (riesgo_por_cluster - min_delitos) / (max_delitos - min_delitos) * 10
-riesgo_normalizado = riesgo_normalizado.round(1) # Redondear a 1 decimal
+    riesgo_normalizado = riesgo_por_zona(df, modelo)
+    version = guardar_version(modelo, riesgo_normalizado, df, metadata, activar=not args.sin_activar)
 
-joblib.dump(kmeans, 'riesgo/modelo_zonas.pkl')
+    print("Entrenamiento finalizado.")
+    print(f"   Versión {version}{' (activa)' if not args.sin_activar else ''} en {os.path.join(DIR_MODELOS, version)}")
+    print(f"   Se generaron {len(riesgo_normalizado)} zonas de riesgo.")
+    print(f"   Ejemplo: La zona {riesgo_normalizado.idxmax()} tiene el riesgo más alto ({riesgo_normalizado.max()}).")
 
-with open('riesgo/datos_riesgo.json', 'w') as f:
-    json.dump(riesgo_normalizado.to_dict(), f)
 
-print("Entrenamiento finalizado.")
-print(f"   Se generaron {len(riesgo_normalizado)} zonas de riesgo.")
-print(f"   Ejemplo: La zona {riesgo_normalizado.idxmax()} tiene el riesgo más alto ({riesgo_normalizado.max()}).")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,17 @@
-from ultralytics import YOLO
+import threading
 from collections import Counter
 
-# Cargar modelo YOLOv8 (ligero)
-model = YOLO("yolov8n.pt")
+from django.conf import settings
+
+from core.modelos_ia import registro
+
+
+def cargar_modelo():
+    """Cargar modelo YOLOv8 (ligero). Lo llama el registro de modelos en el primer uso."""
+    from ultralytics import YOLO
+
+    return YOLO("yolov8n.pt")
+
 
 # Clases que consideramos "emprendimientos"
 EMPRENDIMIENTOS = {
@@ -15,20 +24,14 @@ EMPRENDIMIENTOS = {
     "hotel"
 }
 
-def analizar_imagen(ruta_imagen):
-    """
-    Analiza una imagen y devuelve contexto del lugar
-    """
-
-    results = model(ruta_imagen, verbose=False)
-
+def _contexto(resultado, nombres):
+    """Convierte las detecciones de una imagen en el contexto del lugar"""
     detecciones = []
 
-    for r in results:
-        for box in r.boxes:
-            clase_id = int(box.cls[0])
-            clase_nombre = model.names[clase_id]
-            detecciones.append(clase_nombre)
+    for box in resultado.boxes:
+        clase_id = int(box.cls[0])
+        clase_nombre = nombres[clase_id]
+        detecciones.append(clase_nombre)
 
     conteo = Counter(detecciones)
 
@@ -49,3 +52,47 @@ def analizar_imagen(ruta_imagen):
         "total_emprendimientos": total_emprendimientos,
         "tipo_zona": tipo_zona
     }
+
+def analizar_imagenes(imagenes):
+    """
+    Analiza varias imágenes en una sola pasada de YOLO y devuelve un contexto por imagen.
+    Cada imagen puede ser una ruta o un array BGR (ImagenDecodificada.para_yolo)
+    """
+    model = registro.obtener("yolo")
+    results = model(list(imagenes), verbose=False)
+    return [_contexto(r, model.names) for r in results]
+
+def analizar_imagen(imagen):
+    """
+    Analiza una imagen y devuelve contexto del lugar
+    """
+    return analizar_imagenes([imagen])[0]
+
+
+# --- MICRO-LOTES ---
+_microlote = None
+_microlote_lock = threading.Lock()
+
+def analizar_imagen_en_lote(imagen):
+    """
+    Igual que analizar_imagen, pero junta las peticiones concurrentes en un lote
+    que se ejecuta en el pool de inferencia
+    """
+    global _microlote
+    from core.inferencia import obtener_pool
+
+    if _microlote is None:
+        from core.microlotes import Microlote
+
+        with _microlote_lock:
+            if _microlote is None:
+                _microlote = Microlote(
+                    lambda imagenes: obtener_pool().enviar(analizar_imagenes, imagenes),
+                    max_lote=getattr(settings, "MICROLOTE_MAX", 8),
+                    espera_max=getattr(settings, "MICROLOTE_ESPERA_MS", 10) / 1000,
+                    hilos=max(1, getattr(settings, "INFERENCIA_WORKERS", 1)),
+                    max_pendientes=getattr(settings, "MICROLOTE_MAX_COLA", 64),
+                    nombre="microlote-yolo",
+                )
+    # Mismo plazo que el pool: quien espera más que eso ya no va a usar la respuesta
+    return _microlote.enviar(imagen, timeout=obtener_pool().timeout)
@@ -3,9 +3,12 @@ from django.http import JsonResponse
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-import tempfile
 
-from .services import analizar_imagen
+from .services import analizar_imagen_en_lote
+from core.modelos_ia import ModeloNoDisponible
+from core.inferencia import PoolSaturado, TiempoAgotado
+from core.imagenes import ImagenDecodificada, ImagenInvalida
+from core.cache_resultados import obtener_cache, radio_hamming
 
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -20,13 +23,39 @@ class ReconocerImagenView(View):
                 status=400
             )
 
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            for chunk in imagen.chunks():
-                temp.write(chunk)
-            ruta = temp.name
+        # Decodificamos en memoria; ya no quedan archivos temporales en disco
+        try:
+            foto = ImagenDecodificada.desde_archivo(imagen)
+        except ImagenInvalida:
+            return JsonResponse(
+                {"error": "El archivo no es una imagen válida"},
+                status=400
+            )
 
-        etiquetas = analizar_imagen(ruta)
+        # Las etiquetas de YOLO solo dependen de la imagen: la clave es su hash perceptual
+        cache = obtener_cache("reconocimiento")
+        etiquetas = cache.obtener_parecido(foto.dhash(), radio=radio_hamming())
+        if etiquetas is not None:
+            return JsonResponse({
+                "etiquetas_detectadas": etiquetas
+            })
+
+        try:
+            etiquetas = analizar_imagen_en_lote(foto.para_yolo())
+        except (PoolSaturado, TiempoAgotado):
+            response = JsonResponse(
+                {"error": "Servicio de reconocimiento saturado, intenta de nuevo"},
+                status=503
+            )
+            response["Retry-After"] = "2"
+            return response
+        except ModeloNoDisponible:
+            return JsonResponse(
+                {"error": "Modelo de reconocimiento no disponible"},
+                status=503
+            )
 
+        cache.guardar((foto.dhash(), None), etiquetas)
         return JsonResponse({
             "etiquetas_detectadas": etiquetas
         })
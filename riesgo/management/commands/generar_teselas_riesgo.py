@@ -0,0 +1,127 @@
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.geografia import ECUADOR_BBOX
+from core.modelos_ia import ModeloNoDisponible
+from riesgo.services import obtener_modelo, calcular_riesgo
+
+# Conjuntos de teselas: la hora representativa de cada uno decide el factor nocturno
+CONJUNTOS = {
+    "dia": 12,
+    "noche": 23,
+}
+
+# Paleta del semáforo: índice 0 transparente, 1 verde, 2 amarillo, 3 rojo
+PALETA = [0, 0, 0, 40, 167, 69, 255, 193, 7, 220, 53, 69]
+ALFA = 90
+
+
+def tesela_a_lon(x, z):
+    return x / (2 ** z) * 360.0 - 180.0
+
+
+def tesela_a_lat(y, z):
+    n = math.pi * (1 - 2 * y / (2 ** z))
+    return math.degrees(math.atan(math.sinh(n)))
+
+
+def lon_a_tesela(lon, z):
+    return int((lon + 180.0) / 360.0 * (2 ** z))
+
+
+def lat_a_tesela(lat, z):
+    lat_rad = math.radians(lat)
+    return int((1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * (2 ** z))
+
+
+class Command(BaseCommand):
+    help = "Rasteriza el modelo de riesgo de Ecuador en una pirámide de teselas PNG z/x/y"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zoom-min", type=int, default=6)
+        parser.add_argument("--zoom-max", type=int, default=10)
+        parser.add_argument("--tamano", type=int, default=256, help="Píxeles por lado de cada tesela")
+        parser.add_argument(
+            "--salida",
+            default=str(Path(settings.BASE_DIR) / "static" / "riesgo" / "teselas"),
+            help="Carpeta de salida (por defecto dentro de static/ para servirla como archivo estático)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            modelo = obtener_modelo()
+        except ModeloNoDisponible:
+            self.stdout.write(self.style.ERROR("❌ Modelo de riesgo no cargado."))
+            return
+
+        salida = Path(options["salida"])
+        tamano = options["tamano"]
+        sur, oeste, norte, este = ECUADOR_BBOX
+        inicio = time.perf_counter()
+        total = 0
+
+        for nombre, hora in CONJUNTOS.items():
+            self.stdout.write(self.style.MIGRATE_LABEL(f"\n--- Conjunto: {nombre} ---"))
+
+            for z in range(options["zoom_min"], options["zoom_max"] + 1):
+                x_min, x_max = lon_a_tesela(oeste, z), lon_a_tesela(este, z)
+                y_min, y_max = lat_a_tesela(norte, z), lat_a_tesela(sur, z)
+                generadas = 0
+
+                for x in range(x_min, x_max + 1):
+                    for y in range(y_min, y_max + 1):
+                        img = self.rasterizar(modelo, x, y, z, tamano, hora)
+                        if img is None:
+                            continue
+                        ruta = salida / nombre / str(z) / str(x) / f"{y}.png"
+                        ruta.parent.mkdir(parents=True, exist_ok=True)
+                        img.save(ruta, optimize=True, transparency=bytes([0, ALFA, ALFA, ALFA]))
+                        generadas += 1
+
+                total += generadas
+                self.stdout.write(f"  z={z}: {generadas} teselas")
+
+        metadatos = {
+            "conjuntos": list(CONJUNTOS),
+            "version_modelo": modelo.version,
+            "zoom_min": options["zoom_min"],
+            "zoom_max": options["zoom_max"],
+            "bbox": ECUADOR_BBOX,
+            "generado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        salida.mkdir(parents=True, exist_ok=True)
+        with open(salida / "metadata.json", "w") as f:
+            json.dump(metadatos, f)
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"\n✨ {total} teselas generadas en {duracion:.1f}s -> {salida}"))
+
+    def rasterizar(self, modelo, x, y, z, tamano, hora):
+        """Devuelve la tesela como PNG con paleta (un uint8 por píxel) o None si queda fuera de Ecuador."""
+        sur, oeste, norte, este = ECUADOR_BBOX
+
+        # Centro de cada píxel en coordenadas de tesela fraccionarias
+        fraccion = (np.arange(tamano) + 0.5) / tamano
+        lons = np.array([tesela_a_lon(x + f, z) for f in fraccion])
+        lats = np.array([tesela_a_lat(y + f, z) for f in fraccion])
+        malla_lat, malla_lon = np.meshgrid(lats, lons, indexing="ij")
+
+        dentro = (malla_lat >= sur) & (malla_lat <= norte) & (malla_lon >= oeste) & (malla_lon <= este)
+        if not dentro.any():
+            return None
+
+        _, niveles, _ = calcular_riesgo(malla_lat[dentro], malla_lon[dentro], hora=hora, modelo=modelo)
+
+        indices = np.zeros((tamano, tamano), dtype=np.uint8)
+        indices[dentro] = np.where(niveles > 7, 3, np.where(niveles > 3, 2, 1))
+
+        img = Image.fromarray(indices, mode="P")
+        img.putpalette(PALETA)
+        return img
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+from django.conf import settings
+from datetime import datetime
+
+from core.modelos_ia import registro, ModeloNoDisponible
+
+logger = logging.getLogger(__name__)
+
+# --- CARGA DEL MODELO ---
+# Los centroides y el riesgo por cluster se exportan al entrenar (centroides_riesgo.npz).
+# Así la consulta es un argmin de NumPy sobre 50 centroides, sin pasar por sklearn.
+ruta_centroides = os.path.join(settings.BASE_DIR, 'riesgo/centroides_riesgo.npz')
+ruta_modelo = os.path.join(settings.BASE_DIR, 'riesgo/modelo_zonas.pkl')
+ruta_json = os.path.join(settings.BASE_DIR, 'riesgo/datos_riesgo.json')
+# Versiones generadas por entrenamiento_riesgo.py; el manifest indica cuál está activa
+dir_modelos = os.path.join(settings.BASE_DIR, 'riesgo/modelos')
+ruta_manifest = os.path.join(dir_modelos, 'manifest.json')
+
+
+class ModeloRiesgo:
+    """
+    Centroides (k, 2), riesgo base por cluster (k,) y reparto de cada zona entre tipos
+    de delito (k, delito), precalculados al entrenar.
+    """
+
+    def __init__(self, centroides, riesgo_por_cluster, version=None, reparto=None, categorias=None):
+        self.centroides = np.asarray(centroides, dtype=np.float64)
+        self.riesgo_por_cluster = np.asarray(riesgo_por_cluster, dtype=np.float64)
+        # Versión de riesgo/modelos/ de la que viene (None para los archivos sueltos antiguos)
+        self.version = version
+
+        if reparto is None:
+            # Modelo sin desglose: una sola categoría
+            reparto = np.ones((len(self.centroides), 1))
+            categorias = ['TOTAL']
+        self.reparto = np.asarray(reparto, dtype=np.float64)
+        self.categorias = [str(c) for c in categorias]
+
+    @classmethod
+    def desde_npz(cls, ruta, version=None):
+        with np.load(ruta) as npz:
+            extra = {}
+            if 'reparto' in npz:
+                extra = {'reparto': npz['reparto'], 'categorias': npz['categorias']}
+            elif 'tensor' in npz:
+                # Versiones que guardaban un tensor (cluster, franja, delito): solo se conserva el reparto
+                extra = {'reparto': cls._normalizar_filas(npz['tensor'].astype(np.float64).sum(axis=1)),
+                         'categorias': npz['categorias']}
+            return cls(npz['centroides'], npz['riesgo'], version, **extra)
+
+    @staticmethod
+    def _normalizar_filas(matriz):
+        totales = matriz.sum(axis=1, keepdims=True)
+        return np.divide(matriz, totales, out=np.full_like(matriz, 1 / matriz.shape[1]), where=totales > 0)
+
+
+def version_activa():
+    """Versión activa según el manifest, o None si todavía no hay modelos versionados."""
+    try:
+        with open(ruta_manifest) as f:
+            return json.load(f).get('activa')
+    except (OSError, ValueError):
+        return None
+
+
+def cargar_modelo():
+    """Lo llama el registro de modelos la primera vez que se consulta el riesgo."""
+    version = version_activa()
+    if version:
+        return ModeloRiesgo.desde_npz(os.path.join(dir_modelos, version, 'centroides_riesgo.npz'), version)
+
+    if os.path.exists(ruta_centroides):
+        return ModeloRiesgo.desde_npz(ruta_centroides)
+
+    # Compatibilidad con modelos entrenados antes de exportar los centroides
+    import joblib
+
+    modelo_kmeans = joblib.load(ruta_modelo)
+    with open(ruta_json, 'r') as f:
+        datos_riesgo = json.load(f) # Las claves del JSON suelen cargarse como strings
+    centroides = modelo_kmeans.cluster_centers_
+    return ModeloRiesgo(
+        centroides,
+        [datos_riesgo.get(str(i), 0) for i in range(len(centroides))],
+    )
+
+
+def obtener_modelo():
+    # El vigilante arranca aunque la primera carga falle: así se recupera al publicar una versión
+    vigilante.iniciar()
+    return registro.obtener('riesgo')
+
+
+class VigilanteModelo:
+    """
+    Hilo de fondo que revisa el manifest cada RIESGO_RECARGA_SEGUNDOS. Si la versión activa
+    cambió, la carga completa en el propio hilo y solo entonces la publica en el registro:
+    las peticiones siguen usando el modelo anterior hasta ese momento y cada una trabaja
+    con la referencia que obtuvo al empezar, así que nunca ven un modelo a medias.
+    """
+
+    def __init__(self):
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._version_fallida = None
+
+    def iniciar(self):
+        intervalo = getattr(settings, 'RIESGO_RECARGA_SEGUNDOS', 30)
+        if self._hilo is not None or not intervalo:
+            return
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._mtime = self._mtime_manifest()
+            self._hilo = threading.Thread(
+                target=self._vigilar, args=(intervalo,), name='recarga-modelo-riesgo', daemon=True
+            )
+            self._hilo.start()
+
+    def _mtime_manifest(self):
+        try:
+            return os.stat(ruta_manifest).st_mtime_ns
+        except OSError:
+            return None
+
+    def _vigilar(self, intervalo):
+        evento = threading.Event()
+        while not evento.wait(intervalo):
+            try:
+                self.revisar()
+            except Exception as e:
+                logger.error(f"Error revisando el modelo de riesgo: {e}")
+
+    def revisar(self):
+        """Carga y publica la versión activa si cambió. Devuelve True si hubo cambio."""
+        mtime = self._mtime_manifest()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        version = version_activa()
+        actual = registro.obtener('riesgo').version if registro.cargado('riesgo') else None
+        if not version or version == actual or version == self._version_fallida:
+            return False
+
+        try:
+            modelo = cargar_modelo()
+        except Exception as e:
+            # Seguimos con el modelo anterior; no se reintenta hasta que cambie el manifest
+            self._version_fallida = version
+            logger.error(f"No se pudo cargar la versión {version} del modelo de riesgo: {e}")
+            return False
+
+        registro.reemplazar('riesgo', modelo)
+        logger.info(f"Modelo de riesgo actualizado: {actual or 'sin versión'} -> {modelo.version}")
+        return True
+
+
+vigilante = VigilanteModelo()
+
+
+# Filas por bloque en predecir_cluster para acotar la memoria de la matriz de distancias
+TAMANO_BLOQUE = 65536
+
+FACTOR_NOCHE = 1.2
+RIESGO_MAXIMO = 10
+
+VERDE = "#28a745"     # Safe
+AMARILLO = "#ffc107"  # Warning
+ROJO = "#dc3545"      # Danger
+
+
+def modelo_disponible():
+    try:
+        obtener_modelo()
+        return True
+    except ModeloNoDisponible:
+        return False
+
+
+def predecir_cluster(coordenadas, modelo=None):
+    """
+    Equivalente a KMeans.predict: índice del centroide más cercano (distancia euclídea
+    al cuadrado, primer índice en caso de empate) para cada fila (lat, lng).
+    """
+    centroides = (modelo or obtener_modelo()).centroides
+    coordenadas = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    resultado = np.empty(len(coordenadas), dtype=np.int32)
+    for inicio in range(0, len(coordenadas), TAMANO_BLOQUE):
+        bloque = coordenadas[inicio:inicio + TAMANO_BLOQUE]
+        distancias = (
+            (bloque[:, 0:1] - centroides[:, 0]) ** 2
+            + (bloque[:, 1:2] - centroides[:, 1]) ** 2
+        )
+        resultado[inicio:inicio + TAMANO_BLOQUE] = np.argmin(distancias, axis=1)
+    return resultado
+
+
+def es_horario_nocturno(hora=None):
+    """Entre 7PM y 6AM"""
+    if hora is None:
+        hora = datetime.now().hour
+    return hora < 6 or hora > 19
+
+
+def colores_riesgo(niveles):
+    """Semáforo vectorizado: verde hasta 3, amarillo hasta 7, rojo por encima."""
+    niveles = np.asarray(niveles)
+    return np.where(niveles > 7, ROJO, np.where(niveles > 3, AMARILLO, VERDE))
+
+
+def calcular_riesgo(latitudes, longitudes, hora=None, modelo=None):
+    """
+    Calcula el riesgo de muchas coordenadas con una sola búsqueda vectorizada del centroide más cercano.
+    Devuelve (cluster_ids, niveles, es_noche). Pasa `modelo` para saber con qué versión se calculó.
+    """
+    coordenadas = np.column_stack([
+        np.asarray(latitudes, dtype=np.float64),
+        np.asarray(longitudes, dtype=np.float64),
+    ])
+
+    # 1. PREDICCIÓN ESPACIAL (IA): ¿a qué cluster (zona) pertenece cada coordenada?
+    modelo = modelo or obtener_modelo()
+    cluster_ids = predecir_cluster(coordenadas, modelo)
+
+    # Recuperamos el riesgo base (histórico del CSV)
+    niveles = modelo.riesgo_por_cluster[cluster_ids]
+
+    # 2. ANÁLISIS DINÁMICO: aumentamos el riesgo un 20% si es de noche
+    es_noche = es_horario_nocturno(hora)
+    if es_noche:
+        niveles = niveles * FACTOR_NOCHE
+
+    # Tope máximo de 10
+    niveles = np.minimum(niveles, RIESGO_MAXIMO)
+    return cluster_ids, niveles, es_noche
+
+
+def desglose_riesgo(modelo, cluster_ids, niveles):
+    """
+    Aporte de cada tipo de delito al nivel de cada coordenada: (n, categorías), escalado
+    para que la fila sume el nivel devuelto por calcular_riesgo (con el tope aplicado).
+    """
+    return modelo.reparto[cluster_ids] * np.asarray(niveles)[:, None]
+
+
+def cuadricula(sur, oeste, norte, este, resolucion):
+    """
+    Centros de una cuadrícula de resolucion x resolucion celdas sobre el bounding box.
+    Devuelve (latitudes, longitudes, paso_lat, paso_lng).
+    """
+    paso_lat = (norte - sur) / resolucion
+    paso_lng = (este - oeste) / resolucion
+    lats = sur + paso_lat * (np.arange(resolucion) + 0.5)
+    lngs = oeste + paso_lng * (np.arange(resolucion) + 0.5)
+    malla_lat, malla_lng = np.meshgrid(lats, lngs, indexing="ij")
+    return malla_lat.ravel(), malla_lng.ravel(), paso_lat, paso_lng
@@ -1,3 +1,250 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.urls import reverse
+from PIL import Image
+
+from core.modelos_ia import registro
+
+from .management.commands.generar_teselas_riesgo import Command as GenerarTeselas, lat_a_tesela, lon_a_tesela
+from .services import (
+    ModeloRiesgo, VigilanteModelo, calcular_riesgo, desglose_riesgo, predecir_cluster, ruta_centroides,
+)
+
+
+def modelo_de_prueba():
+    """Dos zonas: Quito (riesgo 9) y Guayaquil (riesgo 2), con dos tipos de delito."""
+    return ModeloRiesgo(
+        centroides=[[-0.2, -78.5], [-2.2, -79.9]],
+        riesgo_por_cluster=[9.0, 2.0],
+        version="prueba",
+        reparto=[[0.75, 0.25], [0.5, 0.5]],
+        categorias=["ASESINATO", "HOMICIDIO"],
+    )
+
+
+class ModeloRiesgoTests(SimpleTestCase):
+    def test_factor_nocturno_y_tope(self):
+        modelo = modelo_de_prueba()
+        cluster_ids, niveles, es_noche = calcular_riesgo([-0.21, -2.19], [-78.49, -79.91], hora=22, modelo=modelo)
+        self.assertEqual(cluster_ids.tolist(), [0, 1])
+        self.assertTrue(es_noche)
+        np.testing.assert_allclose(niveles, [10.0, 2.4])
+
+        _, niveles, es_noche = calcular_riesgo([-0.21], [-78.49], hora=12, modelo=modelo)
+        self.assertFalse(es_noche)
+        np.testing.assert_allclose(niveles, [9.0])
+
+    def test_desglose_suma_el_nivel(self):
+        modelo = modelo_de_prueba()
+        cluster_ids, niveles, _ = calcular_riesgo([-0.21, -2.19], [-78.49, -79.91], hora=22, modelo=modelo)
+        desglose = desglose_riesgo(modelo, cluster_ids, niveles)
+        np.testing.assert_allclose(desglose, [[7.5, 2.5], [1.2, 1.2]])
+
+    def test_modelo_antiguo_sin_desglose(self):
+        modelo = ModeloRiesgo([[0.0, 0.0]], [5.0])
+        self.assertEqual(modelo.categorias, ["TOTAL"])
+        np.testing.assert_allclose(desglose_riesgo(modelo, np.array([0]), [6.0]), [[6.0]])
+
+    def test_npz_con_tensor_por_franja(self):
+        # Formato intermedio: tensor (cluster, franja, delito); se conserva solo el reparto
+        modelo = modelo_de_prueba()
+        tensor = modelo.riesgo_por_cluster[:, None, None] * modelo.reparto[:, None, :] * np.array([1.2, 1.0])[None, :, None]
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, "centroides_riesgo.npz")
+            np.savez(ruta, centroides=modelo.centroides, riesgo=modelo.riesgo_por_cluster, tensor=tensor,
+                     categorias=np.array(modelo.categorias))
+            cargado = ModeloRiesgo.desde_npz(ruta)
+        np.testing.assert_allclose(cargado.reparto, modelo.reparto)
+        self.assertEqual(cargado.categorias, modelo.categorias)
+
+    def test_modelo_de_respaldo_incluye_el_desglose(self):
+        # El npz versionado en el repo sirve en un checkout sin riesgo/modelos/
+        modelo = ModeloRiesgo.desde_npz(ruta_centroides)
+        self.assertEqual(modelo.categorias, ["ASESINATO", "FEMICIDIO", "HOMICIDIO", "SICARIATO"])
+        np.testing.assert_allclose(modelo.reparto.sum(axis=1), 1, rtol=1e-5)
+
+
+class PredecirClusterTests(SimpleTestCase):
+    def test_coincide_con_kmeans_predict(self):
+        from sklearn.cluster import KMeans
+
+        rng = np.random.default_rng(0)
+        datos = np.column_stack([rng.uniform(-5, 2, 2000), rng.uniform(-81, -75, 2000)])
+        kmeans = KMeans(n_clusters=30, n_init=1, random_state=0).fit(datos)
+        modelo = ModeloRiesgo(kmeans.cluster_centers_, np.zeros(30))
+
+        consultas = np.column_stack([rng.uniform(-5.2, 2.5, 5000), rng.uniform(-92.5, -75, 5000)])
+        # Bloques pequeños para cruzar varias veces el borde entre bloques
+        with mock.patch("riesgo.services.TAMANO_BLOQUE", 777):
+            ids = predecir_cluster(consultas, modelo)
+        np.testing.assert_array_equal(ids, kmeans.predict(consultas))
+
+    def test_empate_elige_el_primer_centroide(self):
+        modelo = ModeloRiesgo([[0.0, 1.0], [0.0, -1.0]], [1.0, 2.0])
+        self.assertEqual(predecir_cluster([[0.0, 0.0]], modelo).tolist(), [0])
+
+
+@mock.patch("riesgo.views._modelo", side_effect=modelo_de_prueba)
+class CalcularRiesgoLoteTests(SimpleTestCase):
+    def enviar(self, cuerpo):
+        return self.client.post(reverse("riesgo:calcular_riesgo_lote"), cuerpo, content_type="application/json")
+
+    def test_puntos(self, _):
+        respuesta = self.enviar(json.dumps({"puntos": [[-0.21, -78.49], [-2.19, -79.91]], "desglose": True}))
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual([p["cluster_id"] for p in datos["puntos"]], [0, 1])
+        self.assertEqual(datos["categorias"], ["ASESINATO", "HOMICIDIO"])
+        self.assertEqual(datos["version_modelo"], "prueba")
+
+    def test_cuerpos_invalidos_devuelven_400(self, _):
+        for cuerpo in ("[1]", '"texto"', "{", '{"puntos": 5}', '{"puntos": []}', '{"puntos": [[1]]}',
+                       '{"puntos": [[NaN, -78.5]]}', '{"puntos": [[-0.2, Infinity]]}',
+                       '{"puntos": [{"lat": 1, "lon": 2}]}', '{"puntos": ["12"]}', '{"puntos": [[1, 2, 3]]}',
+                       '{"puntos": [[true, false]]}'):
+            with self.subTest(cuerpo=cuerpo):
+                self.assertEqual(self.enviar(cuerpo).status_code, 400)
+
+    def test_bbox_no_finito_devuelve_400(self, _):
+        url = reverse("riesgo:calcular_riesgo_lote")
+        self.assertEqual(self.client.get(url, {"bbox": "nan,-80,0,-78"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"bbox": "-2,-80,0,-78", "resolucion": 2}).status_code, 200)
+
+    def test_punto_suelto_no_finito_devuelve_400(self, _):
+        url = reverse("riesgo:calcular_riesgo")
+        self.assertEqual(self.client.get(url, {"lat": "nan", "lng": "-78.5"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"lat": "-0.2", "lng": "-78.5"}).status_code, 200)
+
+
+class GenerarTeselasTests(SimpleTestCase):
+    # Una sola zona con riesgo 3: verde de día y amarilla de noche (3 x 1.2)
+    modelo = ModeloRiesgo([[-2.2, -79.9]], [3.0], version="prueba")
+
+    def test_rasteriza_el_semaforo_de_cada_conjunto(self):
+        z = 6
+        x, y = lon_a_tesela(-79.9, z), lat_a_tesela(-2.2, z)
+        comando = GenerarTeselas()
+
+        dia = np.asarray(comando.rasterizar(self.modelo, x, y, z, 32, hora=12))
+        noche = np.asarray(comando.rasterizar(self.modelo, x, y, z, 32, hora=23))
+        # 0 = transparente, fuera de ECUADOR_BBOX (la tesela llega hasta 5.6° S)
+        self.assertEqual(set(np.unique(dia)), {0, 1})
+        self.assertEqual(set(np.unique(noche)), {0, 2})
+        self.assertTrue(np.array_equal(dia == 0, noche == 0))
+        # Teselas sin ningún píxel dentro de Ecuador no se generan
+        self.assertIsNone(comando.rasterizar(self.modelo, lon_a_tesela(0, z), lat_a_tesela(45, z), z, 32, hora=12))
+
+    def test_genera_la_piramide_y_sus_metadatos(self):
+        with tempfile.TemporaryDirectory() as salida, \
+                mock.patch("riesgo.management.commands.generar_teselas_riesgo.obtener_modelo", return_value=self.modelo):
+            call_command("generar_teselas_riesgo", "--zoom-min", "5", "--zoom-max", "6", "--tamano", "16",
+                         "--salida", salida, stdout=StringIO())
+
+            metadatos = json.loads((Path(salida) / "metadata.json").read_text())
+            self.assertEqual(metadatos["conjuntos"], ["dia", "noche"])
+            self.assertEqual((metadatos["zoom_min"], metadatos["zoom_max"]), (5, 6))
+            self.assertEqual(metadatos["version_modelo"], "prueba")
+
+            for conjunto in ("dia", "noche"):
+                teselas = sorted((Path(salida) / conjunto / "6").glob("*/*.png"))
+                self.assertTrue(teselas)
+                with Image.open(teselas[0]) as tesela:
+                    self.assertEqual((tesela.mode, tesela.size), ("P", (16, 16)))
+
+
+class DirectorioModelosTestCase(SimpleTestCase):
+    """riesgo/modelos/ y su manifest en un directorio temporal, para el script y para el API."""
+
+    def setUp(self):
+        import entrenamiento_riesgo
+
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        self.manifest = os.path.join(self.directorio, "manifest.json")
+        self.entrenamiento = entrenamiento_riesgo
+        for objetivo, valor in (
+            ("entrenamiento_riesgo.DIR_MODELOS", self.directorio),
+            ("entrenamiento_riesgo.RUTA_MANIFEST", self.manifest),
+            ("riesgo.services.dir_modelos", self.directorio),
+            ("riesgo.services.ruta_manifest", self.manifest),
+        ):
+            parche = mock.patch(objetivo, valor)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def entrenar(self, n_clusters=5, **opciones):
+        e = self.entrenamiento
+        df = e.cargar_datos(e.RUTA_CSV)
+        modelo, _ = e.entrenar(e.coordenadas(df), n_clusters, e.pesos(df))
+        return e.guardar_version(modelo, e.riesgo_por_zona(df, modelo), df, {"tipo": "completo"}, **opciones)
+
+
+class GuardarVersionTests(DirectorioModelosTestCase):
+    def test_cada_version_en_su_directorio_y_la_ultima_activa(self):
+        primera = self.entrenar()
+        segunda = self.entrenar(n_clusters=6)
+        self.assertNotEqual(primera, segunda)
+
+        manifest = json.loads(Path(self.manifest).read_text())
+        self.assertEqual(manifest["activa"], segunda)
+        self.assertEqual([v["version"] for v in manifest["versiones"]], [primera, segunda])
+        # Sin directorios temporales a medio escribir
+        self.assertEqual(sorted(os.listdir(self.directorio)), sorted([primera, segunda, "manifest.json"]))
+
+        metadata = json.loads(Path(self.directorio, segunda, "metadata.json").read_text())
+        self.assertEqual(metadata["n_clusters"], 6)
+        modelo = ModeloRiesgo.desde_npz(os.path.join(self.directorio, segunda, "centroides_riesgo.npz"), segunda)
+        self.assertEqual(modelo.reparto.shape, (6, 4))
+        self.assertLessEqual(modelo.riesgo_por_cluster.max(), 10)
+
+    def test_sin_activar_no_cambia_la_version_activa(self):
+        activa = self.entrenar()
+        nueva = self.entrenar(activar=False)
+        manifest = json.loads(Path(self.manifest).read_text())
+        self.assertEqual(manifest["activa"], activa)
+        self.assertIn(nueva, [v["version"] for v in manifest["versiones"]])
+
+
+class VigilanteModeloTests(DirectorioModelosTestCase):
+    def setUp(self):
+        super().setUp()
+        registro.descargar("riesgo")
+        self.addCleanup(registro.descargar, "riesgo")
+        self.vigilante = VigilanteModelo()
+
+    def test_publica_la_nueva_version_activa(self):
+        primera = self.entrenar()
+        self.assertTrue(self.vigilante.revisar())
+        anterior = registro.obtener("riesgo")
+        self.assertEqual(anterior.version, primera)
+        # Sin cambios en el manifest no se vuelve a cargar
+        self.assertFalse(self.vigilante.revisar())
+
+        segunda = self.entrenar(n_clusters=6)
+        self.assertTrue(self.vigilante.revisar())
+        self.assertEqual(registro.obtener("riesgo").version, segunda)
+        # Quien ya tenía la referencia anterior sigue con un modelo completo
+        self.assertEqual(len(anterior.centroides), 5)
+
+    def test_version_rota_mantiene_el_modelo_anterior(self):
+        primera = self.entrenar()
+        self.vigilante.revisar()
+
+        rota = self.entrenar(activar=False)
+        os.remove(os.path.join(self.directorio, rota, "centroides_riesgo.npz"))
+        manifest = json.loads(Path(self.manifest).read_text())
+        manifest["activa"] = rota
+        Path(self.manifest).write_text(json.dumps(manifest))
+        os.utime(self.manifest, ns=(0, 1))
+
+        self.assertFalse(self.vigilante.revisar())
+        self.assertEqual(registro.obtener("riesgo").version, primera)
@@ -6,4 +6,6 @@ app_name = 'riesgo'
 urlpatterns = [
     # Esta es la ruta que llamará el mapa usando AJAX/Fetch
     path('api/calcular/', views.calcular_riesgo_zona, name='calcular_riesgo'),
+    # Muchos puntos o una cuadrícula del viewport en una sola petición (mapa de calor)
+    path('api/lote/', views.calcular_riesgo_lote, name='calcular_riesgo_lote'),
 ]
\ No newline at end of file
@@ -1,25 +1,53 @@
 from django.shortcuts import render
-import joblib
 import json
-import os
-import numpy as np
-from django.conf import settings
+import math
 from django.http import JsonResponse
-from datetime import datetime
-
-# --- CARGA INICIAL (OPTIMIZACIÓN) ---
-# Cargamos el modelo una sola vez al arrancar Django para que sea rápido
-ruta_modelo = os.path.join(settings.BASE_DIR, 'riesgo/modelo_zonas.pkl')
-ruta_json = os.path.join(settings.BASE_DIR, 'riesgo/datos_riesgo.json')
-
-try:
-    modelo_kmeans = joblib.load(ruta_modelo)
-    with open(ruta_json, 'r') as f:
-        datos_riesgo = json.load(f) # Las claves del JSON suelen cargarse como strings
-except Exception as e:
-    print(f"Error cargando modelos de IA: {e}")
-    modelo_kmeans = None
-    datos_riesgo = {}
+from django.views.decorators.csrf import csrf_exempt
+
+from core.modelos_ia import ModeloNoDisponible
+
+from .services import obtener_modelo, calcular_riesgo, desglose_riesgo, colores_riesgo, cuadricula
+
+# Límite de puntos por petición en el API por lotes
+MAX_PUNTOS_LOTE = 10000
+MAX_RESOLUCION = 100
+
+
+def _mensaje(es_noche):
+    mensaje = "Nivel de riesgo basado en histórico delictivo."
+    if es_noche:
+        mensaje += " (Aumentado por horario nocturno)."
+    return mensaje
+
+
+def _desglose(modelo, fila):
+    return {categoria: round(float(valor), 2) for categoria, valor in zip(modelo.categorias, fila)}
+
+
+def _finitas(*coordenadas):
+    """float('nan') y float('inf') se aceptan al parsear, pero no son coordenadas."""
+    return all(math.isfinite(c) for c in coordenadas)
+
+
+def _punto(p):
+    """[lat, lng] con dos números reales; bool es subclase de int pero no es una coordenada."""
+    if not isinstance(p, (list, tuple)) or len(p) != 2:
+        raise ValueError("Punto inválido")
+    if any(isinstance(c, bool) or not isinstance(c, (int, float)) for c in p):
+        raise ValueError("Punto inválido")
+    return float(p[0]), float(p[1])
+
+
+def _modelo():
+    """
+    Modelo vigente al empezar la petición. Toda la respuesta se calcula con esta referencia
+    aunque el vigilante publique otra versión mientras tanto.
+    """
+    try:
+        return obtener_modelo()
+    except ModeloNoDisponible:
+        return None
+
 
 # --- VISTA API ---
 def calcular_riesgo_zona(request):
@@ -29,47 +57,109 @@ def calcular_riesgo_zona(request):
     lat = request.GET.get('lat')
     lng = request.GET.get('lng')
 
-    if not modelo_kmeans or not lat or not lng:
+    modelo = _modelo()
+    if modelo is None or not lat or not lng:
         return JsonResponse({'status': 'error', 'msg': 'Faltan datos o modelo no cargado'}, status=400)
 
     try:
-        # 1. PREDUCCIÓN ESPACIAL (IA)
-        # ¿A qué cluster (zona) pertenece esta coordenada?
-        coordenada = np.array([[float(lat), float(lng)]])
-        cluster_id = modelo_kmeans.predict(coordenada)[0]
-        
-        # Recuperamos el riesgo base (histórico del CSV)
-        # Nota: al leer JSON las claves son strings, por eso str(cluster_id)
-        riesgo_base = datos_riesgo.get(str(cluster_id), 0)
-
-        # 2. ANÁLISIS DINÁMICO (Lógica de Negocio / Heurística)
-        # Factor hora: Aumenta el riesgo si es de noche
-        hora_actual = datetime.now().hour
-        es_noche = hora_actual < 6 or hora_actual > 19 # Entre 7PM y 6AM
-        
-        riesgo_final = riesgo_base
-        mensaje = "Nivel de riesgo basado en histórico delictivo."
-
-        if es_noche:
-            # Aumentamos el riesgo un 20% si es de noche
-            riesgo_final = riesgo_final * 1.2
-            mensaje += " (Aumentado por horario nocturno)."
-
-        # Tope máximo de 10
-        riesgo_final = min(riesgo_final, 10)
-
-        # 3. SEMÁFORO (COLORES)
-        color = "#28a745" # Verde (Safe)
-        if riesgo_final > 3: color = "#ffc107" # Amarillo (Warning)
-        if riesgo_final > 7: color = "#dc3545" # Rojo (Danger)
+        lat, lng = float(lat), float(lng)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'msg': 'Coordenadas inválidas'}, status=400)
+    if not _finitas(lat, lng):
+        return JsonResponse({'status': 'error', 'msg': 'Coordenadas inválidas'}, status=400)
+
+    try:
+        cluster_ids, niveles, es_noche = calcular_riesgo([lat], [lng], modelo=modelo)
+        riesgo_final = float(niveles[0])
+        desglose = desglose_riesgo(modelo, cluster_ids, niveles)
 
         return JsonResponse({
             'status': 'success',
-            'cluster_id': int(cluster_id),
+            'cluster_id': int(cluster_ids[0]),
             'nivel_riesgo': round(riesgo_final, 2),
-            'color': color,
-            'mensaje': mensaje
+            'color': str(colores_riesgo(riesgo_final)),
+            'mensaje': _mensaje(es_noche),
+            'desglose': _desglose(modelo, desglose[0]),
+            'version_modelo': modelo.version,
         })
 
     except Exception as e:
         return JsonResponse({'status': 'error', 'msg': str(e)}, status=500)
+
+
+@csrf_exempt
+def calcular_riesgo_lote(request):
+    """
+    API por lotes para pintar el mapa de calor en una sola petición.
+
+    - POST con JSON {"puntos": [[lat, lng], ...]} devuelve el riesgo de cada punto.
+    - GET con ?bbox=sur,oeste,norte,este&resolucion=N devuelve una cuadrícula de N x N celdas.
+
+    Con "desglose": true (POST) o &desglose=1 (GET) cada punto incluye el aporte por tipo de delito.
+    """
+    modelo = _modelo()
+    if modelo is None:
+        return JsonResponse({'status': 'error', 'msg': 'Modelo no cargado'}, status=400)
+
+    paso_lat = paso_lng = None
+    try:
+        if request.method == 'POST':
+            data = json.loads(request.body or b'{}')
+            if not isinstance(data, dict):
+                return JsonResponse({'status': 'error', 'msg': 'Se esperaba un objeto JSON'}, status=400)
+            puntos = data.get('puntos') or []
+            if not isinstance(puntos, list):
+                return JsonResponse({'status': 'error', 'msg': 'Datos inválidos'}, status=400)
+            if not puntos:
+                return JsonResponse({'status': 'error', 'msg': 'Faltan puntos'}, status=400)
+            if len(puntos) > MAX_PUNTOS_LOTE:
+                return JsonResponse({'status': 'error', 'msg': f'Máximo {MAX_PUNTOS_LOTE} puntos por petición'}, status=400)
+            con_desglose = bool(data.get('desglose'))
+            coordenadas = [_punto(p) for p in puntos]
+            lats = [c[0] for c in coordenadas]
+            lngs = [c[1] for c in coordenadas]
+            if not _finitas(*lats, *lngs):
+                return JsonResponse({'status': 'error', 'msg': 'Coordenadas inválidas'}, status=400)
+        else:
+            bbox = request.GET.get('bbox')
+            if not bbox:
+                return JsonResponse({'status': 'error', 'msg': 'Faltan bbox o puntos'}, status=400)
+            sur, oeste, norte, este = [float(v) for v in bbox.split(',')]
+            resolucion = int(request.GET.get('resolucion', 20))
+            if not _finitas(sur, oeste, norte, este) or not (1 <= resolucion <= MAX_RESOLUCION) \
+                    or sur >= norte or oeste >= este:
+                return JsonResponse({'status': 'error', 'msg': 'bbox o resolución inválidos'}, status=400)
+            lats, lngs, paso_lat, paso_lng = cuadricula(sur, oeste, norte, este, resolucion)
+            con_desglose = request.GET.get('desglose') == '1'
+    except (ValueError, TypeError, IndexError, json.JSONDecodeError):
+        return JsonResponse({'status': 'error', 'msg': 'Datos inválidos'}, status=400)
+
+    try:
+        cluster_ids, niveles, es_noche = calcular_riesgo(lats, lngs, modelo=modelo)
+        colores = colores_riesgo(niveles)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'msg': str(e)}, status=500)
+
+    respuesta = {
+        'status': 'success',
+        'mensaje': _mensaje(es_noche),
+        'version_modelo': modelo.version,
+        'puntos': [
+            {
+                'lat': round(float(lat), 6),
+                'lng': round(float(lng), 6),
+                'cluster_id': int(cluster_id),
+                'nivel_riesgo': round(float(nivel), 2),
+                'color': str(color),
+            }
+            for lat, lng, cluster_id, nivel, color in zip(lats, lngs, cluster_ids, niveles, colores)
+        ],
+    }
+    if con_desglose:
+        respuesta['categorias'] = modelo.categorias
+        for punto, fila in zip(respuesta['puntos'], desglose_riesgo(modelo, cluster_ids, niveles)):
+            punto['desglose'] = _desglose(modelo, fila)
+    if paso_lat is not None:
+        respuesta['paso_lat'] = paso_lat
+        respuesta['paso_lng'] = paso_lng
+    return JsonResponse(respuesta)
@@ -2,6 +2,9 @@ let map;
 let userMarker = null;
 let currentRiskLayer = null; 
 let markers = []; 
+let heatmapLayer = null;
+let heatmapActivo = false;
+let heatmapTimer = null;
 
 // Destinos Turísticos (Ejemplo)
 const destinations = [];
@@ -327,11 +330,17 @@ function obtenerRiesgo(lat, lng) {
         .then(response => response.json())
         .then(data => {
             if(data.status === 'success'){
+                // Aporte de cada tipo de delito (solo los que suman algo)
+                var desglose = Object.entries(data.desglose || {})
+                    .filter(([, valor]) => valor > 0)
+                    .map(([categoria, valor]) => `${categoria.toLowerCase()}: ${valor}`)
+                    .join('<br>');
                 var contenido = `
                     <div style="text-align:center; min-width:160px;">
                         <h4 style="color:${data.color}; margin:0;">Riesgo: ${data.nivel_riesgo}/10</h4>
                         <hr style="margin:5px 0; opacity:0.2;">
                         <p style="font-size:13px; margin:5px 0;">${data.mensaje}</p>
+                        ${desglose ? `<p style="font-size:12px; margin:5px 0; opacity:0.8;">${desglose}</p>` : ''}
                     </div>
                 `;
 
@@ -354,11 +363,95 @@ function obtenerRiesgo(lat, lng) {
         });
 }
 
+// --- MAPA DE CALOR DEL VIEWPORT (UNA SOLA PETICIÓN) ---
+const HEATMAP_RESOLUCION = 30; // celdas por lado
+
+function pintarMapaCalor() {
+    const b = map.getBounds();
+    const bbox = [b.getSouth(), b.getWest(), b.getNorth(), b.getEast()].join(',');
+
+    fetch(`/riesgo/api/lote/?bbox=${bbox}&resolucion=${HEATMAP_RESOLUCION}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success' || !heatmapActivo) return;
+
+            if (heatmapLayer) heatmapLayer.clearLayers();
+            else heatmapLayer = L.layerGroup().addTo(map);
+
+            const medioLat = data.paso_lat / 2;
+            const medioLng = data.paso_lng / 2;
+            data.puntos.forEach(p => {
+                L.rectangle(
+                    [[p.lat - medioLat, p.lng - medioLng], [p.lat + medioLat, p.lng + medioLng]],
+                    { stroke: false, fillColor: p.color, fillOpacity: 0.25, interactive: false }
+                ).addTo(heatmapLayer);
+            });
+        })
+        .catch(error => console.error('Error mapa de calor:', error));
+}
+
+function programarMapaCalor() {
+    // Evita una petición por cada paso del arrastre
+    clearTimeout(heatmapTimer);
+    heatmapTimer = setTimeout(pintarMapaCalor, 300);
+}
+
+// Teselas precalculadas con `manage.py generar_teselas_riesgo` (archivos estáticos)
+const RIESGO_TESELAS_URL = '/static/riesgo/teselas';
+
+function conjuntoTeselas() {
+    // Mismo criterio que el servidor: de noche entre 7PM y 6AM
+    const hora = new Date().getHours();
+    return (hora < 6 || hora > 19) ? 'noche' : 'dia';
+}
+
+function activarMapaCalorApi() {
+    pintarMapaCalor();
+    map.on('moveend', programarMapaCalor);
+}
+
+function activarMapaCalor() {
+    // Si hay teselas generadas las usamos; si no, pedimos la cuadrícula al API por lotes
+    fetch(`${RIESGO_TESELAS_URL}/metadata.json`)
+        .then(response => {
+            if (!response.ok) throw new Error('Sin teselas');
+            return response.json();
+        })
+        .then(meta => {
+            if (!heatmapActivo) return;
+            heatmapLayer = L.tileLayer(`${RIESGO_TESELAS_URL}/${conjuntoTeselas()}/{z}/{x}/{y}.png`, {
+                minNativeZoom: meta.zoom_min,
+                maxNativeZoom: meta.zoom_max,
+                opacity: 1,
+                bounds: ECUADOR_BOUNDS
+            }).addTo(map);
+        })
+        .catch(() => {
+            if (heatmapActivo) activarMapaCalorApi();
+        });
+}
+
+function toggleMapaCalor() {
+    heatmapActivo = !heatmapActivo;
+    if (heatmapActivo) {
+        activarMapaCalor();
+    } else {
+        map.off('moveend', programarMapaCalor);
+        if (heatmapLayer) {
+            map.removeLayer(heatmapLayer);
+            heatmapLayer = null;
+        }
+    }
+}
+
 // --- CONTROLES Y BUSCADOR ---
 function setupControls() {
     document.getElementById("zoomIn").onclick = () => map.zoomIn();
     document.getElementById("zoomOut").onclick = () => map.zoomOut();
 
+    const heatmapBtn = document.getElementById("riskHeatmap");
+    if (heatmapBtn) heatmapBtn.onclick = toggleMapaCalor;
+
     // Botón manual de "Mi Ubicación" (Reutiliza la lógica)
     document.getElementById("myLocation").onclick = () => {
         document.getElementById("mapLoading").style.display = "flex"; // Mostrar carga visualmente
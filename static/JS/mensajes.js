@@ -13,7 +13,7 @@ function renderChats(){
   }
 
   chats.forEach(c => {
-    const lastMsg = c.last_msg || "Sin mensajes";
+    const lastMsg = c.is_typing ? "<i>escribiendo...</i>" : (c.last_msg || "Sin mensajes");
     list.innerHTML += `
       <div class="chat-item" onclick="openChat(${c.id})" style="cursor:pointer; padding:15px; border-bottom:1px solid #eee; display:flex; align-items:center;">
         <div class="avatar" style="width:40px; height:40px; background:#ddd; border-radius:50%; display:flex; align-items:center; justify-content:center; margin-right:15px;">👤</div>
@@ -32,5 +32,42 @@ function openChat(id){
     window.location.href = `/accounts/messages/chat/${id}/`;
 }
 
+// --- Tiempo real: la lista se actualiza con los eventos del servidor, sin sondeos ---
+const typingTimers = {};
+
+function conectarEventos(){
+  if (!window.EventSource) return;
+  const eventos = new EventSource("/accounts/messages/eventos/");
+
+  eventos.addEventListener("mensaje", e => {
+    const m = JSON.parse(e.data);
+    let chat = chats.find(c => c.id === m.con);
+    if (!chat) {
+      // Conversación nueva: recargamos para traer el nombre del otro usuario
+      window.location.reload();
+      return;
+    }
+    chat.last_msg = m.text || (m.image ? "[Imagen]" : "Sin mensajes");
+    chat.is_typing = false;
+    if (m.from === "other") chat.unread = (chat.unread || 0) + 1;
+    // La conversación con actividad sube al principio
+    chats = [chat, ...chats.filter(c => c !== chat)];
+    renderChats();
+  });
+
+  eventos.addEventListener("escribiendo", e => {
+    const d = JSON.parse(e.data);
+    const chat = chats.find(c => c.id === d.con);
+    if (!chat) return;
+    chat.is_typing = true;
+    renderChats();
+    clearTimeout(typingTimers[d.con]);
+    typingTimers[d.con] = setTimeout(() => { chat.is_typing = false; renderChats(); }, 4000);
+  });
+}
+
 // Ejecutar al cargar
-document.addEventListener("DOMContentLoaded", renderChats);
\ No newline at end of file
+document.addEventListener("DOMContentLoaded", () => {
+  renderChats();
+  conectarEventos();
+});
\ No newline at end of file
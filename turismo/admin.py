@@ -1,10 +1,19 @@
 from django.contrib import admin
-from .models import SitioTuristico
+from .models import ImagenReferencia, SitioTuristico
+
+
+class ImagenReferenciaInline(admin.TabularInline):
+    # Fotos extra que la IA también usa para reconocer el sitio
+    model = ImagenReferencia
+    fields = ('imagen',)
+    extra = 1
+
 
 @admin.register(SitioTuristico)
 class SitioTuristicoAdmin(admin.ModelAdmin):
     # Columnas que se verán en la lista principal
     list_display = ('nombre', 'provincia', 'categoria', 'latitud', 'longitud', 'activo', 'tiene_foto')
+    inlines = [ImagenReferenciaInline]
     
     # Filtros laterales para encontrar rápido los sitios
     list_filter = ('provincia', 'categoria', 'activo')
@@ -0,0 +1,118 @@
+import numpy as np
+
+# Filas que se convierten a float32 de una vez al puntuar códigos comprimidos
+TAMANO_BLOQUE = 256
+# Fracción de valores recortados al codificar a partir de la cual conviene reajustar las escalas
+UMBRAL_RECORTE = 0.01
+
+
+class CodificadorFloat32:
+    """Sin compresión: los códigos son los propios vectores normalizados."""
+
+    formato = "float32"
+    dtype = np.float32
+    # Valores codificados desde que se construyó el índice y cuántos se salieron de rango
+    valores = 0
+    recortados = 0
+
+    def __init__(self, escala=None):
+        self.escala = None
+
+    @classmethod
+    def ajustar(cls, matriz):
+        return cls()
+
+    def codificar(self, matriz):
+        return np.asarray(matriz, dtype=np.float32)
+
+    def decodificar(self, codigos):
+        return np.asarray(codigos, dtype=np.float32)
+
+    def necesita_reajuste(self):
+        """True si los vectores codificados tras ajustar() pierden demasiada precisión."""
+        return False
+
+    def preparar_consulta(self, consultas):
+        """
+        Transforma la(s) consulta(s), (d,) o (m, d), para poder multiplicarlas
+        directamente por los códigos con productos().
+        """
+        return np.asarray(consultas, dtype=np.float32)
+
+
+class CodificadorFloat16(CodificadorFloat32):
+    """Media precisión: 2 bytes por valor (2.5 KB por vector)."""
+
+    formato = "float16"
+    dtype = np.float16
+
+    def codificar(self, matriz):
+        return np.asarray(matriz, dtype=np.float16)
+
+
+class CodificadorInt8(CodificadorFloat32):
+    """
+    Cuantización escalar simétrica por dimensión: x_d ≈ codigo_d * escala_d, con el código en int8
+    (1 byte por valor, 1.25 KB por vector).
+    El producto punto se calcula sin reconstruir los vectores: x·q = codigos · (escala ∘ q).
+    """
+
+    formato = "int8"
+    dtype = np.int8
+
+    def __init__(self, escala):
+        self.escala = np.asarray(escala, dtype=np.float32)
+
+    @classmethod
+    def ajustar(cls, matriz):
+        matriz = np.asarray(matriz, dtype=np.float32)
+        if not len(matriz):
+            # Sin datos: escala fija válida para cualquier vector normalizado (|x| <= 1)
+            return cls(np.full(matriz.shape[-1], 1.0 / 127.0, dtype=np.float32))
+        maximos = np.abs(matriz).max(axis=0)
+        maximos[maximos == 0] = 1.0
+        return cls(maximos / 127.0)
+
+    def codificar(self, matriz):
+        # Los vectores que se añaden después pueden salirse del rango ajustado: se recortan
+        # y se lleva la cuenta para saber cuándo reajustar (ver necesita_reajuste)
+        codigos = np.rint(np.asarray(matriz, dtype=np.float32) / self.escala)
+        self.valores += codigos.size
+        self.recortados += int(np.count_nonzero(np.abs(codigos) > 127))
+        return np.clip(codigos, -127, 127).astype(np.int8)
+
+    def necesita_reajuste(self):
+        return self.valores > 0 and self.recortados / self.valores > UMBRAL_RECORTE
+
+    def decodificar(self, codigos):
+        return np.asarray(codigos, dtype=np.float32) * self.escala
+
+    def preparar_consulta(self, consultas):
+        return np.asarray(consultas, dtype=np.float32) * self.escala
+
+
+CODIFICADORES = {c.formato: c for c in (CodificadorFloat32, CodificadorFloat16, CodificadorInt8)}
+
+
+def obtener_codificador(formato):
+    try:
+        return CODIFICADORES[formato]
+    except KeyError:
+        raise ValueError(f"Formato de embeddings desconocido: {formato} (usa {', '.join(CODIFICADORES)})")
+
+
+def productos(codigos, consultas):
+    """
+    Productos punto entre codigos (n, d) de cualquier formato y consultas preparadas
+    (d,) o (m, d); devuelve (n,) o (n, m).
+    Los códigos comprimidos se pasan a float32 por bloques para usar BLAS sin
+    duplicar toda la matriz en memoria.
+    """
+    consultas = consultas.T
+    if codigos.dtype == np.float32:
+        return codigos @ consultas
+    salida = np.empty((codigos.shape[0],) + consultas.shape[1:], dtype=np.float32)
+    for inicio in range(0, codigos.shape[0], TAMANO_BLOQUE):
+        bloque = codigos[inicio:inicio + TAMANO_BLOQUE]
+        salida[inicio:inicio + len(bloque)] = bloque.astype(np.float32) @ consultas
+    return salida
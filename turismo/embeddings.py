@@ -0,0 +1,604 @@
+import io
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.versiones import VersionCompartida
+
+from .cuantizacion import obtener_codificador, productos
+
+logger = logging.getLogger(__name__)
+
+# MobileNetV2 con pooling='avg' devuelve vectores de 1280 valores
+DIMENSION_EMBEDDING = 1280
+DTYPE_EMBEDDING = np.float32
+# Archivo con ids, escalas e IVF del índice exportado (ver IndiceEmbeddings.guardar)
+ARCHIVO_INDICE = "indice.npz"
+
+
+def vector_a_bytes(vector):
+    """Serializa un vector de características para guardarlo en la BD."""
+    return np.asarray(vector, dtype=DTYPE_EMBEDDING).ravel().tobytes()
+
+
+def bytes_a_vector(datos):
+    """Reconstruye el vector guardado con vector_a_bytes."""
+    if not datos:
+        return None
+    return np.frombuffer(bytes(datos), dtype=DTYPE_EMBEDDING)
+
+
+def normalizar(matriz):
+    """Normaliza filas a norma 1 para que el producto punto sea la similitud coseno."""
+    matriz = np.asarray(matriz, dtype=DTYPE_EMBEDDING)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def calcular_embedding_imagen(campo, descripcion=""):
+    """
+    Calcula el vector de un ImageField.
+    Se lee desde el storage (local o Supabase) sin depender de .path
+    """
+    if not campo:
+        return None
+
+    from .services_ia import obtener_vector_caracteristicas
+
+    try:
+        with campo.open("rb") as f:
+            contenido = io.BytesIO(f.read())
+    except Exception as e:
+        logger.error(f"No se pudo leer la imagen de referencia {descripcion}: {e}")
+        return None
+
+    return obtener_vector_caracteristicas(contenido)
+
+
+def calcular_embedding_sitio(sitio):
+    """Vector de la imagen principal (imagen_referencia) de un sitio."""
+    return calcular_embedding_imagen(sitio.imagen_referencia, f"del sitio {sitio.pk}")
+
+
+# --- FILAS DEL ÍNDICE ---
+# Cada imagen de referencia es una fila. La clave de la fila es el id del sitio para su
+# imagen principal (SitioTuristico.embedding) y -id para cada ImagenReferencia adicional.
+AGREGACIONES = ("max", "media", "centroide")
+
+
+def filas_desde_bd(sitio_ids=None):
+    """(claves, sitios, vectores) de todas las imágenes con embedding de los sitios activos."""
+    from .models import ImagenReferencia, SitioTuristico
+
+    principales = SitioTuristico.objects.filter(activo=True, embedding__isnull=False)
+    adicionales = ImagenReferencia.objects.filter(sitio__activo=True, embedding__isnull=False)
+    if sitio_ids is not None:
+        principales = principales.filter(pk__in=sitio_ids)
+        adicionales = adicionales.filter(sitio_id__in=sitio_ids)
+
+    claves, sitios, vectores = [], [], []
+    filas = [(pk, pk, datos) for pk, datos in principales.values_list("id", "embedding")]
+    filas += [(-pk, sitio_id, datos) for pk, sitio_id, datos in adicionales.values_list("id", "sitio_id", "embedding")]
+    for clave, sitio_id, datos in filas:
+        vector = bytes_a_vector(datos)
+        if vector is None or vector.shape[0] != DIMENSION_EMBEDDING:
+            continue
+        claves.append(clave)
+        sitios.append(sitio_id)
+        vectores.append(vector)
+
+    matriz = np.vstack(vectores) if vectores else np.empty((0, DIMENSION_EMBEDDING), dtype=DTYPE_EMBEDDING)
+    return claves, sitios, matriz
+
+
+def claves_desde_bd(agregacion="max"):
+    """Solo las claves de las filas que debería tener el índice (sin leer vectores)."""
+    from .models import ImagenReferencia, SitioTuristico
+
+    con_principal = SitioTuristico.objects.filter(activo=True, embedding__isnull=False)
+    adicionales = ImagenReferencia.objects.filter(sitio__activo=True, embedding__isnull=False)
+    if agregacion == "centroide":
+        return set(con_principal.values_list("id", flat=True)) | set(adicionales.values_list("sitio_id", flat=True))
+    return set(con_principal.values_list("id", flat=True)) | {-pk for pk in adicionales.values_list("id", flat=True)}
+
+
+def agrupar_por_sitio(sitios, similitudes, agregacion="max"):
+    """
+    Reduce las similitudes de cada imagen a una puntuación por sitio (máximo o media)
+    en una sola pasada: se ordena por sitio y se reduce cada tramo con reduceat.
+    """
+    orden = np.argsort(sitios, kind="stable")
+    sitios = sitios[orden]
+    similitudes = similitudes[orden]
+    cortes = np.flatnonzero(np.r_[True, sitios[1:] != sitios[:-1]])
+    if agregacion == "media":
+        puntuaciones = np.add.reduceat(similitudes, cortes) / np.diff(np.r_[cortes, len(sitios)])
+    else:
+        puntuaciones = np.maximum.reduceat(similitudes, cortes)
+    return sitios[cortes], puntuaciones.astype(DTYPE_EMBEDDING)
+
+
+def centroides_por_sitio(sitios, matriz):
+    """Un vector por sitio: la media normalizada de sus imágenes."""
+    unicos, inversa = np.unique(np.asarray(sitios, dtype=np.int64), return_inverse=True)
+    sumas = np.zeros((len(unicos), DIMENSION_EMBEDDING), dtype=DTYPE_EMBEDDING)
+    np.add.at(sumas, inversa, normalizar(matriz))
+    return unicos, normalizar(sumas)
+
+
+def kmeans_esferico(matriz, n_listas, iteraciones=10, semilla=0):
+    """
+    K-means sobre vectores normalizados usando similitud coseno.
+    Devuelve (centroides normalizados, asignación de cada fila).
+    """
+    rng = np.random.default_rng(semilla)
+    n = matriz.shape[0]
+    centroides = matriz[rng.choice(n, size=n_listas, replace=False)].copy()
+    asignacion = np.zeros(n, dtype=np.int64)
+    for _ in range(iteraciones):
+        asignacion = np.argmax(matriz @ centroides.T, axis=1)
+        conteos = np.bincount(asignacion, minlength=n_listas)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignacion, matriz)
+        # Las listas que quedan vacías se vuelven a sembrar con un vector al azar
+        vacias = conteos == 0
+        if vacias.any():
+            sumas[vacias] = matriz[rng.choice(n, size=int(vacias.sum()), replace=False)]
+        centroides = normalizar(sumas)
+    return centroides, asignacion
+
+
+class IndiceEmbeddings:
+    """
+    Vectores de referencia de todos los sitios activos, normalizados para que el
+    producto punto sea la similitud coseno. Un sitio puede tener varias filas (una por
+    imagen de referencia); las consultas devuelven una puntuación por sitio según
+    `agregacion`: "max" (la imagen más parecida), "media" o "centroide" (una sola
+    fila por sitio con la media de sus imágenes, calculada al construir el índice).
+
+    - puntuar(): similitud exacta contra una lista de sitios candidatos (o todos).
+    - buscar(): búsqueda aproximada (IVF) en todo el catálogo. Los vectores se reparten
+      en listas según su centroide más cercano; una consulta solo recorre las `nprobe`
+      listas más parecidas. Con pocos sitios se recorre todo (búsqueda exacta).
+    - insertar()/eliminar()/reemplazar_sitio(): altas, cambios y bajas sin reconstruir el índice.
+    """
+
+    # Por debajo de este tamaño no merece la pena particionar
+    MINIMO_IVF = 256
+
+    def __init__(self, claves, matriz, sitios=None, nprobe=8, formato="float32", agregacion="max"):
+        """`sitios` indica el sitio de cada fila; por defecto cada clave es un sitio."""
+        if agregacion not in AGREGACIONES:
+            raise ValueError(f"Agregación desconocida: {agregacion} (usa {', '.join(AGREGACIONES)})")
+        claves = np.asarray(claves, dtype=np.int64)
+        sitios = claves if sitios is None else np.asarray(sitios, dtype=np.int64)
+        if len(claves):
+            matriz = normalizar(matriz).reshape(len(claves), DIMENSION_EMBEDDING)
+        else:
+            # Catálogo sin embeddings todavía: índice vacío que crece con insertar()
+            matriz = np.empty((0, DIMENSION_EMBEDDING), dtype=DTYPE_EMBEDDING)
+        if agregacion == "centroide" and len(claves):
+            sitios, matriz = centroides_por_sitio(sitios, matriz)
+            claves = sitios
+        codificador = obtener_codificador(formato).ajustar(matriz)
+        codigos = codificador.codificar(matriz)
+        # Lo codificado al construir no cuenta para decidir si hay que reajustar
+        codificador.valores = codificador.recortados = 0
+        self._iniciar(claves, sitios, codigos, codificador, nprobe, agregacion)
+
+    def _iniciar(self, claves, sitios, codigos, codificador, nprobe, agregacion):
+        self.n = len(claves)
+        self.nprobe = nprobe
+        self.agregacion = agregacion
+        self.codificador = codificador
+        if isinstance(codigos, np.memmap) and not self.n:
+            codigos = np.asarray(codigos)
+        capacidad = max(16, self.n) if not isinstance(codigos, np.memmap) else self.n
+        self._ids = np.zeros(capacidad, dtype=np.int64)
+        self._ids[:self.n] = claves
+        self._sitios = np.zeros(capacidad, dtype=np.int64)
+        self._sitios[:self.n] = sitios
+        if isinstance(codigos, np.memmap):
+            # Mapeado copy-on-write: los procesos comparten las páginas del archivo
+            # y solo copian las que modifican al insertar o eliminar
+            self._codigos = codigos
+        else:
+            self._codigos = np.zeros((capacidad, DIMENSION_EMBEDDING), dtype=codificador.dtype)
+            self._codigos[:self.n] = codigos
+        self._posiciones = {int(clave): i for i, clave in enumerate(claves)}
+        self._lock = threading.RLock()
+        # Estructura IVF: centroides, filas de cada lista y lista de cada fila
+        self.centroides = None
+        self._listas = []
+        self._lista_de = np.full(capacidad, -1, dtype=np.int64)
+        self._n_entrenado = 0
+
+    @classmethod
+    def desde_bd(cls, formato=None, usar_archivo=True, agregacion=None):
+        """
+        Abre el índice exportado en EMBEDDINGS_DIR si existe (y lo pone al día),
+        o lo construye leyendo todos los vectores de la BD.
+        """
+        from django.conf import settings
+
+        nprobe = getattr(settings, "EMBEDDINGS_NPROBE", 8)
+        agregacion = agregacion or getattr(settings, "EMBEDDINGS_AGREGACION", "max")
+        directorio = getattr(settings, "EMBEDDINGS_DIR", None)
+        if usar_archivo and directorio and os.path.exists(os.path.join(directorio, ARCHIVO_INDICE)):
+            try:
+                indice = cls.desde_archivo(directorio, nprobe=nprobe)
+                if indice.agregacion == agregacion:
+                    indice.sincronizar_con_bd()
+                    if not indice.codificador.necesita_reajuste():
+                        return indice
+                    logger.info("Las altas posteriores no caben en las escalas del índice en disco; se lee de la BD.")
+                else:
+                    logger.info("El índice en disco usa otra agregación; se lee de la BD.")
+            except Exception as e:
+                logger.warning(f"No se pudo abrir el índice de embeddings en disco ({e}); se lee de la BD.")
+
+        claves, sitios, matriz = filas_desde_bd()
+        formato = formato or getattr(settings, "EMBEDDINGS_FORMATO", "float32")
+        return cls(claves, matriz, sitios=sitios, nprobe=nprobe, formato=formato, agregacion=agregacion)
+
+    def sincronizar_con_bd(self):
+        """
+        Aplica las altas y bajas hechas después de exportar el archivo.
+        Solo consulta claves; los vectores se leen únicamente para los sitios afectados.
+        """
+        en_bd = claves_desde_bd(self.agregacion)
+        sobran = set(self._posiciones) - en_bd
+        faltan = en_bd - set(self._posiciones)
+        for clave in sobran:
+            self.eliminar(clave)
+        if faltan:
+            # Una clave negativa es una ImagenReferencia: se refresca su sitio completo
+            from .models import ImagenReferencia
+
+            sitios = {c for c in faltan if c > 0}
+            sitios |= set(ImagenReferencia.objects.filter(pk__in=[-c for c in faltan if c < 0]).values_list("sitio_id", flat=True))
+            self.refrescar_sitios(sitios)
+        if sobran or faltan:
+            logger.info(f"Índice de embeddings sincronizado: +{len(faltan)} -{len(sobran)} filas.")
+
+    def refrescar_sitios(self, sitio_ids):
+        """Vuelve a leer de la BD las filas de los sitios indicados."""
+        sitio_ids = list(sitio_ids)
+        if not sitio_ids:
+            return
+        claves, sitios, matriz = filas_desde_bd(sitio_ids)
+        por_sitio = {pk: ([], []) for pk in sitio_ids}
+        for clave, sitio_id, vector in zip(claves, sitios, matriz):
+            por_sitio[sitio_id][0].append(clave)
+            por_sitio[sitio_id][1].append(vector)
+        for sitio_id, (claves_sitio, vectores) in por_sitio.items():
+            self.reemplazar_sitio(sitio_id, claves_sitio, vectores)
+
+    # --- ARCHIVO MAPEADO EN MEMORIA ---
+    def guardar(self, directorio):
+        """
+        Escribe los códigos en un .npy (para abrirlo con mmap) y los ids, escalas y
+        la estructura IVF en indice.npz. Cada exportación usa un nombre de códigos nuevo y
+        indice.npz se reemplaza al final de forma atómica, así un proceso que lee
+        nunca mezcla dos versiones.
+        """
+        os.makedirs(directorio, exist_ok=True)
+        with self._lock:
+            if self._necesita_entrenar():
+                self.entrenar()
+            nombre_codigos = f"codigos-{self.codificador.formato}-{time.time_ns()}.npy"
+            np.save(os.path.join(directorio, nombre_codigos), self._codigos[:self.n])
+
+            temporal = os.path.join(directorio, f".{ARCHIVO_INDICE}.tmp")
+            with open(temporal, "wb") as f:
+                np.savez(
+                    f,
+                    ids=self.ids,
+                    sitios=self.sitios,
+                    agregacion=self.agregacion,
+                    formato=self.codificador.formato,
+                    escala=self.codificador.escala if self.codificador.escala is not None else np.empty(0),
+                    codigos=nombre_codigos,
+                    centroides=self.centroides if self.centroides is not None else np.empty((0, DIMENSION_EMBEDDING)),
+                    lista_de=self._lista_de[:self.n],
+                )
+            os.replace(temporal, os.path.join(directorio, ARCHIVO_INDICE))
+
+        # Los procesos que aún tengan mapeado un archivo anterior lo siguen viendo tras borrarlo
+        for nombre in os.listdir(directorio):
+            if nombre.startswith("codigos-") and nombre != nombre_codigos:
+                os.remove(os.path.join(directorio, nombre))
+        return nombre_codigos
+
+    @classmethod
+    def desde_archivo(cls, directorio, nprobe=8):
+        with np.load(os.path.join(directorio, ARCHIVO_INDICE)) as datos:
+            ids = datos["ids"]
+            sitios = datos["sitios"]
+            agregacion = str(datos["agregacion"])
+            formato = str(datos["formato"])
+            escala = datos["escala"]
+            nombre_codigos = str(datos["codigos"])
+            centroides = datos["centroides"]
+            lista_de = datos["lista_de"]
+
+        codigos = np.load(os.path.join(directorio, nombre_codigos), mmap_mode="c")
+        codificador = obtener_codificador(formato)(escala if escala.size else None)
+        indice = cls.__new__(cls)
+        indice._iniciar(ids, sitios, codigos, codificador, nprobe, agregacion)
+        if len(centroides):
+            indice.centroides = centroides.astype(np.float32)
+            indice._lista_de[:indice.n] = lista_de
+            indice._listas = [np.flatnonzero(lista_de == c) for c in range(len(centroides))]
+        indice._n_entrenado = indice.n
+        return indice
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, pk):
+        return int(pk) in self._posiciones
+
+    @property
+    def ids(self):
+        """Clave de cada fila."""
+        return self._ids[:self.n]
+
+    @property
+    def sitios(self):
+        """Sitio de cada fila."""
+        return self._sitios[:self.n]
+
+    @property
+    def matriz(self):
+        """Vectores reconstruidos en float32 (copia; para entrenar y comparar)."""
+        return self.codificador.decodificar(self._codigos[:self.n])
+
+    @property
+    def bytes_codigos(self):
+        return int(self.n * DIMENSION_EMBEDDING * np.dtype(self.codificador.dtype).itemsize)
+
+    # --- IVF ---
+    def entrenar(self):
+        """Calcula √n centroides y reparte todos los vectores en sus listas."""
+        with self._lock:
+            if self.n < self.MINIMO_IVF:
+                self.centroides = None
+                self._listas = []
+                self._lista_de[:] = -1
+                self._n_entrenado = self.n
+                return
+            n_listas = int(np.sqrt(self.n))
+            # Los centroides se ajustan sobre una muestra; luego se asignan todos los vectores
+            filas = np.arange(self.n)
+            if self.n > 64 * n_listas:
+                rng = np.random.default_rng(0)
+                filas = np.sort(rng.choice(self.n, size=64 * n_listas, replace=False))
+            muestra = normalizar(self.codificador.decodificar(self._codigos[filas]))
+            self.centroides, _ = kmeans_esferico(muestra, n_listas)
+            asignacion = np.argmax(
+                productos(self._codigos[:self.n], self.codificador.preparar_consulta(self.centroides)), axis=1
+            )
+            orden = np.argsort(asignacion, kind="stable")
+            cortes = np.searchsorted(asignacion[orden], np.arange(n_listas + 1))
+            self._listas = [orden[cortes[c]:cortes[c + 1]] for c in range(n_listas)]
+            self._lista_de[:self.n] = asignacion
+            self._n_entrenado = self.n
+            logger.info(f"Índice IVF entrenado: {self.n} vectores en {n_listas} listas.")
+
+    def _necesita_entrenar(self):
+        # Se reentrena la primera vez y cuando el catálogo se duplica o cae a la mitad
+        if self.centroides is None:
+            return self.n >= self.MINIMO_IVF and self._n_entrenado != self.n
+        return self.n > 2 * self._n_entrenado or self.n < self._n_entrenado // 2
+
+    def _asignar_lista(self, fila):
+        if self.centroides is None:
+            return
+        c = int(np.argmax(self.centroides @ self.codificador.decodificar(self._codigos[fila])))
+        self._listas[c] = np.append(self._listas[c], fila)
+        self._lista_de[fila] = c
+
+    def _quitar_de_lista(self, fila):
+        c = int(self._lista_de[fila])
+        if c >= 0:
+            lista = self._listas[c]
+            self._listas[c] = lista[lista != fila]
+            self._lista_de[fila] = -1
+
+    # --- ACTUALIZACIÓN INCREMENTAL ---
+    def insertar(self, clave, vector, sitio=None):
+        """Añade la fila o reemplaza su vector si ya estaba. Por defecto la clave es el sitio."""
+        vector = normalizar(vector).ravel()
+        clave = int(clave)
+        with self._lock:
+            fila = self._posiciones.get(clave)
+            if fila is None:
+                if self.n == len(self._ids):
+                    self._crecer()
+                fila = self.n
+                self.n += 1
+                self._ids[fila] = clave
+                self._posiciones[clave] = fila
+            else:
+                self._quitar_de_lista(fila)
+            self._sitios[fila] = clave if sitio is None else int(sitio)
+            self._codigos[fila] = self.codificador.codificar(vector)
+            self._asignar_lista(fila)
+
+    def eliminar(self, clave):
+        """Quita la fila moviendo la última a su hueco."""
+        with self._lock:
+            fila = self._posiciones.pop(int(clave), None)
+            if fila is None:
+                return
+            self._quitar_de_lista(fila)
+            ultima = self.n - 1
+            if fila != ultima:
+                pk_ultimo = int(self._ids[ultima])
+                self._ids[fila] = pk_ultimo
+                self._sitios[fila] = self._sitios[ultima]
+                self._codigos[fila] = self._codigos[ultima]
+                self._posiciones[pk_ultimo] = fila
+                c = int(self._lista_de[ultima])
+                self._lista_de[fila] = c
+                if c >= 0:
+                    lista = self._listas[c]
+                    lista[lista == ultima] = fila
+            self._lista_de[ultima] = -1
+            self.n -= 1
+
+    def reemplazar_sitio(self, sitio, claves, vectores):
+        """
+        Deja en el índice exactamente las imágenes indicadas del sitio (lista vacía = quitarlo).
+        Con agregación "centroide" se guarda una sola fila con la media de los vectores.
+        """
+        sitio = int(sitio)
+        with self._lock:
+            # Primero se copian las claves: las filas se mueven al eliminar
+            for clave in [int(c) for c in self._ids[:self.n][self._sitios[:self.n] == sitio]]:
+                self.eliminar(clave)
+            if not len(vectores):
+                return
+            if self.agregacion == "centroide":
+                _, centroide = centroides_por_sitio([sitio] * len(vectores), np.vstack(vectores))
+                self.insertar(sitio, centroide[0])
+                return
+            for clave, vector in zip(claves, vectores):
+                self.insertar(clave, vector, sitio=sitio)
+
+    def _crecer(self):
+        capacidad = max(16, 2 * len(self._ids))
+        for nombre, relleno in (("_ids", 0), ("_sitios", 0), ("_lista_de", -1)):
+            actual = getattr(self, nombre)
+            nuevo = np.full(capacidad, relleno, dtype=actual.dtype)
+            nuevo[:len(actual)] = actual
+            setattr(self, nombre, nuevo)
+        codigos = np.zeros((capacidad, DIMENSION_EMBEDDING), dtype=self.codificador.dtype)
+        codigos[:self.n] = self._codigos[:self.n]
+        self._codigos = codigos
+
+    # --- CONSULTAS ---
+    def puntuar(self, vector, ids=None):
+        """
+        Devuelve (sitios, puntuaciones) para los sitios indicados (o todos), agregando
+        sus imágenes. Las similitudes se recortan al rango 0-1 igual que calcular_similitud.
+        """
+        with self._lock:
+            if ids is None:
+                filas = np.arange(self.n)
+            else:
+                filas = np.flatnonzero(np.isin(self._sitios[:self.n], np.asarray(list(ids), dtype=np.int64)))
+
+            if filas.size == 0 or vector is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=DTYPE_EMBEDDING)
+
+            consulta = self.codificador.preparar_consulta(normalizar(vector).ravel())
+            similitudes = productos(self._codigos[filas], consulta)
+            sitios, puntuaciones = agrupar_por_sitio(self._sitios[filas], similitudes, self.agregacion)
+            return sitios, np.clip(puntuaciones, 0.0, 1.0)
+
+    def buscar(self, vector, k=10, nprobe=None):
+        """
+        Los k sitios más parecidos de todo el catálogo: (sitios, puntuaciones) de mayor a menor.
+        Con agregación "media" solo promedian las imágenes de las listas recorridas.
+        """
+        if vector is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=DTYPE_EMBEDDING)
+
+        consulta = normalizar(vector).ravel()
+        with self._lock:
+            if self._necesita_entrenar():
+                self.entrenar()
+            if self.centroides is None:
+                filas = np.arange(self.n)
+            else:
+                nprobe = min(nprobe or self.nprobe, len(self._listas))
+                cercanas = np.argpartition(-(self.centroides @ consulta), nprobe - 1)[:nprobe]
+                filas = np.concatenate([self._listas[c] for c in cercanas])
+
+            if filas.size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=DTYPE_EMBEDDING)
+
+            similitudes = productos(self._codigos[filas], self.codificador.preparar_consulta(consulta))
+            sitios, puntuaciones = agrupar_por_sitio(self._sitios[filas], similitudes, self.agregacion)
+            k = min(k, sitios.size)
+            mejores = np.argpartition(-puntuaciones, k - 1)[:k]
+            mejores = mejores[np.argsort(-puntuaciones[mejores], kind="stable")]
+            return sitios[mejores], np.clip(puntuaciones[mejores], 0.0, 1.0)
+
+
+# --- ÍNDICE COMPARTIDO DEL PROCESO ---
+_indice = None
+_lock = threading.Lock()
+# Los cambios hechos en otro worker o por un comando de gestión se detectan por aquí
+_version = VersionCompartida("indice_embeddings")
+
+
+def obtener_indice():
+    """Construye el índice en el primer uso y lo reutiliza mientras siga vigente."""
+    global _indice
+    indice = _indice
+    if indice is None or not _version.vigente():
+        with _lock:
+            if _indice is None or not _version.vigente():
+                version = _version.leer()
+                _indice = IndiceEmbeddings.desde_bd()
+                _version.marcar(version)
+                logger.info(f"Índice de embeddings cargado con {len(_indice)} imágenes de referencia.")
+            indice = _indice
+    return indice
+
+
+def invalidar_indice():
+    """Descarta el índice entero; el siguiente uso lo reconstruye desde la BD (cargas masivas)."""
+    global _indice
+    with _lock:
+        _indice = None
+    _version.incrementar()
+
+
+def refrescar_sitio_en_indice(sitio_id):
+    """
+    Aplica el alta, cambio o baja de un sitio (o de una de sus imágenes) al índice ya
+    cargado, releyendo solo las filas de ese sitio. Si el índice aún no se cargó no hay
+    nada que hacer: se leerá completo de la BD. Los demás procesos descartan su copia.
+    """
+    indice = _indice
+    if indice is None:
+        _version.incrementar()
+        return
+    indice.refrescar_sitios([sitio_id])
+    if indice.codificador.necesita_reajuste():
+        # Demasiados valores recortados con las escalas actuales: se reconstruye desde la BD
+        logger.info("Escalas int8 del índice desfasadas; se reconstruirá desde la BD.")
+        descartar_archivo_indice()
+        invalidar_indice()
+    else:
+        _version.incrementar(aplicado=True)
+
+
+def descartar_archivo_indice():
+    """
+    Un vector existente cambió: el archivo exportado ya no es fiable (la sincronización
+    solo detecta altas y bajas). Los procesos volverán a leer de la BD hasta la próxima exportación.
+    """
+    from django.conf import settings
+
+    directorio = getattr(settings, "EMBEDDINGS_DIR", None)
+    if directorio:
+        try:
+            os.remove(os.path.join(directorio, ARCHIVO_INDICE))
+        except FileNotFoundError:
+            pass
+
+
+def quitar_sitio_del_indice(sitio_id):
+    indice = _indice
+    if indice is not None:
+        indice.reemplazar_sitio(sitio_id, [], [])
+    _version.incrementar(aplicado=indice is not None)
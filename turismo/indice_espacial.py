@@ -0,0 +1,138 @@
+import logging
+import threading
+
+import numpy as np
+
+from core.geografia import dentro_de_ecuador
+from core.versiones import VersionCompartida
+
+from .utils import RADIO_TIERRA_KM, distancias_km
+
+logger = logging.getLogger(__name__)
+
+
+class IndiceEspacial:
+    """
+    BallTree con métrica haversine sobre las coordenadas de los sitios activos dentro de
+    ECUADOR_BBOX (los demás se descartan al construirlo, con un aviso en el log).
+    Responde k vecinos más cercanos y búsquedas por radio sin recorrer la tabla.
+    El árbol solo elige candidatos; las distancias en km salen de utils.distancias_km
+    para que todo turismo use el mismo cálculo.
+    """
+
+    def __init__(self, ids, latitudes, longitudes, categorias):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.categorias = np.asarray(categorias, dtype=object)
+        self._posiciones = {int(pk): i for i, pk in enumerate(self.ids)}
+        self._arbol = None
+        if len(self.ids):
+            # Import diferido: sklearn tarda en importarse y solo hace falta al construir el índice
+            from sklearn.neighbors import BallTree
+
+            self._arbol = BallTree(
+                np.radians(np.column_stack([self.latitudes, self.longitudes])),
+                metric="haversine",
+            )
+
+    @classmethod
+    def desde_bd(cls):
+        from .models import SitioTuristico
+
+        filas = SitioTuristico.objects.filter(
+            activo=True, latitud__isnull=False, longitud__isnull=False
+        ).values_list("id", "latitud", "longitud", "categoria")
+
+        ids, lats, lons, categorias = [], [], [], []
+        descartados = 0
+        for pk, lat, lon, categoria in filas:
+            lat, lon = float(lat), float(lon)
+            if not dentro_de_ecuador(lat, lon):
+                descartados += 1
+                continue
+            ids.append(pk)
+            lats.append(lat)
+            lons.append(lon)
+            categorias.append(categoria)
+
+        if descartados:
+            logger.warning(f"Índice espacial: {descartados} sitios fuera de Ecuador no se indexaron.")
+        return cls(ids, lats, lons, categorias)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _consulta(self, lat, lon):
+        return np.radians([[float(lat), float(lon)]])
+
+    def _distancias(self, lat, lon, posiciones):
+        return distancias_km(lat, lon, self.latitudes[posiciones], self.longitudes[posiciones])
+
+    def vecinos(self, lat, lon, k, excluir=None):
+        """
+        Devuelve (ids, distancias_km) de los k sitios más cercanos, ordenados por distancia.
+        `excluir` es un id que no debe aparecer en el resultado (p. ej. el sitio actual).
+        """
+        if self._arbol is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        k_real = min(len(self.ids), k + (1 if excluir is not None else 0))
+        posiciones = self._arbol.query(self._consulta(lat, lon), k=k_real, return_distance=False)[0]
+        ids, distancias = self.ids[posiciones], self._distancias(lat, lon, posiciones)
+
+        if excluir is not None:
+            mascara = ids != int(excluir)
+            ids, distancias = ids[mascara], distancias[mascara]
+        return ids[:k], distancias[:k]
+
+    def en_radio(self, lat, lon, radio_km, excluir=None):
+        """Devuelve (ids, distancias_km) de los sitios a menos de radio_km, ordenados por distancia."""
+        if self._arbol is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        posiciones = self._arbol.query_radius(
+            self._consulta(lat, lon), r=radio_km / RADIO_TIERRA_KM
+        )[0]
+        distancias = self._distancias(lat, lon, posiciones)
+        orden = np.argsort(distancias, kind="stable")
+        ids, distancias = self.ids[posiciones[orden]], distancias[orden]
+
+        if excluir is not None:
+            mascara = ids != int(excluir)
+            ids, distancias = ids[mascara], distancias[mascara]
+        return ids, distancias
+
+    def categorias_de(self, ids):
+        """Categorías de los sitios indicados, en el mismo orden."""
+        return self.categorias[[self._posiciones[int(pk)] for pk in ids]]
+
+
+# --- ÍNDICE COMPARTIDO DEL PROCESO ---
+_indice = None
+_lock = threading.Lock()
+# Los demás workers (y los comandos de carga) avisan de cambios por aquí
+_version = VersionCompartida("indice_espacial")
+
+
+def obtener_indice_espacial():
+    """Construye el índice en la primera consulta y lo reutiliza mientras siga vigente."""
+    global _indice
+    indice = _indice
+    if indice is None or not _version.vigente():
+        with _lock:
+            if _indice is None or not _version.vigente():
+                version = _version.leer()
+                _indice = IndiceEspacial.desde_bd()
+                _version.marcar(version)
+                logger.info(f"Índice espacial cargado con {len(_indice)} sitios.")
+            indice = _indice
+    return indice
+
+
+def invalidar_indice_espacial():
+    """Se llama desde las señales post_save/post_delete de SitioTuristico y tras las cargas masivas."""
+    global _indice
+    with _lock:
+        _indice = None
+    _version.incrementar()
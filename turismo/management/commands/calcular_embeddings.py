@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from turismo.models import ImagenReferencia, SitioTuristico
+from turismo.embeddings import (
+    calcular_embedding_imagen, calcular_embedding_sitio, descartar_archivo_indice, invalidar_indice, vector_a_bytes,
+)
+
+
+class Command(BaseCommand):
+    help = "Precalcula los embeddings MobileNetV2 de las imágenes de referencia"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--todos",
+            action="store_true",
+            help="Recalcula también los sitios que ya tienen embedding",
+        )
+
+    def handle(self, *args, **options):
+        sitios = SitioTuristico.objects.exclude(imagen_referencia="").exclude(imagen_referencia__isnull=True)
+        if not options["todos"]:
+            sitios = sitios.filter(embedding__isnull=True)
+
+        total = sitios.count()
+        self.stdout.write(self.style.SUCCESS(f"🚀 Calculando embeddings de {total} sitios..."))
+
+        calculados = 0
+        fallidos = 0
+
+        for sitio in sitios.iterator():
+            vector = calcular_embedding_sitio(sitio)
+            if vector is None:
+                fallidos += 1
+                self.stdout.write(self.style.WARNING(f"  ⚠️ No se pudo procesar: {sitio.nombre}"))
+                continue
+
+            # update() para no disparar las señales del modelo en cada fila
+            SitioTuristico.objects.filter(pk=sitio.pk).update(embedding=vector_a_bytes(vector))
+            calculados += 1
+
+            if calculados % 50 == 0:
+                self.stdout.write(f"⏳ Procesados {calculados}/{total} sitios...")
+
+        # Imágenes adicionales de cada sitio
+        imagenes = ImagenReferencia.objects.select_related("sitio")
+        if not options["todos"]:
+            imagenes = imagenes.filter(embedding__isnull=True)
+
+        for imagen in imagenes.iterator():
+            vector = calcular_embedding_imagen(imagen.imagen, f"{imagen.pk} del sitio {imagen.sitio_id}")
+            if vector is None:
+                fallidos += 1
+                self.stdout.write(self.style.WARNING(f"  ⚠️ No se pudo procesar: {imagen}"))
+                continue
+            ImagenReferencia.objects.filter(pk=imagen.pk).update(embedding=vector_a_bytes(vector))
+            calculados += 1
+
+        if options["todos"] and calculados:
+            # Se sobrescribieron vectores existentes: el archivo exportado ya no coincide con la BD
+            descartar_archivo_indice()
+        invalidar_indice()
+
+        self.stdout.write("---")
+        self.stdout.write(self.style.SUCCESS(f"✅ Embeddings calculados: {calculados}"))
+        if fallidos:
+            self.stdout.write(self.style.WARNING(f"⚠️ Sitios con error: {fallidos}"))
+        if options["todos"] and calculados:
+            self.stdout.write("ℹ️ Índice exportado descartado; ejecuta exportar_embeddings para regenerarlo.")
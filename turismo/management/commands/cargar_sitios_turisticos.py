@@ -1,85 +1,250 @@
 import csv
+import json
 import os
+import time
+from itertools import islice
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from core.cache_resultados import invalidar_cache
+from core.geografia import dentro_de_ecuador
 from turismo.models import SitioTuristico
+from turismo.embeddings import invalidar_indice
+from turismo.indice_espacial import invalidar_indice_espacial
+
+# Campos que se sobrescriben cuando el sitio (nombre, provincia) ya existe
+CAMPOS_ACTUALIZABLES = ["categoria", "latitud", "longitud", "descripcion", "activo"]
+
+# Motivos por los que una fila no se carga (van en el reporte)
+COORDENADAS_INVALIDAS = "coordenadas_invalidas"
+FUERA_DE_ECUADOR = "fuera_de_ecuador"
+DUPLICADO = "duplicado"
+
 
 class Command(BaseCommand):
     help = "Carga sitios turísticos desde CSV a Supabase (PostgreSQL)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ruta",
+            # Por defecto el CSV del proyecto: tu_proyecto/turismo/data/sitios_turisticos.csv
+            default=str(Path(settings.BASE_DIR) / "turismo" / "data" / "sitios_turisticos.csv"),
+            help="CSV a cargar",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=500,
+            help="Filas por sentencia INSERT/UPDATE (por defecto 500)",
+        )
+        parser.add_argument(
+            "--bloque",
+            type=int,
+            default=5000,
+            help="Filas del CSV que se leen, guardan y confirman juntas (por defecto 5000)",
+        )
+        parser.add_argument(
+            "--reiniciar",
+            action="store_true",
+            help="Ignora el punto de control y empieza desde la primera fila",
+        )
+
     def handle(self, *args, **kwargs):
-        # 1. Definir la ruta del archivo
-        # Asegúrate de que el CSV esté en: tu_proyecto/turismo/data/sitios_turisticos.csv
-        ruta = Path(settings.BASE_DIR) / "turismo" / "data" / "sitios_turisticos.csv"
+        ruta = Path(kwargs["ruta"])
 
         if not ruta.exists():
             self.stdout.write(self.style.ERROR(f"❌ CSV no encontrado en: {ruta}"))
             return
 
+        # Punto de control y reporte de filas omitidas, junto al CSV
+        ruta_control = ruta.with_name(ruta.name + ".checkpoint.json")
+        ruta_reporte = ruta.with_name(ruta.name + ".omitidas.jsonl")
+
+        firma = self.firma_archivo(ruta)
+        reanudar_desde = 0
+        control = {}
+        if not kwargs["reiniciar"] and ruta_control.exists():
+            control = json.loads(ruta_control.read_text())
+            if control.get("firma") == firma:
+                reanudar_desde = control["filas"]
+                self.stdout.write(self.style.WARNING(f"↩️ Reanudando desde la fila {reanudar_desde + 1}"))
+            else:
+                control = {}
+                self.stdout.write(self.style.WARNING("⚠️ El CSV cambió desde la última carga; se empieza de cero."))
+
         self.stdout.write(self.style.SUCCESS(f"🚀 Iniciando carga desde: {ruta}"))
+        inicio = time.perf_counter()
+
+        totales = {"creados": 0, "actualizados": 0, "omitidas": 0}
+        if reanudar_desde:
+            totales.update({k: control.get(k, 0) for k in totales})
 
-        creados = 0
-        actualizados = 0
-        skipped = 0
+        # Los sitios con id mayor que este los creó esta carga (o la que se reanuda): si su clave
+        # vuelve a aparecer en un bloque posterior es un duplicado del CSV. Así no hace falta
+        # recordar las claves de todo el archivo.
+        desde_id = control.get("desde_id")
+        if desde_id is None:
+            desde_id = SitioTuristico.objects.aggregate(maximo=Max("id"))["maximo"] or 0
+        # Bloque actual: filas a guardar (la primera aparición de cada clave en el bloque gana)
+        # y filas omitidas que se escriben al confirmarlo
+        filas = {}
+        omitidas = []
+        leidas = 0
 
-        # 2. Abrir el archivo con 'utf-8-sig' para evitar errores de BOM de Excel
-        with open(ruta, newline='', encoding="utf-8-sig") as csvfile:
+        with open(ruta_reporte, "a" if reanudar_desde else "w", encoding="utf-8") as reporte, \
+                open(ruta, newline='', encoding="utf-8-sig") as csvfile:
+            # Abrir el archivo con 'utf-8-sig' para evitar errores de BOM de Excel
             reader = csv.DictReader(csvfile)
 
-            for i, row in enumerate(reader, start=1):
-                # Intentar obtener lat/lon de varias posibles columnas
-                lat_val = row.get("lat") or row.get("latitude") or row.get("latitud")
-                lon_val = row.get("lon") or row.get("lng") or row.get("long") or row.get("longitud")
-
-                try:
-                    # Validar que los valores existan y sean números
-                    if lat_val is None or lon_val is None:
-                        raise ValueError("Valores nulos")
-                    
-                    latf = float(str(lat_val).replace(',', '.'))
-                    lonf = float(str(lon_val).replace(',', '.'))
-                except (ValueError, TypeError):
-                    self.stdout.write(self.style.WARNING(f"⚠️ Fila {i}: Coordenadas inválidas ({lat_val}, {lon_val}). Se omite."))
-                    skipped += 1
-                    continue
-
-                # 3. Validar coordenadas dentro de Ecuador (incluyendo Galápagos)
-                if not (-6.0 <= latf <= 3.0 and -93.0 <= lonf <= -75.0):
-                    self.stdout.write(self.style.WARNING(f"⚠️ Fila {i}: Fuera de Ecuador (lat={latf}, lon={lonf}). Se omite."))
-                    skipped += 1
-                    continue
-
-                # 4. Guardar en la base de datos (Supabase)
-                # Usamos update_or_create para no duplicar si el nombre y provincia coinciden
-                nombre_sitio = row.get("nombre") or f"sitio_{i}"
-                provincia_sitio = row.get("provincia", "Desconocida")
-
-                obj, created = SitioTuristico.objects.update_or_create(
-                    nombre=nombre_sitio,
-                    provincia=provincia_sitio,
-                    defaults={
-                        'categoria': (row.get("categoria") or "otro").lower().strip(),
-                        'latitud': latf,
-                        'longitud': lonf,
-                        'descripcion': row.get("descripcion", ""),
-                        'activo': True
-                    }
-                )
-
-                if created:
-                    creados += 1
+            # Las filas ya cargadas en una ejecución anterior se saltan sin validarlas
+            for i, row in enumerate(islice(reader, reanudar_desde, None), start=reanudar_desde + 1):
+                fila, motivo = self.validar_fila(i, row)
+
+                leidas += 1
+                if fila and fila[0] in filas:
+                    motivo = DUPLICADO
+                if motivo:
+                    omitidas.append(self.omitida(i, row, motivo))
                 else:
-                    actualizados += 1
+                    filas[fila[0]] = (i, row, fila[1])
+
+                if i % kwargs["bloque"] == 0:
+                    self.confirmar_bloque(filas, omitidas, i, totales, kwargs["lote"], reporte, ruta_control, firma,
+                                          desde_id)
+                    filas, omitidas = {}, []
+                    segundos = time.perf_counter() - inicio
+                    self.stdout.write(f"⏳ Fila {i}: {leidas / max(segundos, 1e-9):.0f} filas/s")
+
+            ultima = reanudar_desde + leidas
+            self.confirmar_bloque(filas, omitidas, ultima, totales, kwargs["lote"], reporte, ruta_control, firma,
+                                  desde_id)
 
-                # Mostrar progreso cada 100 registros
-                if (creados + actualizados) % 100 == 0:
-                    self.stdout.write(f"⏳ Procesados {creados + actualizados} sitios...")
+        # Carga completa: la próxima ejecución vuelve a empezar desde el principio
+        ruta_control.unlink(missing_ok=True)
 
-        # 5. Resumen final
+        # bulk_create/bulk_update no disparan señales: los índices se invalidan a mano
+        invalidar_indice_espacial()
+        invalidar_indice()
+        invalidar_cache("recomendacion_foto")
+
+        # Resumen final
+        segundos = time.perf_counter() - inicio
         self.stdout.write("---")
         self.stdout.write(self.style.SUCCESS(f"✅ Carga finalizada con éxito"))
-        self.stdout.write(f"➕ Nuevos creados: {creados}")
-        self.stdout.write(f"🔄 Actualizados: {actualizados}")
-        if skipped:
-            self.stdout.write(self.style.WARNING(f"⚠️ Filas omitidas: {skipped}"))
\ No newline at end of file
+        self.stdout.write(f"➕ Nuevos creados: {totales['creados']}")
+        self.stdout.write(f"🔄 Actualizados: {totales['actualizados']}")
+        if totales["omitidas"]:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ Filas omitidas: {totales['omitidas']} (detalle en {ruta_reporte})"
+            ))
+        self.stdout.write(f"⏱️ {leidas} filas en {segundos:.2f}s ({leidas / max(segundos, 1e-9):.0f} filas/s)")
+        self.stdout.write(
+            "ℹ️ Los servidores en marcha recargan los índices en su siguiente petición si comparten "
+            f"caché (REDIS_URL); si no, en como mucho {getattr(settings, 'INDICES_TTL', 300)} s."
+        )
+
+    def validar_fila(self, i, row):
+        """Devuelve ((clave, campos), None) si la fila es válida o (None, motivo)."""
+        # Intentar obtener lat/lon de varias posibles columnas
+        lat_val = row.get("lat") or row.get("latitude") or row.get("latitud")
+        lon_val = row.get("lon") or row.get("lng") or row.get("long") or row.get("longitud")
+
+        try:
+            # Validar que los valores existan y sean números
+            if lat_val is None or lon_val is None:
+                raise ValueError("Valores nulos")
+
+            latf = float(str(lat_val).replace(',', '.'))
+            lonf = float(str(lon_val).replace(',', '.'))
+        except (ValueError, TypeError):
+            return None, COORDENADAS_INVALIDAS
+
+        # Validar coordenadas dentro de Ecuador (incluyendo Galápagos)
+        if not dentro_de_ecuador(latf, lonf):
+            return None, FUERA_DE_ECUADOR
+
+        nombre_sitio = row.get("nombre") or f"sitio_{i}"
+        provincia_sitio = row.get("provincia", "Desconocida")
+        return ((nombre_sitio, provincia_sitio), {
+            'categoria': (row.get("categoria") or "otro").lower().strip(),
+            'latitud': latf,
+            'longitud': lonf,
+            'descripcion': row.get("descripcion", ""),
+            'activo': True
+        }), None
+
+    def omitida(self, i, row, motivo):
+        return {
+            "fila": i,
+            "motivo": motivo,
+            "nombre": row.get("nombre"),
+            "provincia": row.get("provincia"),
+            "lat": row.get("lat") or row.get("latitude") or row.get("latitud"),
+            "lon": row.get("lon") or row.get("lng") or row.get("long") or row.get("longitud"),
+        }
+
+    def confirmar_bloque(self, filas, omitidas, fila_final, totales, lote, reporte, ruta_control, firma, desde_id):
+        """
+        Guarda el bloque, y solo después de confirmarlo escribe sus filas omitidas y el
+        punto de control. Si la carga se corta a medio bloque, su transacción se deshace y
+        al reanudar se repite ese bloque entero.
+        """
+        creados, actualizados, duplicadas = self.guardar_en_lote(filas, lote, desde_id)
+        omitidas = sorted(omitidas + duplicadas, key=lambda registro: registro["fila"])
+        totales["creados"] += creados
+        totales["actualizados"] += actualizados
+        totales["omitidas"] += len(omitidas)
+
+        for registro in omitidas:
+            reporte.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        reporte.flush()
+
+        # Escritura atómica del punto de control
+        temporal = ruta_control.with_name(ruta_control.name + ".tmp")
+        temporal.write_text(json.dumps({"firma": firma, "filas": fila_final, "desde_id": desde_id, **totales}))
+        os.replace(temporal, ruta_control)
+
+    def firma_archivo(self, ruta):
+        """Tamaño y fecha de modificación: si cambian, el punto de control ya no sirve."""
+        info = ruta.stat()
+        return f"{info.st_size}-{int(info.st_mtime)}"
+
+    def guardar_en_lote(self, filas, lote, desde_id):
+        """
+        Separa las filas en altas, cambios y duplicadas con una sola consulta de claves
+        existentes y aplica altas y cambios con bulk_create/bulk_update dentro de una transacción.
+        Una clave que ya existe con id mayor que `desde_id` la creó un bloque anterior de
+        esta carga: la primera aparición gana y esta se reporta como duplicada. Los sitios
+        que ya existían antes de la carga se actualizan con cada bloque en que aparezcan.
+        """
+        if not filas:
+            return 0, 0, []
+
+        # Una consulta para las claves (nombre, provincia) del bloque que ya existen
+        existentes = {}
+        consulta = SitioTuristico.objects.filter(
+            nombre__in={nombre for nombre, _ in filas},
+            provincia__in={provincia for _, provincia in filas},
+        ).values_list("id", "nombre", "provincia").order_by("id")
+        for pk, nombre, provincia in consulta:
+            existentes.setdefault((nombre, provincia), pk)
+
+        nuevos = []
+        cambios = []
+        duplicadas = []
+        for (nombre, provincia), (i, row, campos) in filas.items():
+            pk = existentes.get((nombre, provincia))
+            if pk is None:
+                nuevos.append(SitioTuristico(nombre=nombre, provincia=provincia, **campos))
+            elif pk > desde_id:
+                duplicadas.append(self.omitida(i, row, DUPLICADO))
+            else:
+                cambios.append(SitioTuristico(pk=pk, nombre=nombre, provincia=provincia, **campos))
+
+        with transaction.atomic():
+            SitioTuristico.objects.bulk_create(nuevos, batch_size=lote)
+            SitioTuristico.objects.bulk_update(cambios, CAMPOS_ACTUALIZABLES, batch_size=lote)
+
+        return len(nuevos), len(cambios), duplicadas
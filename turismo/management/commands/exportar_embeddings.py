@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from turismo.cuantizacion import CODIFICADORES
+from turismo.embeddings import DIMENSION_EMBEDDING, IndiceEmbeddings, invalidar_indice
+
+
+class Command(BaseCommand):
+    help = "Exporta el índice de embeddings (comprimido) a disco para que los workers lo abran con mmap"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--formato",
+            choices=list(CODIFICADORES),
+            default=getattr(settings, "EMBEDDINGS_FORMATO", "int8"),
+            help="Formato de los códigos (por defecto EMBEDDINGS_FORMATO)",
+        )
+        parser.add_argument(
+            "--salida",
+            default=settings.EMBEDDINGS_DIR,
+            help="Directorio de destino (por defecto EMBEDDINGS_DIR)",
+        )
+
+    def handle(self, *args, **options):
+        # Siempre desde la BD: el archivo anterior puede estar obsoleto
+        indice = IndiceEmbeddings.desde_bd(formato=options["formato"], usar_archivo=False)
+        nombre = indice.guardar(options["salida"])
+        invalidar_indice()
+
+        float32_kb = len(indice) * DIMENSION_EMBEDDING * 4 / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(indice)} vectores exportados en {options['formato']} → {os.path.join(options['salida'], nombre)}"
+        ))
+        self.stdout.write(
+            f"   Códigos: {indice.bytes_codigos / 1024:.1f} KB (en float32 serían {float32_kb:.1f} KB)"
+        )
@@ -1,50 +1,252 @@
+import hashlib
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.core.files import File
 from django.conf import settings
-from turismo.models import SitioTuristico
+from django.db import transaction
+from core.cache_resultados import invalidar_cache
+from turismo.models import ImagenReferencia, SitioTuristico
+from turismo.embeddings import descartar_archivo_indice, invalidar_indice, vector_a_bytes
+
+EXTENSIONES = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+# Imágenes por pasada de MobileNet al precalcular los embeddings
+LOTE_EMBEDDINGS = 32
+
+
+def normalizar_nombre(texto):
+    # "cerro_de_chalcalo" y "Cerro De Chalcalo" -> "cerro de chalcalo"
+    return " ".join(texto.replace("_", " ").casefold().split())
+
+
+def nombre_original(nombre):
+    """
+    Nombre del archivo local a partir del guardado en el storage. Si ya existía uno igual,
+    Django le añade "_" + 7 caracteres aleatorios (foto.jpg -> foto_AbC1234.jpg).
+    """
+    return re.sub(r"_[A-Za-z0-9]{7}(\.[^.]+)$", r"\1", os.path.basename(nombre))
+
+
+def sha256_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class Subida:
+    """Una foto local que hay que subir y registrar."""
+
+    def __init__(self, ruta, sitio, sha256, principal=False, imagen_id=None):
+        self.ruta = ruta
+        self.sitio = sitio
+        self.sha256 = sha256
+        self.principal = principal
+        # Si ya existía una ImagenReferencia con ese nombre de archivo, se reemplaza
+        self.imagen_id = imagen_id
+        # Archivo que queda huérfano en el storage al reemplazar una foto modificada
+        self.nombre_anterior = None
+        self.nombre_guardado = None
+        self.vector = None
+
 
 class Command(BaseCommand):
     help = "Sube imágenes normalizando nombres de carpetas y base de datos"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ruta",
+            default=str(Path(settings.BASE_DIR) / "media" / "sitios"),
+            help="Carpeta con subcarpetas <provincia>/<sitio>/ (por defecto media/sitios)",
+        )
+        parser.add_argument("--hilos", type=int, default=8, help="Subidas simultáneas (por defecto 8)")
+        parser.add_argument("--reintentos", type=int, default=3, help="Reintentos por imagen (por defecto 3)")
+
     def handle(self, *args, **kwargs):
-        ruta_media = Path(settings.BASE_DIR) / "media" / "sitios"
+        ruta_media = Path(kwargs["ruta"])
 
         if not ruta_media.exists():
             self.stdout.write(self.style.ERROR(f"❌ Carpeta no encontrada: {ruta_media}"))
             return
 
-        creados = 0
-
-        for carpeta_provincia in ruta_media.iterdir():
-            if carpeta_provincia.is_dir():
-                self.stdout.write(self.style.MIGRATE_LABEL(f"\n--- Provincia: {carpeta_provincia.name} ---"))
-
-                for carpeta_sitio in carpeta_provincia.iterdir():
-                    if carpeta_sitio.is_dir():
-                        # 1. NORMALIZACIÓN: "cerro_de_chalcalo" -> "cerro de chalcalo"
-                        nombre_carpeta = carpeta_sitio.name.replace('_', ' ').lower().strip()
-                        
-                        # 2. BUSQUEDA INTELIGENTE: Buscamos ignorando mayúsculas/minúsculas
-                        # __iexact hace que "Cerro De Chalcalo" sea igual a "cerro de chalcalo"
-                        sitio = SitioTuristico.objects.filter(nombre__iexact=nombre_carpeta).first()
-
-                        if sitio:
-                            if sitio.imagen_referencia:
-                                self.stdout.write(f"  ⏭️  {sitio.nombre} ya tiene imagen.")
-                                continue
-
-                            # 3. Buscar imagen (JPG o PNG)
-                            imagenes = list(carpeta_sitio.glob("*.jpg")) + list(carpeta_sitio.glob("*.png"))
-                            if imagenes:
-                                foto_path = imagenes[0]
-                                with open(foto_path, 'rb') as f:
-                                    sitio.imagen_referencia.save(foto_path.name, File(f), save=True)
-                                self.stdout.write(self.style.SUCCESS(f"  ✅ Imagen subida: {sitio.nombre}"))
-                                creados += 1
-                        else:
-                            # Si no lo encuentra, te avisa para que revises si el nombre en el CSV es igual
-                            self.stdout.write(self.style.WARNING(f"  ❓ No encontrado en DB: '{nombre_carpeta}'"))
-
-        self.stdout.write(self.style.SUCCESS(f"\n✨ Proceso finalizado. Se subieron {creados} imágenes nuevas."))
\ No newline at end of file
+        subidas = self.planificar(ruta_media)
+        if not subidas:
+            self.stdout.write(self.style.SUCCESS("\n✨ Proceso finalizado. No hay imágenes nuevas ni modificadas."))
+            return
+
+        self.subir(subidas, kwargs["hilos"], kwargs["reintentos"])
+        correctas = [s for s in subidas if s.nombre_guardado]
+        self.calcular_embeddings(correctas)
+        self.registrar(correctas)
+
+        # bulk_create/bulk_update no disparan señales: índices, caché y archivo exportado a mano
+        invalidar_indice()
+        descartar_archivo_indice()
+        invalidar_cache("recomendacion_foto")
+
+        fallidas = len(subidas) - len(correctas)
+        self.stdout.write(self.style.SUCCESS(f"\n✨ Proceso finalizado. Se subieron {len(correctas)} imágenes."))
+        if fallidas:
+            self.stdout.write(self.style.ERROR(f"❌ {fallidas} imágenes no se pudieron subir; vuelve a ejecutar el comando."))
+
+    def planificar(self, ruta_media):
+        """
+        Empareja cada carpeta con su sitio usando un diccionario de nombres normalizados
+        (una consulta para sitios y otra para sus imágenes) y decide qué archivos subir:
+        los que no están o cuyo contenido (SHA-256) cambió.
+        """
+        por_nombre = {}
+        for sitio in SitioTuristico.objects.only("id", "nombre", "provincia", "imagen_referencia", "imagen_sha256"):
+            por_nombre.setdefault(normalizar_nombre(sitio.nombre), []).append(sitio)
+
+        imagenes_por_sitio = {}
+        for pk, sitio_id, nombre, sha256 in ImagenReferencia.objects.values_list("id", "sitio_id", "imagen", "sha256"):
+            imagenes_por_sitio.setdefault(sitio_id, []).append((pk, nombre, sha256))
+
+        subidas = []
+        omitidas = 0
+        for carpeta_provincia in sorted(ruta_media.iterdir()):
+            if not carpeta_provincia.is_dir():
+                continue
+            for carpeta_sitio in sorted(carpeta_provincia.iterdir()):
+                if not carpeta_sitio.is_dir():
+                    continue
+                nombre_carpeta = normalizar_nombre(carpeta_sitio.name)
+                candidatos = por_nombre.get(nombre_carpeta)
+                if not candidatos:
+                    # Si no lo encuentra, te avisa para que revises si el nombre en el CSV es igual
+                    self.stdout.write(self.style.WARNING(f"  ❓ No encontrado en DB: '{nombre_carpeta}'"))
+                    continue
+                # Con nombres repetidos en varias provincias manda la carpeta de provincia
+                provincia = normalizar_nombre(carpeta_provincia.name)
+                sitio = next((s for s in candidatos if normalizar_nombre(s.provincia) == provincia), candidatos[0])
+
+                nuevas, sin_cambios = self.planificar_sitio(sitio, carpeta_sitio, imagenes_por_sitio.get(sitio.pk, []))
+                subidas += nuevas
+                omitidas += sin_cambios
+
+        self.stdout.write(f"📋 {len(subidas)} imágenes para subir, {omitidas} sin cambios.")
+        return subidas
+
+    def planificar_sitio(self, sitio, carpeta_sitio, imagenes):
+        archivos = sorted(p for patron in EXTENSIONES for p in carpeta_sitio.glob(patron))
+        hashes = {sha for _, _, sha in imagenes if sha}
+        if sitio.imagen_sha256:
+            hashes.add(sitio.imagen_sha256)
+        principal = nombre_original(sitio.imagen_referencia.name) if sitio.imagen_referencia else None
+        por_archivo = {nombre_original(nombre): (pk, nombre) for pk, nombre, _ in imagenes}
+
+        subidas = []
+        sin_cambios = 0
+        tiene_principal = bool(principal)
+        for ruta in archivos:
+            sha256 = sha256_archivo(ruta)
+            if sha256 in hashes:
+                sin_cambios += 1
+                continue
+            hashes.add(sha256)
+            if not tiene_principal or ruta.name == principal:
+                # La primera foto es la principal si el sitio no tiene; si cambió, se reemplaza
+                subida = Subida(ruta, sitio, sha256, principal=True)
+                subida.nombre_anterior = sitio.imagen_referencia.name if tiene_principal else None
+                tiene_principal = True
+            else:
+                anterior = por_archivo.get(ruta.name)
+                subida = Subida(ruta, sitio, sha256, imagen_id=anterior[0] if anterior else None)
+                subida.nombre_anterior = anterior[1] if anterior else None
+            subidas.append(subida)
+        return subidas, sin_cambios
+
+    def subir(self, subidas, hilos, reintentos):
+        """Sube los archivos al storage (local o Supabase) con un pool de hilos acotado."""
+        total_bytes = sum(s.ruta.stat().st_size for s in subidas)
+        self.stdout.write(self.style.MIGRATE_LABEL(
+            f"\n--- Subiendo {len(subidas)} imágenes ({total_bytes / 1e6:.1f} MB) con {hilos} hilos ---"
+        ))
+
+        inicio = time.perf_counter()
+        subidos_bytes = 0
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            futuros = {pool.submit(self.subir_archivo, s, reintentos): s for s in subidas}
+            for n, futuro in enumerate(as_completed(futuros), start=1):
+                subida = futuros[futuro]
+                try:
+                    subida.nombre_guardado = futuro.result()
+                    subidos_bytes += subida.ruta.stat().st_size
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"  ❌ {subida.ruta}: {e}"))
+                if n % 10 and n != len(subidas):
+                    continue
+                segundos = max(time.perf_counter() - inicio, 1e-9)
+                self.stdout.write(
+                    f"  ⏳ {n}/{len(subidas)} · {n / segundos:.1f} img/s · {subidos_bytes / 1e6 / segundos:.2f} MB/s"
+                )
+
+    def subir_archivo(self, subida, reintentos):
+        """Guarda el archivo con la misma ruta que upload_to; reintenta con espera exponencial."""
+        if subida.principal:
+            campo = SitioTuristico._meta.get_field("imagen_referencia")
+            instancia = subida.sitio
+        else:
+            campo = ImagenReferencia._meta.get_field("imagen")
+            instancia = ImagenReferencia(sitio=subida.sitio)
+        destino = campo.generate_filename(instancia, subida.ruta.name)
+
+        for intento in range(reintentos + 1):
+            try:
+                with open(subida.ruta, "rb") as f:
+                    return campo.storage.save(destino, File(f))
+            except Exception:
+                if intento == reintentos:
+                    raise
+                time.sleep(0.5 * 2 ** intento)
+
+    def calcular_embeddings(self, subidas):
+        """Precalcula el vector de cada imagen subida desde el archivo local, por lotes."""
+        from turismo.services_ia import obtener_vectores_lote
+
+        for i in range(0, len(subidas), LOTE_EMBEDDINGS):
+            lote = subidas[i:i + LOTE_EMBEDDINGS]
+            for subida, vector in zip(lote, obtener_vectores_lote([str(s.ruta) for s in lote])):
+                subida.vector = vector
+        sin_vector = sum(1 for s in subidas if s.vector is None)
+        if sin_vector:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {sin_vector} imágenes sin embedding; ejecuta `python manage.py calcular_embeddings` cuando la IA esté disponible."
+            ))
+
+    def registrar(self, subidas):
+        """Guarda las rutas, hashes y embeddings en la BD con operaciones en lote."""
+        sitios = []
+        nuevas = []
+        cambiadas = []
+        for s in subidas:
+            datos = vector_a_bytes(s.vector) if s.vector is not None else None
+            if s.principal:
+                s.sitio.imagen_referencia.name = s.nombre_guardado
+                s.sitio.imagen_sha256 = s.sha256
+                s.sitio.embedding = datos
+                sitios.append(s.sitio)
+            else:
+                imagen = ImagenReferencia(pk=s.imagen_id, sitio=s.sitio, sha256=s.sha256, embedding=datos)
+                imagen.imagen.name = s.nombre_guardado
+                (cambiadas if s.imagen_id else nuevas).append(imagen)
+
+        with transaction.atomic():
+            SitioTuristico.objects.bulk_update(sitios, ["imagen_referencia", "imagen_sha256", "embedding"])
+            ImagenReferencia.objects.bulk_create(nuevas)
+            ImagenReferencia.objects.bulk_update(cambiadas, ["imagen", "sha256", "embedding"])
+
+        # Ya confirmados los cambios, borramos las versiones anteriores de las fotos reemplazadas
+        for s in subidas:
+            if s.nombre_anterior and s.nombre_anterior != s.nombre_guardado:
+                campo = SitioTuristico._meta.get_field("imagen_referencia") if s.principal \
+                    else ImagenReferencia._meta.get_field("imagen")
+                try:
+                    campo.storage.delete(s.nombre_anterior)
+                except Exception as e:
+                    self.stdout.write(self.style.WARNING(f"  ⚠️ No se pudo borrar {s.nombre_anterior}: {e}"))
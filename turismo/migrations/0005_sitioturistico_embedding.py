@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turismo', '0004_alter_sitioturistico_categoria_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitioturistico',
+            name='embedding',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:20
+
+import django.db.models.deletion
+import turismo.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turismo', '0005_sitioturistico_embedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImagenReferencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('imagen', models.ImageField(upload_to=turismo.models.ruta_imagen_adicional, verbose_name='Foto de referencia')),
+                ('embedding', models.BinaryField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('sitio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imagenes_referencia', to='turismo.sitioturistico')),
+            ],
+            options={
+                'verbose_name': 'Imagen de referencia',
+                'verbose_name_plural': 'Imágenes de referencia',
+                'ordering': ['sitio', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('turismo', '0006_imagenreferencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagenreferencia',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='sitioturistico',
+            name='imagen_sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -1,5 +1,13 @@
+import logging
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache_resultados import invalidar_cache
+
+logger = logging.getLogger(__name__)
 
 def ruta_imagen_sitio(instance, filename):
     # Esto guarda la foto en: media/sitios/guayas/malecon2000/foto.jpg
@@ -26,6 +34,10 @@ class SitioTuristico(models.Model):
     
     # Campo nuevo para la IA
     imagen_referencia = models.ImageField(upload_to=ruta_imagen_sitio, null=True, blank=True, verbose_name="Foto de Referencia para IA")
+    # Vector MobileNetV2 precalculado de imagen_referencia (float32 serializado)
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+    # SHA-256 del archivo subido; subir_fotos_supabase lo usa para no repetir subidas
+    imagen_sha256 = models.CharField(max_length=64, blank=True, default="", editable=False)
 
     latitud = models.DecimalField(max_digits=9, decimal_places=6)
     longitud = models.DecimalField(max_digits=9, decimal_places=6)
@@ -50,4 +62,119 @@ class SitioTuristico(models.Model):
 
     def __str__(self):
         return f"{self.nombre} ({self.provincia})"
-    
+
+
+def ruta_imagen_adicional(instance, filename):
+    # Misma carpeta que la imagen principal del sitio
+    return ruta_imagen_sitio(instance.sitio, filename)
+
+
+class ImagenReferencia(models.Model):
+    """Fotos adicionales de un sitio para la IA; cada una con su vector precalculado."""
+
+    sitio = models.ForeignKey(
+        SitioTuristico,
+        on_delete=models.CASCADE,
+        related_name="imagenes_referencia",
+    )
+    imagen = models.ImageField(upload_to=ruta_imagen_adicional, verbose_name="Foto de referencia")
+    # Vector MobileNetV2 de la imagen (float32 serializado), igual que SitioTuristico.embedding
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+    sha256 = models.CharField(max_length=64, blank=True, default="", editable=False)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Imagen de referencia"
+        verbose_name_plural = "Imágenes de referencia"
+        ordering = ["sitio", "id"]
+
+    def __str__(self):
+        return f"{self.sitio.nombre}: {self.imagen.name}"
+
+
+# --- EMBEDDINGS DE REFERENCIA ---
+# Guardamos el nombre de la imagen al cargar el objeto para detectar si cambió al guardar
+@receiver(post_init, sender=SitioTuristico)
+def recordar_imagen_referencia(sender, instance, **kwargs):
+    instance._imagen_referencia_original = instance.imagen_referencia.name if instance.imagen_referencia else None
+
+
+@receiver(post_save, sender=SitioTuristico)
+def actualizar_embedding_sitio(sender, instance, created, **kwargs):
+    from .embeddings import (
+        calcular_embedding_sitio, descartar_archivo_indice, refrescar_sitio_en_indice, vector_a_bytes,
+    )
+
+    imagen_actual = instance.imagen_referencia.name if instance.imagen_referencia else None
+    cambio = imagen_actual != instance._imagen_referencia_original
+    if cambio or (created and imagen_actual):
+        vector = calcular_embedding_sitio(instance) if imagen_actual else None
+        datos = vector_a_bytes(vector) if vector is not None else None
+        # update() evita volver a disparar esta señal
+        SitioTuristico.objects.filter(pk=instance.pk).update(embedding=datos)
+        instance.embedding = datos
+        instance._imagen_referencia_original = imagen_actual
+        logger.info(f"Embedding de referencia actualizado para el sitio {instance.pk}")
+        if not created:
+            descartar_archivo_indice()
+
+    # Alta, cambio de vector o de `activo`: se aplica al índice cargado sin reconstruirlo
+    refrescar_sitio_en_indice(instance.pk)
+    # Las respuestas cacheadas por foto pueden nombrar este sitio o depender de su
+    # imagen, coordenadas o `activo`
+    invalidar_cache("recomendacion_foto")
+
+
+@receiver(post_delete, sender=SitioTuristico)
+def eliminar_sitio_del_indice(sender, instance, **kwargs):
+    from .embeddings import quitar_sitio_del_indice
+
+    quitar_sitio_del_indice(instance.pk)
+    invalidar_cache("recomendacion_foto")
+
+
+@receiver(post_init, sender=ImagenReferencia)
+def recordar_imagen_adicional(sender, instance, **kwargs):
+    instance._imagen_original = instance.imagen.name if instance.imagen else None
+
+
+@receiver(post_save, sender=ImagenReferencia)
+def actualizar_embedding_imagen(sender, instance, created, **kwargs):
+    from django.conf import settings
+    from .embeddings import (
+        calcular_embedding_imagen, descartar_archivo_indice, refrescar_sitio_en_indice, vector_a_bytes,
+    )
+
+    imagen_actual = instance.imagen.name if instance.imagen else None
+    if imagen_actual == instance._imagen_original and not created:
+        return
+
+    vector = calcular_embedding_imagen(instance.imagen, f"{instance.pk} del sitio {instance.sitio_id}")
+    datos = vector_a_bytes(vector) if vector is not None else None
+    ImagenReferencia.objects.filter(pk=instance.pk).update(embedding=datos)
+    instance.embedding = datos
+    instance._imagen_original = imagen_actual
+
+    invalidar_cache("recomendacion_foto")
+    # Con centroides la fila del sitio cambia de valor: el archivo exportado queda obsoleto
+    if not created or getattr(settings, "EMBEDDINGS_AGREGACION", "max") == "centroide":
+        descartar_archivo_indice()
+    refrescar_sitio_en_indice(instance.sitio_id)
+
+
+@receiver(post_delete, sender=ImagenReferencia)
+def eliminar_imagen_del_indice(sender, instance, **kwargs):
+    from .embeddings import refrescar_sitio_en_indice
+
+    refrescar_sitio_en_indice(instance.sitio_id)
+    invalidar_cache("recomendacion_foto")
+
+
+# --- ÍNDICE ESPACIAL ---
+# Cualquier alta, cambio de coordenadas/activo o baja deja el índice obsoleto
+@receiver(post_save, sender=SitioTuristico)
+@receiver(post_delete, sender=SitioTuristico)
+def invalidar_indice_espacial_sitio(sender, instance, **kwargs):
+    from .indice_espacial import invalidar_indice_espacial
+
+    invalidar_indice_espacial()
@@ -1,13 +1,18 @@
+import logging
+
+import numpy as np
+
 from .models import SitioTuristico
-from .utils import distancia_km
+from .indice_espacial import obtener_indice_espacial
+
+logger = logging.getLogger(__name__)
 
 def recomendar_por_contexto(lat, lon, contexto):
-    sitios = SitioTuristico.objects.filter(
-        latitud__isnull=False,
-        longitud__isnull=False
-    )
+    # El índice espacial solo contiene sitios activos con coordenadas dentro de ECUADOR_BBOX:
+    # a diferencia de la versión que recorría la tabla, ya no recomienda sitios desactivados
+    indice = obtener_indice_espacial()
 
-    if not sitios.exists():
+    if not len(indice):
         return {
             "mensaje": "No hay sitios turísticos con ubicación válida"
         }
@@ -16,9 +21,6 @@ def recomendar_por_contexto(lat, lon, contexto):
     menor_distancia = float("inf")  # este es el valor 'sesgado' usado para elegir
     mejor_distancia_real = None       # distancia real en km del sitio elegido
 
-    import logging
-    logger = logging.getLogger(__name__)
-
     # Mapeo aproximado de detecciones a categorías del modelo SitioTuristico
     DETECTION_TO_CATEGORY = {
         "restaurant": "ciudad",
@@ -51,48 +53,26 @@ def recomendar_por_contexto(lat, lon, contexto):
     if category_scores:
         preferred_category = max(category_scores.items(), key=lambda x: x[1])[0]
 
-    total_checked = 0
-    skipped_invalid = 0
-
-    for sitio in sitios:
-        total_checked += 1
-        try:
-            lat_s = float(sitio.latitud)
-            lon_s = float(sitio.longitud)
-        except Exception as e:
-            skipped_invalid += 1
-            logger.warning(f"[RECO-DEBUG] sitio={sitio.id} lat/lon inválidos: {sitio.latitud}/{sitio.longitud} -> {e}")
-            continue
-
-        # Validar que coordenadas estén dentro de Ecuador razonable
-        if not (-6.0 <= lat_s <= 3.0 and -92.0 <= lon_s <= -75.0):
-            skipped_invalid += 1
-            logger.warning(f"[RECO-DEBUG] sitio={sitio.id} fuera de Ecuador: {lat_s}/{lon_s}")
-            continue
-
-        try:
-            d = distancia_km(
-                lat,
-                lon,
-                lat_s,
-                lon_s
-            )
-        except Exception as e:
-            skipped_invalid += 1
-            logger.warning(f"[RECO-DEBUG] error calculando distancia con sitio={sitio.id}: {e}")
-            continue
-
-        # Sesgamos la distancia si el sitio coincide con la categoría detectada
-        effective = d
-        if preferred_category and sitio.categoria == preferred_category:
-            effective = d * 0.6  # reducir distancia efectiva para priorizar
-
-        if effective < menor_distancia:
-            menor_distancia = effective
-            sitio_mas_cercano = sitio
-            mejor_distancia_real = d
-
-    logger.info(f"[RECO-DEBUG] total_sitios={sitios.count()} checked={total_checked} skipped_invalid={skipped_invalid} preferred_category={preferred_category}")
+    ids, distancias = indice.vecinos(lat, lon, k=1)
+    if len(ids):
+        candidatos_ids, candidatos_dist = ids, distancias
+        # Un sitio de la categoría preferida puede ganar aunque esté hasta 1/0.6 veces
+        # más lejos que el más cercano, así que solo miramos dentro de ese radio
+        if preferred_category:
+            candidatos_ids, candidatos_dist = indice.en_radio(lat, lon, distancias[0] / 0.6)
+
+        efectivas = np.array(candidatos_dist, dtype=float)
+        if preferred_category and len(candidatos_ids):
+            # Sesgamos la distancia si el sitio coincide con la categoría detectada
+            efectivas[indice.categorias_de(candidatos_ids) == preferred_category] *= 0.6  # reducir distancia efectiva para priorizar
+
+        if len(candidatos_ids):
+            i = int(np.argmin(efectivas))
+            sitio_mas_cercano = SitioTuristico.objects.filter(pk=int(candidatos_ids[i])).first()
+            menor_distancia = float(efectivas[i])
+            mejor_distancia_real = float(candidatos_dist[i])
+
+    logger.info(f"[RECO-DEBUG] total_sitios={len(indice)} preferred_category={preferred_category}")
 
     if sitio_mas_cercano is None:
         return {
@@ -1,62 +1,142 @@
 import numpy as np
 import os
 import logging
+import threading
 from django.conf import settings
 
+from core.modelos_ia import registro, ModeloNoDisponible
+from core.imagenes import TAMANO_MOBILENET, abrir_imagen, array_mobilenet
+
 # Configurar logger
 logger = logging.getLogger(__name__)
 
-# Intentamos importar las librerías de IA
-# Usamos un bloque try/except para que tu proyecto no se rompa si no has instalado tensorflow aún.
-try:
-    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
-    from tensorflow.keras.preprocessing import image
-    from scipy.spatial.distance import cosine
-    
-    # Cargamos el modelo una sola vez al iniciar el servidor (Optimización)
+
+def cargar_modelo():
+    """
+    Construye MobileNetV2. Lo llama el registro de modelos en el primer uso,
+    no al importar el módulo, para que Django arranque sin TensorFlow.
+    """
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+
     # include_top=False: No queremos clasificar "gato/perro", queremos vectores de características visuales.
     # pooling='avg': Aplana el resultado 3D a un vector simple.
-    base_model = MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
-    IA_AVAILABLE = True
-    print("✅ Modelo IA (MobileNetV2) cargado y listo para comparar imágenes.")
-except ImportError:
-    IA_AVAILABLE = False
-    base_model = None
-    print("⚠️ TensorFlow o SciPy no detectados. Instala: pip install tensorflow pillow numpy scipy")
-except Exception as e:
-    IA_AVAILABLE = False
-    base_model = None
-    print(f"⚠️ Error inicializando modelo IA: {e}")
+    modelo = MobileNetV2(weights='imagenet', include_top=False, pooling='avg')
+    logger.info("✅ Modelo IA (MobileNetV2) cargado y listo para comparar imágenes.")
+    return modelo
 
-def obtener_vector_caracteristicas(ruta_imagen):
+
+def ia_disponible():
+    """Intenta cargar el modelo (si aún no lo está) y avisa si la IA puede usarse."""
+    try:
+        registro.obtener('mobilenet')
+        return True
+    except ModeloNoDisponible:
+        return False
+
+
+def _preparar_imagen(entrada):
     """
-    Convierte una imagen en un vector numérico (lista de números) que representa su contenido visual.
+    Devuelve la imagen como uint8 (224,224,3).
+    Acepta el array ya redimensionado (ImagenDecodificada.para_mobilenet), una ruta o un archivo en memoria.
     """
-    if not IA_AVAILABLE or base_model is None:
-        return None
+    if isinstance(entrada, np.ndarray):
+        return entrada
+    return array_mobilenet(abrir_imagen(entrada))
+
+
+# Buffer float32 reutilizable por hilo para el lote preprocesado (evita reservar memoria en cada pasada)
+_buffers = threading.local()
+
+
+def _buffer_lote(n):
+    buffer = getattr(_buffers, "lote", None)
+    if buffer is None or buffer.shape[0] < n:
+        buffer = _buffers.lote = np.empty((n, *TAMANO_MOBILENET, 3), dtype=np.float32)
+    return buffer[:n]
+
+
+def obtener_vectores_lote(imagenes):
+    """
+    Versión por lotes: una sola pasada de MobileNet para todas las imágenes.
+    Devuelve una lista con un vector (o None si la imagen no se pudo leer) por entrada.
+    """
+    try:
+        base_model = registro.obtener('mobilenet')
+    except ModeloNoDisponible:
+        logger.warning("⚠️ TensorFlow no disponible. Instala: pip install tensorflow pillow numpy scipy")
+        return [None] * len(imagenes)
+
+    arrays = []
+    validas = []
+    for i, entrada in enumerate(imagenes):
+        try:
+            arrays.append(_preparar_imagen(entrada))
+            validas.append(i)
+        except Exception as e:
+            logger.error(f"Error IA procesando imagen {i} del lote: {e}")
+
+    resultados = [None] * len(imagenes)
+    if not arrays:
+        return resultados
 
     try:
-        # 1. Cargar imagen redimensionando a 224x224 (estándar MobileNet)
-        img = image.load_img(ruta_imagen, target_size=(224, 224))
-        
-        # 2. Convertir a array numérico
-        x = image.img_to_array(img)
-        
-        # 3. Expandir dimensiones (de 224,224,3 a 1,224,224,3)
-        x = np.expand_dims(x, axis=0)
-        
-        # 4. Preprocesar (normalizar píxeles)
-        x = preprocess_input(x)
-        
-        # 5. Extraer características
-        features = base_model.predict(x)
-        
-        # 6. Aplanar a vector 1D
-        return features.flatten()
-        
+        # Copiamos al buffer y normalizamos en el sitio al rango [-1, 1]
+        # (lo mismo que preprocess_input de MobileNetV2)
+        x = _buffer_lote(len(arrays))
+        for j, array in enumerate(arrays):
+            x[j] = array
+        x /= 127.5
+        x -= 1.0
+
+        # Extraer características de todo el lote en un solo forward pass
+        features = base_model.predict(x, batch_size=len(arrays), verbose=0)
     except Exception as e:
-        logger.error(f"Error IA procesando imagen {ruta_imagen}: {e}")
-        return None
+        logger.error(f"Error IA procesando lote de {len(arrays)} imágenes: {e}")
+        return resultados
+
+    # Un vector 1D por imagen
+    for i, vector in zip(validas, features):
+        resultados[i] = vector.flatten()
+    return resultados
+
+
+def obtener_vector_caracteristicas(ruta_imagen):
+    """
+    Convierte una imagen en un vector numérico (lista de números) que representa su contenido visual.
+    Acepta una ruta, un archivo en memoria (io.BytesIO) o el array de ImagenDecodificada.para_mobilenet().
+    """
+    return obtener_vectores_lote([ruta_imagen])[0]
+
+
+# --- MICRO-LOTES ---
+_microlote = None
+_microlote_lock = threading.Lock()
+
+
+def obtener_vector_en_lote(imagen):
+    """
+    Igual que obtener_vector_caracteristicas, pero junta las peticiones concurrentes
+    en un lote que se ejecuta en el pool de inferencia.
+    """
+    global _microlote
+    from core.inferencia import obtener_pool
+
+    if _microlote is None:
+        from core.microlotes import Microlote
+
+        with _microlote_lock:
+            if _microlote is None:
+                _microlote = Microlote(
+                    lambda imagenes: obtener_pool().enviar(obtener_vectores_lote, imagenes),
+                    max_lote=getattr(settings, 'MICROLOTE_MAX', 8),
+                    espera_max=getattr(settings, 'MICROLOTE_ESPERA_MS', 10) / 1000,
+                    hilos=max(1, getattr(settings, 'INFERENCIA_WORKERS', 1)),
+                    max_pendientes=getattr(settings, 'MICROLOTE_MAX_COLA', 64),
+                    nombre="microlote-mobilenet",
+                )
+    # Mismo plazo que el pool: quien espera más que eso ya no va a usar la respuesta
+    return _microlote.enviar(imagen, timeout=obtener_pool().timeout)
+
 
 def calcular_similitud(ruta_img_usuario, ruta_img_referencia):
     """
@@ -64,9 +144,9 @@ def calcular_similitud(ruta_img_usuario, ruta_img_referencia):
     1.0 = Imágenes idénticas
     0.0 = Imágenes totalmente diferentes
     """
-    if not IA_AVAILABLE:
+    if not ia_disponible():
         return 0.0
-        
+
     if not os.path.exists(ruta_img_usuario) or not os.path.exists(ruta_img_referencia):
         logger.warning(f"Falta archivo de imagen para comparación: {ruta_img_referencia}")
         return 0.0
@@ -82,10 +162,12 @@ def calcular_similitud(ruta_img_usuario, ruta_img_referencia):
     # Distancia 0 = Iguales. Distancia 1 o más = Diferentes.
     # Invertimos para obtener "Similitud"
     try:
+        from scipy.spatial.distance import cosine
+
         distancia = cosine(vec_usuario, vec_referencia)
         similitud = 1.0 - distancia
         # Aseguramos rango 0-1
         return max(0.0, min(1.0, similitud))
     except Exception as e:
         logger.error(f"Error matemático calculando similitud: {e}")
-        return 0.0
\ No newline at end of file
+        return 0.0
@@ -1,3 +1,613 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from core.cache_resultados import invalidar_cache
+from core.inferencia import PoolSaturado
+
+from .cuantizacion import CodificadorInt8
+from .embeddings import ARCHIVO_INDICE, DIMENSION_EMBEDDING, IndiceEmbeddings, normalizar, vector_a_bytes
+from .management.commands.cargar_sitios_turisticos import (
+    COORDENADAS_INVALIDAS, DUPLICADO, FUERA_DE_ECUADOR, Command as CargarSitios,
+)
+from .models import ImagenReferencia, SitioTuristico
+from .services import recomendar_por_contexto
+from .utils import distancia_km, distancias_km, matriz_distancias_km
+
+
+def vectores(n, semilla=0):
+    """Vectores al azar agrupados en unas pocas direcciones, como las fotos de sitios parecidos."""
+    rng = np.random.default_rng(semilla)
+    centros = rng.normal(size=(8, DIMENSION_EMBEDDING))
+    return centros[rng.integers(0, 8, size=n)] + 0.5 * rng.normal(size=(n, DIMENSION_EMBEDDING))
+
+
+def busqueda_exacta(claves, matriz, consulta, k):
+    """Los k ids más parecidos recorriendo todos los vectores."""
+    similitudes = normalizar(matriz) @ normalizar(consulta).ravel()
+    orden = np.argsort(-similitudes, kind="stable")[:k]
+    return [int(claves[i]) for i in orden]
+
+
+class HaversineTests(SimpleTestCase):
+    def test_distancias_conocidas(self):
+        # Quito - Guayaquil, unos 274 km en línea recta
+        self.assertAlmostEqual(distancia_km(-0.1807, -78.4678, -2.1894, -79.8891), 273.6, delta=0.5)
+        self.assertEqual(distancia_km(-0.18, -78.46, -0.18, -78.46), 0.0)
+        # Un grado de latitud
+        self.assertAlmostEqual(distancia_km(0, -78, 1, -78), 111.19, places=2)
+
+    def test_versiones_vectorizadas_coinciden_con_la_escalar(self):
+        rng = np.random.default_rng(0)
+        lats, lons = rng.uniform(-5, 2, 50), rng.uniform(-92, -75, 50)
+        origen_lats, origen_lons = rng.uniform(-5, 2, 3), rng.uniform(-92, -75, 3)
+
+        matriz = matriz_distancias_km(origen_lats, origen_lons, lats, lons)
+        self.assertEqual(matriz.shape, (3, 50))
+        for fila, (lat, lon) in zip(matriz, zip(origen_lats, origen_lons)):
+            np.testing.assert_allclose(fila, distancias_km(lat, lon, lats, lons))
+            self.assertAlmostEqual(fila[7], distancia_km(lat, lon, lats[7], lons[7]))
+
+    def test_puntos_antipodas_sin_nan(self):
+        self.assertAlmostEqual(distancia_km(0, 0, 0, 180), np.pi * 6371, places=3)
+
+
+class CodificadorInt8Tests(SimpleTestCase):
+    def test_ajustar_sin_datos_usa_escala_para_vectores_normalizados(self):
+        codificador = CodificadorInt8.ajustar(np.empty((0, DIMENSION_EMBEDDING)))
+        self.assertEqual(codificador.escala.shape, (DIMENSION_EMBEDDING,))
+
+        vector = normalizar(vectores(1)).ravel()
+        reconstruido = codificador.decodificar(codificador.codificar(vector))
+        self.assertLessEqual(np.abs(reconstruido - vector).max(), 0.5 / 127 + 1e-6)
+        self.assertFalse(codificador.necesita_reajuste())
+
+    def test_producto_con_codigos_aproxima_el_coseno(self):
+        matriz = normalizar(vectores(50))
+        codificador = CodificadorInt8.ajustar(matriz)
+        consulta = matriz[7]
+        aproximado = codificador.codificar(matriz).astype(np.float32) @ codificador.preparar_consulta(consulta)
+        np.testing.assert_allclose(aproximado, matriz @ consulta, atol=0.02)
+
+    def test_vectores_fuera_de_rango_piden_reajuste(self):
+        # Escalas ajustadas con valores pequeños: un vector posterior más grande se recorta
+        codificador = CodificadorInt8.ajustar(np.full((3, DIMENSION_EMBEDDING), 0.01))
+        codificador.codificar(np.full(DIMENSION_EMBEDDING, 0.005))
+        self.assertFalse(codificador.necesita_reajuste())
+        codificador.codificar(np.full(DIMENSION_EMBEDDING, 0.5))
+        self.assertTrue(codificador.necesita_reajuste())
+
+
+class IndiceEmbeddingsTests(SimpleTestCase):
+    FORMATOS = ("float32", "float16", "int8")
+
+    def test_indice_vacio(self):
+        for formato in self.FORMATOS:
+            with self.subTest(formato=formato):
+                indice = IndiceEmbeddings([], [], formato=formato)
+                consulta = vectores(1)[0]
+                self.assertEqual(len(indice), 0)
+                self.assertEqual(len(indice.buscar(consulta)[0]), 0)
+                self.assertEqual(len(indice.puntuar(consulta)[0]), 0)
+
+                indice.insertar(5, consulta)
+                sitios, puntuaciones = indice.buscar(consulta, k=3)
+                self.assertEqual(sitios.tolist(), [5])
+                self.assertAlmostEqual(float(puntuaciones[0]), 1.0, places=2)
+
+    def test_indice_vacio_se_guarda_y_se_abre(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            IndiceEmbeddings([], [], formato="int8").guardar(directorio)
+            indice = IndiceEmbeddings.desde_archivo(directorio)
+            self.assertEqual(len(indice), 0)
+            indice.insertar(1, vectores(1)[0])
+            self.assertEqual(len(indice), 1)
+
+    def test_ivf_con_todas_las_listas_coincide_con_busqueda_exacta(self):
+        matriz = vectores(400)
+        claves = np.arange(1, 401)
+        indice = IndiceEmbeddings(claves, matriz)
+        indice.entrenar()
+        self.assertIsNotNone(indice.centroides)
+
+        for consulta in vectores(5, semilla=1):
+            sitios, _ = indice.buscar(consulta, k=10, nprobe=len(indice._listas))
+            self.assertEqual(sitios.tolist(), busqueda_exacta(claves, matriz, consulta, 10))
+
+    def test_altas_y_bajas_coinciden_con_busqueda_exacta(self):
+        matriz = vectores(300)
+        claves = list(range(1, 301))
+        indice = IndiceEmbeddings(claves, matriz)
+        indice.entrenar()
+
+        vivos = dict(zip(claves, matriz))
+        for clave in range(1, 300, 7):
+            indice.eliminar(clave)
+            del vivos[clave]
+        for clave, vector in zip(range(1000, 1020), vectores(20, semilla=2)):
+            indice.insertar(clave, vector)
+            vivos[clave] = vector
+
+        self.assertEqual(len(indice), len(vivos))
+        restantes = np.array(list(vivos))
+        for consulta in vectores(5, semilla=3):
+            sitios, _ = indice.buscar(consulta, k=10, nprobe=len(indice._listas))
+            esperados = busqueda_exacta(restantes, np.vstack(list(vivos.values())), consulta, 10)
+            self.assertEqual(sitios.tolist(), esperados)
+            self.assertFalse(set(sitios.tolist()) - set(vivos))
+
+    def test_int8_guardado_y_abierto_devuelve_lo_mismo(self):
+        matriz = vectores(300)
+        indice = IndiceEmbeddings(np.arange(1, 301), matriz, formato="int8")
+        consulta = vectores(1, semilla=4)[0]
+        esperado = indice.buscar(consulta, k=5)
+        with tempfile.TemporaryDirectory() as directorio:
+            indice.guardar(directorio)
+            abierto = IndiceEmbeddings.desde_archivo(directorio)
+            sitios, puntuaciones = abierto.buscar(consulta, k=5)
+        self.assertEqual(sitios.tolist(), esperado[0].tolist())
+        np.testing.assert_allclose(puntuaciones, esperado[1], rtol=1e-5)
+
+    def test_puntuar_agrega_las_imagenes_de_cada_sitio(self):
+        matriz = vectores(4)
+        # Claves positivas: imagen principal; negativas: imágenes adicionales del mismo sitio
+        claves, sitios = [1, -10, 2, -20], [1, 1, 2, 2]
+        consulta = matriz[1]
+        similitudes = normalizar(matriz) @ normalizar(consulta).ravel()
+
+        for agregacion, esperado in (
+            ("max", [similitudes[:2].max(), similitudes[2:].max()]),
+            ("media", [similitudes[:2].mean(), similitudes[2:].mean()]),
+        ):
+            with self.subTest(agregacion=agregacion):
+                indice = IndiceEmbeddings(claves, matriz, sitios=sitios, agregacion=agregacion)
+                ids, puntuaciones = indice.puntuar(consulta)
+                self.assertEqual(ids.tolist(), [1, 2])
+                np.testing.assert_allclose(puntuaciones, np.clip(esperado, 0, 1), atol=1e-5)
+
+
+class CargarSitiosTuristicosTests(TestCase):
+    CABECERA = "nombre,provincia,categoria,lat,lon\n"
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = Path(directorio.name) / "sitios.csv"
+
+    def cargar(self, filas):
+        self.ruta.write_text(self.CABECERA + "".join(f"{f}\n" for f in filas), encoding="utf-8")
+        call_command("cargar_sitios_turisticos", "--ruta", str(self.ruta), "--bloque", "2", stdout=StringIO())
+
+    def omitidas(self):
+        reporte = self.ruta.with_name(self.ruta.name + ".omitidas.jsonl")
+        return [json.loads(linea) for linea in reporte.read_text(encoding="utf-8").splitlines()]
+
+    def test_carga_filas_validas_y_reporta_las_omitidas(self):
+        self.cargar([
+            "Malecón 2000,Guayas,Ciudad,-2.19,-79.88",
+            "Pailón del Diablo,Tungurahua,Cascada,\"-1,4175\",\"-78,3956\"",
+            "Sin coordenadas,Pichincha,Otro,abc,-78.5",
+            "Lima,Perú,Ciudad,-12.04,-77.04",
+            "Malecón 2000,Guayas,Playa,-2.20,-79.89",
+        ])
+
+        sitios = {s.nombre: s for s in SitioTuristico.objects.all()}
+        self.assertEqual(set(sitios), {"Malecón 2000", "Pailón del Diablo"})
+        self.assertEqual(sitios["Malecón 2000"].categoria, "ciudad")
+        self.assertEqual(float(sitios["Pailón del Diablo"].latitud), -1.4175)
+        self.assertEqual(
+            [(o["fila"], o["motivo"]) for o in self.omitidas()],
+            [(3, COORDENADAS_INVALIDAS), (4, FUERA_DE_ECUADOR), (5, DUPLICADO)],
+        )
+        # Carga completa: no queda punto de control
+        self.assertFalse(self.ruta.with_name(self.ruta.name + ".checkpoint.json").exists())
+
+    def test_segunda_carga_actualiza_en_vez_de_duplicar(self):
+        self.cargar(["Quilotoa,Cotopaxi,Laguna,-0.86,-78.90"])
+        pk = SitioTuristico.objects.get().pk
+
+        self.cargar(["Quilotoa,Cotopaxi,Parque,-0.85,-78.91", "Cotacachi,Imbabura,Ciudad,0.30,-78.27"])
+
+        self.assertEqual(SitioTuristico.objects.count(), 2)
+        quilotoa = SitioTuristico.objects.get(pk=pk)
+        self.assertEqual(quilotoa.categoria, "parque")
+        self.assertEqual(float(quilotoa.longitud), -78.91)
+
+    def test_reanuda_desde_el_punto_de_control(self):
+        filas = [f"Sitio {i},Loja,Otro,-4.0{i},-79.2" for i in range(1, 6)]
+        self.ruta.write_text(self.CABECERA + "".join(f"{f}\n" for f in filas), encoding="utf-8")
+        # Una ejecución anterior confirmó las dos primeras filas y se cortó
+        control = self.ruta.with_name(self.ruta.name + ".checkpoint.json")
+        firma = CargarSitios().firma_archivo(self.ruta)
+        control.write_text(json.dumps({"firma": firma, "filas": 2, "creados": 2, "actualizados": 0, "omitidas": 0}))
+
+        call_command("cargar_sitios_turisticos", "--ruta", str(self.ruta), "--bloque", "2", stdout=StringIO())
+
+        self.assertEqual(
+            sorted(SitioTuristico.objects.values_list("nombre", flat=True)),
+            ["Sitio 3", "Sitio 4", "Sitio 5"],
+        )
+        self.assertFalse(control.exists())
+
+    def test_duplicado_de_un_bloque_ya_confirmado_al_reanudar(self):
+        filas = ["Sitio 1,Loja,Otro,-4.01,-79.2", "Sitio 2,Loja,Otro,-4.02,-79.2",
+                 "Sitio 3,Loja,Otro,-4.03,-79.2", "Sitio 1,Loja,Cascada,-4.04,-79.2"]
+        self.ruta.write_text(self.CABECERA + "".join(f"{f}\n" for f in filas), encoding="utf-8")
+        # La ejecución anterior creó las dos primeras filas antes de cortarse
+        for fila in filas[:2]:
+            nombre, provincia, _, lat, lon = fila.split(",")
+            SitioTuristico.objects.create(nombre=nombre, provincia=provincia, categoria="otro", latitud=lat, longitud=lon)
+        control = self.ruta.with_name(self.ruta.name + ".checkpoint.json")
+        firma = CargarSitios().firma_archivo(self.ruta)
+        control.write_text(json.dumps({"firma": firma, "filas": 2, "desde_id": 0, "creados": 2, "actualizados": 0,
+                                       "omitidas": 0}))
+        self.ruta.with_name(self.ruta.name + ".omitidas.jsonl").write_text("")
+
+        call_command("cargar_sitios_turisticos", "--ruta", str(self.ruta), "--bloque", "2", stdout=StringIO())
+
+        self.assertEqual(SitioTuristico.objects.count(), 3)
+        self.assertEqual(SitioTuristico.objects.get(nombre="Sitio 1").categoria, "otro")
+        self.assertEqual([(o["fila"], o["motivo"]) for o in self.omitidas()], [(4, DUPLICADO)])
+
+    def test_sitio_existente_antes_de_la_carga_se_actualiza(self):
+        SitioTuristico.objects.create(nombre="Quilotoa", provincia="Cotopaxi", categoria="laguna",
+                                      latitud=-0.86, longitud=-78.9)
+        self.cargar(["Otro,Loja,Otro,-4.0,-79.2", "Otro 2,Loja,Otro,-4.1,-79.2", "Quilotoa,Cotopaxi,Parque,-0.85,-78.91"])
+        self.assertEqual(SitioTuristico.objects.get(nombre="Quilotoa").categoria, "parque")
+        self.assertEqual(self.omitidas(), [])
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        def consultas(n, categoria):
+            filas = [f"Sitio {i},Loja,{categoria},-4.0,-79.{i:03d}" for i in range(n)]
+            self.ruta.write_text(self.CABECERA + "".join(f"{f}\n" for f in filas), encoding="utf-8")
+            with CaptureQueriesContext(connection) as capturadas:
+                call_command("cargar_sitios_turisticos", "--ruta", str(self.ruta), stdout=StringIO())
+            return len(capturadas)
+
+        def altas_y_actualizaciones(n):
+            SitioTuristico.objects.all().delete()
+            return consultas(n, "Otro"), consultas(n, "Playa")
+
+        # Un solo bloque: altas y actualizaciones cuestan lo mismo con 5 que con 40 filas
+        self.assertEqual(altas_y_actualizaciones(5), altas_y_actualizaciones(40))
+        self.assertEqual(SitioTuristico.objects.filter(categoria="playa").count(), 40)
+
+    def test_csv_modificado_ignora_el_punto_de_control(self):
+        self.ruta.write_text(self.CABECERA + "Sitio 1,Loja,Otro,-4.01,-79.2\n", encoding="utf-8")
+        control = self.ruta.with_name(self.ruta.name + ".checkpoint.json")
+        control.write_text(json.dumps({"firma": "otra", "filas": 1}))
+
+        call_command("cargar_sitios_turisticos", "--ruta", str(self.ruta), stdout=StringIO())
+
+        self.assertTrue(SitioTuristico.objects.filter(nombre="Sitio 1").exists())
+
+
+class CalcularEmbeddingsTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        ajustes = override_settings(EMBEDDINGS_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        sitio = SitioTuristico.objects.create(nombre="Quilotoa", provincia="Cotopaxi", categoria="laguna",
+                                              latitud=-0.86, longitud=-78.9)
+        # update() para no calcular el embedding en la señal
+        SitioTuristico.objects.filter(pk=sitio.pk).update(
+            imagen_referencia="sitios/cotopaxi/quilotoa/foto.jpg", embedding=vector_a_bytes(vectores(1)[0]),
+        )
+        IndiceEmbeddings.desde_bd(usar_archivo=False).guardar(self.directorio)
+
+    def calcular(self, *argumentos):
+        with mock.patch("turismo.management.commands.calcular_embeddings.calcular_embedding_sitio",
+                        return_value=vectores(1, semilla=5)[0]):
+            call_command("calcular_embeddings", *argumentos, stdout=StringIO())
+
+    def test_recalcular_todos_descarta_el_indice_exportado(self):
+        self.calcular("--todos")
+        self.assertFalse(Path(self.directorio, ARCHIVO_INDICE).exists())
+
+    def test_solo_nuevos_conserva_el_indice_exportado(self):
+        self.calcular()
+        self.assertTrue(Path(self.directorio, ARCHIVO_INDICE).exists())
+
+
+class RecomendarPorContextoTests(TestCase):
+    def crear(self, nombre, categoria, lat, lon, activo=True):
+        return SitioTuristico.objects.create(nombre=nombre, provincia="Pichincha", categoria=categoria,
+                                             latitud=lat, longitud=lon, activo=activo)
+
+    def test_prioriza_la_categoria_detectada_dentro_del_radio(self):
+        self.crear("Plaza", "ciudad", -0.2199, -78.5110)
+        self.crear("Parque", "parque", -0.2190, -78.5124)
+        contexto = {"detecciones": {"tree": 3}, "tipo_zona": "naturaleza"}
+
+        self.assertEqual(recomendar_por_contexto(-0.2190, -78.5110, {"tipo_zona": "urbana"})["nombre"], "Plaza")
+        self.assertEqual(recomendar_por_contexto(-0.2190, -78.5110, contexto)["nombre"], "Parque")
+
+    def test_ignora_sitios_inactivos_y_fuera_de_ecuador(self):
+        # Cambio respecto a la versión que recorría la tabla: los inactivos ya no se recomiendan
+        self.crear("Cerrado", "ciudad", -0.2191, -78.5111, activo=False)
+        self.crear("Lima", "ciudad", -12.04, -77.04)
+        self.crear("Mitad del Mundo", "monumento", -0.0022, -78.4558)
+
+        recomendacion = recomendar_por_contexto(-0.2190, -78.5110, {"tipo_zona": "urbana"})
+        self.assertEqual(recomendacion["nombre"], "Mitad del Mundo")
+
+
+def foto(color=(30, 120, 200)):
+    """PNG pequeño en memoria para subir a las vistas de IA."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, format="PNG")
+    return SimpleUploadedFile("foto.png", buffer.getvalue(), content_type="image/png")
+
+
+class RecomendacionPorFotoTests(TestCase):
+    def setUp(self):
+        invalidar_cache("recomendacion_foto")
+        self.client.force_login(User.objects.create_user("ana"))
+
+    def enviar(self, **datos):
+        return self.client.post(reverse("turismo:recomendar_por_foto"), {"imagen": foto(), **datos}).json()
+
+    @mock.patch("turismo.views.obtener_vector_en_lote", return_value=None)
+    def test_sin_coincidencia_ni_sitios_cercanos(self, _):
+        respuesta = self.enviar(lat="-0.22", lon="-78.51")
+        self.assertEqual(respuesta["tipo"], "not_found")
+        self.assertIn("10 km de tu ubicación", respuesta["mensaje"])
+
+    def test_archivo_que_no_es_imagen_devuelve_400(self):
+        archivo = SimpleUploadedFile("foto.jpg", b"no soy una foto", content_type="image/jpeg")
+        respuesta = self.client.post(reverse("turismo:recomendar_por_foto"), {"imagen": archivo})
+        self.assertEqual(respuesta.status_code, 400)
+
+    @mock.patch("turismo.views.obtener_vector_en_lote", return_value=None)
+    def test_sin_ubicacion_no_menciona_el_radio(self, _):
+        SitioTuristico.objects.create(nombre="Plaza", provincia="Pichincha", categoria="ciudad",
+                                      latitud=-0.22, longitud=-78.51)
+        respuesta = self.enviar()
+        self.assertEqual(respuesta["tipo"], "not_found")
+        self.assertNotIn("km", respuesta["mensaje"])
+        self.assertIn("Activa la ubicación", respuesta["mensaje"])
+
+
+def vectores_con_coseno(*cosenos):
+    """Consulta unitaria y un vector por coseno pedido respecto a ella (cada uno en su propio eje)."""
+    consulta = np.zeros(DIMENSION_EMBEDDING)
+    consulta[0] = 1.0
+    matriz = np.zeros((len(cosenos), DIMENSION_EMBEDDING))
+    for i, coseno in enumerate(cosenos):
+        matriz[i, 0] = coseno
+        matriz[i, i + 1] = np.sqrt(1 - coseno ** 2)
+    return consulta, matriz
+
+
+class RecomendacionPorFotoIATests(TestCase):
+    """Vista de recomendación con el índice de embeddings y el vector de la foto simulados."""
+
+    def setUp(self):
+        invalidar_cache("recomendacion_foto")
+        self.client.force_login(User.objects.create_user("ana"))
+        self.quito = SitioTuristico.objects.create(nombre="Basílica", provincia="Pichincha", categoria="monumento",
+                                                   latitud=-0.2147, longitud=-78.5075)
+        self.cuenca = SitioTuristico.objects.create(nombre="Catedral", provincia="Azuay", categoria="monumento",
+                                                    latitud=-2.8974, longitud=-79.0045)
+
+    def preparar(self, *cosenos):
+        """Índice con Quito y Cuenca a los cosenos indicados de la foto subida."""
+        consulta, matriz = vectores_con_coseno(*cosenos)
+        indice = IndiceEmbeddings([self.quito.pk, self.cuenca.pk], matriz)
+        for objetivo, valor in (("turismo.views.obtener_indice", indice),
+                                ("turismo.views.obtener_vector_en_lote", consulta)):
+            parche = mock.patch(objetivo, return_value=valor)
+            self.addCleanup(parche.stop)
+            self.modelo = parche.start()
+
+    def enviar(self, **datos):
+        return self.client.post(reverse("turismo:recomendar_por_foto"), {"imagen": foto(), **datos}).json()
+
+    def test_identifica_el_sitio_mas_parecido(self):
+        self.preparar(0.5, 0.95)
+        respuesta = self.enviar()
+        self.assertEqual(respuesta["tipo"], "success")
+        self.assertEqual(respuesta["id"], self.cuenca.pk)
+        self.assertEqual(respuesta["score"], 0.95)
+
+    def test_cercania_desempata_coincidencias_parecidas(self):
+        # Cuenca se parece un poco más, pero el usuario está en Quito
+        self.preparar(0.93, 0.95)
+        self.assertEqual(self.enviar()["id"], self.cuenca.pk)
+        invalidar_cache("recomendacion_foto")
+        respuesta = self.enviar(lat="-0.2150", lon="-78.5080")
+        self.assertEqual(respuesta["id"], self.quito.pk)
+        # El umbral se compara con la similitud original, no con la prioridad
+        self.assertEqual(respuesta["score"], 0.93)
+
+    def test_coincidencia_lejana_sin_sugerencia_por_radio(self):
+        # La búsqueda es nacional: una foto de Cuenca se reconoce aunque el usuario esté en Quito
+        self.preparar(0.2, 0.9)
+        respuesta = self.enviar(lat="-0.2150", lon="-78.5080")
+        self.assertEqual((respuesta["tipo"], respuesta["id"]), ("success", self.cuenca.pk))
+
+    def test_misma_foto_en_la_misma_zona_no_vuelve_al_modelo(self):
+        self.preparar(0.5, 0.95)
+        primera = self.enviar(lat="-2.8970", lon="-79.0040")
+        segunda = self.enviar(lat="-2.8971", lon="-79.0041")
+        self.assertEqual(primera, segunda)
+        self.assertEqual(self.modelo.call_count, 1)
+
+        # Otra celda de ubicación: se vuelve a calcular
+        self.enviar(lat="-0.2150", lon="-78.5080")
+        self.assertEqual(self.modelo.call_count, 2)
+
+    def test_guardar_un_sitio_invalida_los_resultados(self):
+        self.preparar(0.5, 0.95)
+        self.enviar()
+        self.cuenca.descripcion = "Catedral de la Inmaculada Concepción"
+        self.cuenca.save()
+        self.enviar()
+        self.assertEqual(self.modelo.call_count, 2)
+
+    def test_pool_saturado_degrada_a_sugerencia_sin_cachearla(self):
+        self.preparar(0.5, 0.95)
+        self.modelo.side_effect = PoolSaturado("sin cupos")
+
+        respuesta = self.enviar(lat="-0.2150", lon="-78.5080")
+        self.assertEqual((respuesta["tipo"], respuesta["id"]), ("suggestion", self.quito.pk))
+
+        # La degradación no se queda en la caché: con el pool libre se vuelve a intentar
+        self.modelo.side_effect = None
+        self.assertEqual(self.enviar(lat="-0.2150", lon="-78.5080")["tipo"], "success")
+        self.assertEqual(self.modelo.call_count, 2)
+
+
+@override_settings(EMBEDDINGS_FORMATO="float32")
+class ImagenesPorSitioTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        ajustes = override_settings(EMBEDDINGS_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.matriz = normalizar(vectores(4, semilla=6))
+        self.sitio = SitioTuristico.objects.create(nombre="Cajas", provincia="Azuay", categoria="parque",
+                                                   latitud=-2.78, longitud=-79.22)
+        SitioTuristico.objects.filter(pk=self.sitio.pk).update(embedding=vector_a_bytes(self.matriz[0]))
+
+    def agregar_imagenes(self, *filas):
+        # bulk_create no dispara la señal que calcularía el vector con MobileNet
+        return ImagenReferencia.objects.bulk_create([
+            ImagenReferencia(sitio=self.sitio, imagen=f"sitios/azuay/cajas/{i}.jpg", embedding=vector_a_bytes(self.matriz[i]))
+            for i in filas
+        ])
+
+    def test_cualquier_foto_del_sitio_lo_identifica(self):
+        self.agregar_imagenes(1, 2)
+        indice = IndiceEmbeddings.desde_bd(usar_archivo=False)
+        self.assertEqual(len(indice), 3)
+        for fila in (0, 1, 2):
+            ids, puntuaciones = indice.buscar(self.matriz[fila], k=1)
+            self.assertEqual(ids.tolist(), [self.sitio.pk])
+            self.assertAlmostEqual(float(puntuaciones[0]), 1.0, places=4)
+
+    def test_centroide_deja_una_fila_por_sitio(self):
+        self.agregar_imagenes(1, 2)
+        indice = IndiceEmbeddings.desde_bd(usar_archivo=False, agregacion="centroide")
+        self.assertEqual(len(indice), 1)
+        esperado = normalizar(self.matriz[:3].sum(axis=0)).ravel()
+        _, puntuaciones = indice.puntuar(esperado)
+        self.assertAlmostEqual(float(puntuaciones[0]), 1.0, places=4)
+
+    def test_indice_exportado_recoge_imagenes_nuevas_y_borradas(self):
+        primera, = self.agregar_imagenes(1)
+        IndiceEmbeddings.desde_bd(usar_archivo=False).guardar(self.directorio)
+
+        self.agregar_imagenes(3)
+        ImagenReferencia.objects.filter(pk=primera.pk).delete()
+        indice = IndiceEmbeddings.desde_bd()
+
+        self.assertEqual(len(indice), 2)
+        self.assertNotIn(-primera.pk, indice)
+        ids, puntuaciones = indice.buscar(self.matriz[3], k=1)
+        self.assertEqual(ids.tolist(), [self.sitio.pk])
+        self.assertAlmostEqual(float(puntuaciones[0]), 1.0, places=4)
+
+
+class SubirFotosTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.fotos = Path(directorio.name) / "fotos"
+        self.carpeta = self.fotos / "Cotopaxi" / "Quilotoa"
+        self.carpeta.mkdir(parents=True)
+        ajustes = override_settings(EMBEDDINGS_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        # Storage local en lugar de Supabase para ambos campos de imagen
+        self.storage = FileSystemStorage(location=Path(directorio.name) / "storage")
+        for campo in (SitioTuristico._meta.get_field("imagen_referencia"), ImagenReferencia._meta.get_field("imagen")):
+            parche = mock.patch.object(campo, "storage", self.storage)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+        self.sitio = SitioTuristico.objects.create(nombre="Quilotoa", provincia="Cotopaxi", categoria="laguna",
+                                                   latitud=-0.86, longitud=-78.9)
+
+    def subir(self, *argumentos):
+        salida = StringIO()
+        with mock.patch("turismo.services_ia.obtener_vectores_lote",
+                        side_effect=lambda rutas: list(vectores(len(rutas)))):
+            call_command("subir_fotos_supabase", "--ruta", str(self.fotos), *argumentos, stdout=salida)
+        return salida.getvalue()
+
+    def test_sube_principal_y_adicionales_una_sola_vez(self):
+        (self.carpeta / "a.jpg").write_bytes(b"foto a")
+        (self.carpeta / "b.jpg").write_bytes(b"foto b")
+
+        self.assertIn("2 imágenes para subir, 0 sin cambios", self.subir())
+        self.sitio.refresh_from_db()
+        self.assertEqual(self.sitio.imagen_referencia.name, "sitios/cotopaxi/quilotoa/a.jpg")
+        self.assertIsNotNone(self.sitio.embedding)
+        adicional = ImagenReferencia.objects.get()
+        self.assertEqual(adicional.imagen.name, "sitios/cotopaxi/quilotoa/b.jpg")
+        self.assertIsNotNone(adicional.embedding)
+
+        # Mismo contenido: la segunda pasada no vuelve a subir nada
+        self.assertIn("No hay imágenes nuevas ni modificadas", self.subir())
+
+    def test_foto_modificada_reemplaza_la_anterior(self):
+        (self.carpeta / "a.jpg").write_bytes(b"foto a")
+        (self.carpeta / "b.jpg").write_bytes(b"foto b")
+        self.subir()
+        imagen = ImagenReferencia.objects.get()
+
+        (self.carpeta / "b.jpg").write_bytes(b"foto b retocada")
+        self.assertIn("1 imágenes para subir, 1 sin cambios", self.subir())
+
+        reemplazo = ImagenReferencia.objects.get()
+        self.assertEqual(reemplazo.pk, imagen.pk)
+        self.assertNotEqual(reemplazo.imagen.name, imagen.imagen.name)
+        self.assertEqual(self.storage.open(reemplazo.imagen.name).read(), b"foto b retocada")
+        self.assertFalse(self.storage.exists(imagen.imagen.name))
+
+    def test_reintenta_y_reporta_las_subidas_fallidas(self):
+        (self.carpeta / "a.jpg").write_bytes(b"foto a")
+        guardar = self.storage.save
+        fallos = iter([OSError("timeout")])
+
+        def inestable(nombre, contenido):
+            for error in fallos:
+                raise error
+            return guardar(nombre, contenido)
+
+        with mock.patch.object(self.storage, "save", side_effect=inestable), \
+                mock.patch("turismo.management.commands.subir_fotos_supabase.time.sleep") as espera:
+            self.subir("--reintentos", "1")
+        espera.assert_called_once_with(0.5)
+        self.sitio.refresh_from_db()
+        self.assertEqual(self.sitio.imagen_referencia.name, "sitios/cotopaxi/quilotoa/a.jpg")
+
+        (self.carpeta / "b.jpg").write_bytes(b"foto b")
+        with mock.patch.object(self.storage, "save", side_effect=OSError("timeout")), \
+                mock.patch("turismo.management.commands.subir_fotos_supabase.time.sleep"):
+            salida = self.subir("--reintentos", "1")
+        self.assertIn("1 imágenes no se pudieron subir", salida)
+        self.assertFalse(ImagenReferencia.objects.exists())
@@ -1,20 +1,39 @@
-import math
+import numpy as np
 
-def distancia_km(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+RADIO_TIERRA_KM = 6371
 
-    R = 6371  # km
 
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
+def distancias_km(lat, lon, latitudes, longitudes):
+    """
+    Distancia haversine (km) desde un punto a muchos, en una sola pasada vectorizada.
+    `latitudes` y `longitudes` son arrays float64 de la misma longitud.
+    """
+    lat1 = np.radians(float(lat))
+    lon1 = np.radians(float(lon))
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
 
     a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(math.radians(lat1))
-        * math.cos(math.radians(lat2))
-        * math.sin(dlon / 2) ** 2
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
     )
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
 
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+def matriz_distancias_km(latitudes1, longitudes1, latitudes2, longitudes2):
+    """Matriz (n, m) de distancias haversine (km) entre dos conjuntos de puntos."""
+    lat1 = np.radians(np.asarray(latitudes1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(longitudes1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(latitudes2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(longitudes2, dtype=np.float64))[None, :]
 
-    return R * c
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia entre dos puntos; atajo escalar sobre distancias_km."""
+    return float(distancias_km(lat1, lon1, [float(lat2)], [float(lon2)])[0])
@@ -2,13 +2,17 @@ from django.views import View
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from .models import SitioTuristico
+from .embeddings import obtener_indice
+from .indice_espacial import obtener_indice_espacial
+from .utils import distancias_km
+from core.inferencia import PoolSaturado, TiempoAgotado
+from core.imagenes import ImagenDecodificada, ImagenInvalida
+from core.cache_resultados import obtener_cache, celda_ubicacion, radio_hamming
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import F
-import math
-import os
+import numpy as np
 import logging
-import uuid
 
 
 
@@ -18,33 +22,15 @@ import uuid
 try:
     from django.utils.decorators import method_decorator
     from django.views.decorators.csrf import csrf_exempt
-    from .services_ia import calcular_similitud
+    from .services_ia import obtener_vector_en_lote
 except ImportError:
 
     # Fallback si el archivo no existe
     logging.getLogger(__name__).warning("⚠️ No se encontró 'turismo/services_ia.py'. La IA no funcionará.")
-    def calcular_similitud(a, b): return 0.0
+    def obtener_vector_en_lote(imagen): return None
 
 logger = logging.getLogger(__name__)
 
-# --- FUNCIONES AUXILIARES ---
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Calcula distancia en km entre dos puntos geográficos (Fórmula Haversine)"""
-    R = 6371  # Radio de la Tierra en km
-    try:
-        phi1 = math.radians(float(lat1))
-        phi2 = math.radians(float(lat2))
-        dphi = math.radians(float(lat2) - float(lat1))
-        dlambda = math.radians(float(lon2) - float(lon1))
-
-        a = math.sin(dphi / 2) ** 2 + \
-            math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-    except (ValueError, TypeError):
-        return float('inf')
-
 # --- VISTAS ---
 
 class CamaraView(LoginRequiredMixin, View):
@@ -56,29 +42,27 @@ class SitioDetalleView(View):
         sitio_principal = get_object_or_404(SitioTuristico, pk=pk)
         
         # Buscar sitios cercanos para recomendar (excluyendo el actual)
-        otros_sitios = SitioTuristico.objects.filter(activo=True).exclude(pk=pk)
-        recomendaciones = []
-        
-        for otro in otros_sitios:
-            dist = haversine(
-                sitio_principal.latitud, sitio_principal.longitud,
-                otro.latitud, otro.longitud
-            )
-            # Solo recomendamos si está a menos de 50km
-            if dist < 50.0:
-                recomendaciones.append({
-                    'id': otro.id,
-                    'nombre': otro.nombre,
-                    'categoria': otro.categoria,
-                    'provincia': otro.provincia,
-                    'distancia_km': round(dist, 2),
-                    # Usamos imagen_referencia si existe, sino un placeholder
-                    'imagen_url': otro.imagen_referencia.url if hasattr(otro, 'imagen_referencia') and otro.imagen_referencia else None
-                })
-        
-        # Ordenar por cercanía y tomar top 4
-        recomendaciones.sort(key=lambda x: x['distancia_km'])
-        top_recomendaciones = recomendaciones[:4]
+        # Solo recomendamos si está a menos de 50km; el índice ya los devuelve ordenados
+        ids, distancias = obtener_indice_espacial().en_radio(
+            sitio_principal.latitud, sitio_principal.longitud, 50.0, excluir=pk
+        )
+        ids, distancias = ids[:4], distancias[:4]
+        sitios = SitioTuristico.objects.in_bulk([int(i) for i in ids])
+
+        top_recomendaciones = []
+        for sitio_id, dist in zip(ids, distancias):
+            otro = sitios.get(int(sitio_id))
+            if otro is None:
+                continue
+            top_recomendaciones.append({
+                'id': otro.id,
+                'nombre': otro.nombre,
+                'categoria': otro.categoria,
+                'provincia': otro.provincia,
+                'distancia_km': round(float(dist), 2),
+                # Usamos imagen_referencia si existe, sino un placeholder
+                'imagen_url': otro.imagen_referencia.url if otro.imagen_referencia else None
+            })
         
         context = {
             'sitio': sitio_principal,
@@ -102,11 +86,16 @@ class SitiosCercanosView(View):
         except (TypeError, ValueError):
             return JsonResponse({"error": "Parámetros lat y lon son requeridos"}, status=400)
 
-        sitios = SitioTuristico.objects.filter(activo=True)
+        # Solo traemos de la BD los 6 más cercanos que devuelve el índice
+        indice = obtener_indice_espacial()
+        ids, distancias = indice.vecinos(lat, lon, k=6)
+        sitios = SitioTuristico.objects.in_bulk([int(i) for i in ids])
         resultados = []
 
-        for sitio in sitios:
-            distancia = haversine(lat, lon, sitio.latitud, sitio.longitud)
+        for sitio_id, distancia in zip(ids, distancias):
+            sitio = sitios.get(int(sitio_id))
+            if sitio is None:
+                continue
             resultados.append({
                 "id": sitio.id,
                 "nombre": sitio.nombre,
@@ -119,12 +108,9 @@ class SitiosCercanosView(View):
                 "imagen_url": sitio.imagen_referencia.url if sitio.imagen_referencia else "/static/images/default.jpg",
             })
 
-        # Ordenar por distancia
-        resultados.sort(key=lambda x: x["distancia_km"])
-        
         return JsonResponse({
-            "total": len(resultados),
-            "sitios": resultados[:6]  # Solo devolvemos los 6 más cercanos
+            "total": len(indice),
+            "sitios": resultados
         })
 # --- VISTA DE IA (CORREGIDA) ---
 
@@ -134,87 +120,129 @@ class RecomendacionPorFotoView(LoginRequiredMixin, View):
     Vista principal que combina Geolocalización + Inteligencia Artificial
     para identificar un sitio turístico.
     """
+    # Candidatos que devuelve el índice ANN antes de re-ordenar por cercanía
+    K_CANDIDATOS = 20
+    # El radio ya no filtra: solo da ventaja a los sitios cercanos al usuario
+    RADIO_BUSQUEDA_KM = 10.0
+    PESO_CERCANIA = 0.1
+    UMBRAL_COINCIDENCIA = 0.70
+
     def post(self, request, *args, **kwargs):
         imagen = request.FILES.get("imagen")
         lat_str = request.POST.get("lat")
         lon_str = request.POST.get("lon")
 
-        if not imagen or not lat_str or not lon_str:
-            return JsonResponse({"error": "Faltan datos: imagen, lat, lon"}, status=400)
+        if not imagen:
+            return JsonResponse({"error": "Falta la imagen"}, status=400)
+
+        # La ubicación es opcional: sin GPS se busca en todo el catálogo
+        user_lat = user_lon = None
+        if lat_str and lon_str:
+            try:
+                user_lat = float(lat_str)
+                user_lon = float(lon_str)
+            except ValueError:
+                return JsonResponse({"error": "Coordenadas inválidas"}, status=400)
+        con_ubicacion = user_lat is not None
 
+        # 1. Decodificar la imagen en memoria (sin archivo temporal)
         try:
-            user_lat = float(lat_str)
-            user_lon = float(lon_str)
-        except ValueError:
-            return JsonResponse({"error": "Coordenadas inválidas"}, status=400)
+            foto = ImagenDecodificada.desde_archivo(imagen)
+        except ImagenInvalida:
+            return JsonResponse({"error": "El archivo no es una imagen válida"}, status=400)
+
+        # Misma foto (o casi idéntica) en la misma zona: devolvemos el resultado ya calculado
+        cache = obtener_cache("recomendacion_foto")
+        celda = celda_ubicacion(user_lat, user_lon) if con_ubicacion else None
+        respuesta = cache.obtener_parecido(foto.dhash(), celda, radio=radio_hamming())
+        if respuesta is not None:
+            return JsonResponse(respuesta)
 
-        ruta_temp = None
         try:
-            # 1. Guardar imagen temporal
-            temp_dir = os.path.join(settings.MEDIA_ROOT, "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            ruta_temp = os.path.join(temp_dir, f"busqueda_{uuid.uuid4()}.jpg")
-            
-            with open(ruta_temp, "wb+") as destino:
-                for chunk in imagen.chunks():
-                    destino.write(chunk)
-
-            # 2. FILTRO GEOGRÁFICO
-            RADIO_BUSQUEDA_KM = 10.0 
-            candidatos = []
-            todos_sitios = SitioTuristico.objects.filter(activo=True)
-            
-            for sitio in todos_sitios:
-                dist = haversine(user_lat, user_lon, sitio.latitud, sitio.longitud)
-                if dist <= RADIO_BUSQUEDA_KM:
-                    candidatos.append((sitio, dist))
-            
-            candidatos.sort(key=lambda x: x[1])
-
-            if not candidatos:
-                return JsonResponse({
-                    "mensaje": "No se encontraron sitios registrados en tu ubicación (10km).",
-                    "tipo": "not_found"
-                })
-
-            # 3. ANÁLISIS IA
+            # 2. ANÁLISIS IA
+            # La foto pasa una sola vez por MobileNet y el índice ANN devuelve los sitios
+            # más parecidos de todo el país en milisegundos
             mejor_match = None
             mejor_score = 0.0
-            
-            for sitio, dist in candidatos:
-                if hasattr(sitio, 'imagen_referencia') and sitio.imagen_referencia:
-                    try:
-                        ruta_ref = sitio.imagen_referencia.path
-                        if os.path.exists(ruta_ref):
-                            score = calcular_similitud(ruta_temp, ruta_ref)
-                            if score > mejor_score:
-                                mejor_score = score
-                                mejor_match = sitio
-                    except Exception as e:
-                        logger.error(f"Error en IA: {e}")
-
-            # 4. LÓGICA DE RESPUESTA
-            UMBRAL_COINCIDENCIA = 0.70
-            if mejor_match and mejor_score >= UMBRAL_COINCIDENCIA:
+            ia_completada = False
+
+            try:
+                vector_usuario = obtener_vector_en_lote(foto.para_mobilenet())
+                if vector_usuario is not None:
+                    ids, scores = obtener_indice().buscar(vector_usuario, k=self.K_CANDIDATOS)
+                    sitios = SitioTuristico.objects.in_bulk([int(i) for i in ids])
+                    ids, scores = self._reordenar_por_cercania(ids, scores, sitios, user_lat, user_lon)
+                    if len(ids):
+                        mejor_score = float(scores[0])
+                        mejor_match = sitios[int(ids[0])]
+                    ia_completada = True
+            except (PoolSaturado, TiempoAgotado) as e:
+                # Sin IA respondemos con la sugerencia por cercanía
+                logger.warning(f"IA omitida: {e}")
+            except Exception as e:
+                logger.error(f"Error en IA: {e}")
+
+            # 3. LÓGICA DE RESPUESTA
+            if mejor_match and mejor_score >= self.UMBRAL_COINCIDENCIA:
                 # Lógica de logros (opcional, simplificada para evitar errores)
-                return JsonResponse({
+                respuesta = {
                     "tipo": "success",
                     "mensaje": f"¡Sitio identificado! Estás en {mejor_match.nombre}",
                     "id": mejor_match.id,
                     "score": round(float(mejor_score), 2)
-                })
-            
-            # Sugerencia por cercanía si la IA no está segura
-            sitio_mas_cercano = candidatos[0][0]
-            return JsonResponse({
-                "tipo": "suggestion",
-                "mensaje": f"¿Estás en {sitio_mas_cercano.nombre}?",
-                "id": sitio_mas_cercano.id
-            })
+                }
+            else:
+                # Sugerencia por cercanía si la IA no está segura
+                sitio_mas_cercano = self._sitio_mas_cercano(user_lat, user_lon) if con_ubicacion else None
+                if sitio_mas_cercano is None and con_ubicacion:
+                    respuesta = {
+                        "mensaje": "No se pudo identificar el sitio ni hay sitios registrados a menos de "
+                                   f"{self.RADIO_BUSQUEDA_KM:g} km de tu ubicación.",
+                        "tipo": "not_found"
+                    }
+                elif sitio_mas_cercano is None:
+                    # Sin GPS no hubo búsqueda por cercanía
+                    respuesta = {
+                        "mensaje": "No se pudo identificar el sitio. Activa la ubicación para recibir "
+                                   "sugerencias de sitios cercanos.",
+                        "tipo": "not_found"
+                    }
+                else:
+                    respuesta = {
+                        "tipo": "suggestion",
+                        "mensaje": f"¿Estás en {sitio_mas_cercano.nombre}?",
+                        "id": sitio_mas_cercano.id
+                    }
+
+            # Solo guardamos respuestas en las que la IA llegó a ejecutarse;
+            # una degradación por saturación no debe quedarse pegada en la caché
+            if ia_completada:
+                cache.guardar((foto.dhash(), celda), respuesta)
+            return JsonResponse(respuesta)
 
         except Exception as e:
             logger.error(f"Error: {e}")
             return JsonResponse({"error": str(e)}, status=500)
-        finally:
-            if ruta_temp and os.path.exists(ruta_temp):
-                os.remove(ruta_temp)
+
+    def _reordenar_por_cercania(self, ids, scores, sitios, user_lat, user_lon):
+        """
+        Ordena los candidatos por similitud + un bono que decae con la distancia al usuario.
+        Devuelve la similitud original (la que se compara con el umbral) en el nuevo orden.
+        """
+        presentes = np.array([int(i) in sitios for i in ids], dtype=bool)
+        ids, scores = ids[presentes], scores[presentes]
+        if user_lat is None or not len(ids):
+            return ids, scores
+
+        latitudes = np.array([float(sitios[int(i)].latitud) for i in ids])
+        longitudes = np.array([float(sitios[int(i)].longitud) for i in ids])
+        distancias = distancias_km(user_lat, user_lon, latitudes, longitudes)
+        prioridad = scores + self.PESO_CERCANIA * np.exp(-distancias / self.RADIO_BUSQUEDA_KM)
+        orden = np.argsort(-prioridad, kind="stable")
+        return ids[orden], scores[orden]
+
+    def _sitio_mas_cercano(self, user_lat, user_lon):
+        ids, _ = obtener_indice_espacial().en_radio(user_lat, user_lon, self.RADIO_BUSQUEDA_KM)
+        if not len(ids):
+            return None
+        return SitioTuristico.objects.filter(pk=int(ids[0])).first()